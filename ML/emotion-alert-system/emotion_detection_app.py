@@ -2,27 +2,48 @@
 import streamlit as st
 import cv2
 import numpy as np
-from deepface import DeepFace
 import time
-import threading
-from collections import deque
 import pandas as pd
 from datetime import datetime
 import json
 import os
 
+from emotion_log import EmotionHistory, EmotionWindow
+from face_analysis import EMOTION_LABELS, EmotionModel, FaceAnalyzer, FaceDetector
+from frame_sampling import AdaptiveSampler
+from video_pipeline import VideoPipeline
+
 # Configuration
 EMOTION_WINDOW_SIZE = 30  # Number of frames to consider for majority voting
 ALERT_DURATION_THRESHOLD = 10  # Seconds to trigger alert
 DISTRESS_EMOTIONS = ['angry', 'fear', 'sad']
+RENDER_FPS = 10  # UI refresh rate; capture and inference run at their own pace
+ANALYSIS_BUDGET = 0.5  # share of one CPU core emotion analysis may use; the analysis rate adapts to it
+MAX_ANALYSIS_FPS = 15  # analyses per second, at most
+IDLE_ANALYSIS_INTERVAL = 1.0  # seconds between analyses of an unchanging scene
+DISTRESS_ANALYSIS_INTERVAL = 0.1  # analyze at least this often while any face shows distress (the old 10 Hz)
+DETECT_EVERY = 10  # full face detection every N analyzed frames; faces are tracked in between
+MAX_FACES = 8  # faces analyzed per frame
+FACE_FORGET_AFTER = 5  # seconds out of view before a face's tracker and distress timer are dropped
+HISTORY_SIZE = 600  # detections per face kept at full rate; older ones are downsampled
+HISTORY_BUCKET = 1.0  # seconds per history row once downsampled
+EMOTION_LOG_DIR = os.getenv("EMOTION_LOG_DIR")  # set to keep the downsampled history on disk (.npz chunks)
+
+EMOTION_CODES = {emotion: code for code, emotion in enumerate(EMOTION_LABELS)}
+ALERT_LABEL = 'ALERT_TRIGGERED'
+ALERT_CODE = len(EMOTION_LABELS)  # first code after the emotions
 
 class EmotionTracker:
-    def __init__(self, alert_threshold=ALERT_DURATION_THRESHOLD):
-        self.emotion_buffer = deque(maxlen=EMOTION_WINDOW_SIZE)
+    def __init__(self, alert_threshold=ALERT_DURATION_THRESHOLD, label=None, log_dir=None):
+        self.label = label  # which face this tracker follows, e.g. "Face 2"
+        self.last_seen = time.time()
+        # Majority-voting window and history: fixed-size arrays, so memory stays flat however long detection runs
+        self.window = EmotionWindow(EMOTION_LABELS, EMOTION_WINDOW_SIZE)
+        self.history = EmotionHistory(EMOTION_LABELS, events=[ALERT_LABEL], capacity=HISTORY_SIZE,
+                                      bucket=HISTORY_BUCKET, log_dir=log_dir)
         self.distress_start_time = None
         self.current_emotion = 'neutral'
         self.alert_triggered = False
-        self.emotion_history = []
         self.alert_threshold = alert_threshold
 
     def update_alert_threshold(self, new_threshold):
@@ -31,20 +52,14 @@ class EmotionTracker:
 
     def add_emotion(self, emotion, confidence=0):
         """Add emotion to buffer and check for sustained distress"""
-        timestamp = datetime.now()
-        self.emotion_buffer.append(emotion)
-        self.emotion_history.append({
-            'timestamp': timestamp,
-            'emotion': emotion,
-            'confidence': confidence
-        })
-
-        # Get majority emotion from buffer
-        if len(self.emotion_buffer) >= 5:  # Minimum buffer size
-            emotion_counts = {}
-            for e in self.emotion_buffer:
-                emotion_counts[e] = emotion_counts.get(e, 0) + 1
-            self.current_emotion = max(emotion_counts, key=emotion_counts.get)
+        timestamp = time.time()
+        code = EMOTION_CODES[emotion]
+        self.window.add(code, confidence, timestamp)
+        self.history.append(code, confidence, timestamp)
+
+        # Get majority emotion from the window's running counts
+        if len(self.window) >= 5:  # Minimum buffer size
+            self.current_emotion = EMOTION_LABELS[self.window.majority()]
         else:
             self.current_emotion = emotion
 
@@ -62,17 +77,13 @@ class EmotionTracker:
 
     def trigger_alert(self):
         """Trigger alert for sustained distress"""
-        alert_msg = f"⚠️ ALERT: Sustained {self.current_emotion} emotion detected for {self.alert_threshold}+ seconds!"
+        who = f" ({self.label})" if self.label else ""
+        alert_msg = f"⚠️ ALERT{who}: Sustained {self.current_emotion} emotion detected for {self.alert_threshold}+ seconds!"
         st.error(alert_msg)
         st.balloons()  # Visual feedback
 
         # Log alert
-        self.emotion_history.append({
-            'timestamp': datetime.now(),
-            'emotion': 'ALERT_TRIGGERED',
-            'confidence': 100,
-            'details': f"Sustained {self.current_emotion} for {self.alert_threshold}s"
-        })
+        self.history.append(ALERT_CODE, 100)
 
     def get_distress_duration(self):
         """Get current distress duration"""
@@ -80,32 +91,42 @@ class EmotionTracker:
             return time.time() - self.distress_start_time
         return 0
 
-def analyze_emotion(frame):
-    """Analyze emotion from frame using DeepFace"""
+    def in_distress(self):
+        """Whether a distress timer is running or the last detection was a distress emotion"""
+        latest = self.window.latest()
+        return self.distress_start_time is not None or (
+            latest is not None and EMOTION_LABELS[latest] in DISTRESS_EMOTIONS)
+
+@st.cache_resource
+def load_emotion_models():
+    """Face detector and DeepFace emotion model, loaded once per server process"""
+    return FaceDetector(), EmotionModel()
+
+def analyze_emotion(frame, analyzer):
+    """Analyze the emotion of every face in the frame (empty list when there is none)"""
     try:
-        # Convert BGR to RGB for DeepFace
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-        # Analyze emotion
-        result = DeepFace.analyze(
-            rgb_frame, 
-            actions=['emotion'], 
-            enforce_detection=False,
-            silent=True
-        )
-
-        # Handle both single face and multiple faces cases
-        if isinstance(result, list):
-            result = result[0]
-
-        # Get dominant emotion
-        emotions = result['emotion']
-        dominant_emotion = max(emotions, key=emotions.get)
-        confidence = emotions[dominant_emotion]
-
-        return dominant_emotion, confidence, emotions
+        return analyzer.analyze(frame)
     except Exception as e:
-        return 'neutral', 0, {'neutral': 100}
+        return []
+
+def face_tracker(trackers, face_id, alert_threshold, log_root=None):
+    """The EmotionTracker of one face, created when the face first appears"""
+    if face_id not in trackers:
+        log_dir = os.path.join(log_root, f"face-{face_id}") if log_root else None
+        trackers[face_id] = EmotionTracker(alert_threshold, label=f"Face {face_id}", log_dir=log_dir)
+    return trackers[face_id]
+
+def flush_trackers(trackers):
+    """Write out what the trackers still hold in memory to their logs"""
+    for tracker in trackers.values():
+        tracker.history.flush()
+
+def primary_face(trackers):
+    """The face to show in the status panels: the one in distress the longest, else the first"""
+    if not trackers:
+        return None, None
+    face_id = max(trackers, key=lambda i: (trackers[i].get_distress_duration(), -i))
+    return face_id, trackers[face_id]
 
 def draw_emotion_overlay(frame, emotion, confidence, distress_duration, alert_threshold):
     """Draw emotion information on the frame"""
@@ -131,6 +152,27 @@ def draw_emotion_overlay(frame, emotion, confidence, distress_duration, alert_th
 
     return frame
 
+def draw_face_boxes(frame, faces, trackers, alert_threshold):
+    """Draw a labelled box around every analyzed face"""
+    for face in faces:
+        tracker = trackers.get(face.face_id)
+        if tracker is None:
+            continue
+        x, y, w, h = face.box
+        distress_duration = tracker.get_distress_duration()
+        if distress_duration >= alert_threshold:
+            color = (0, 0, 255)
+        elif distress_duration > 0:
+            color = (0, 165, 255)
+        else:
+            color = (0, 255, 0)
+        label = f"#{face.face_id} {tracker.current_emotion}"
+        if distress_duration > 0:
+            label += f" {distress_duration:.0f}s"
+        cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+        cv2.putText(frame, label, (x, max(15, y - 8)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+    return frame
+
 def main():
     st.set_page_config(
         page_title="Real-Time Emotion Detection & Alert System",
@@ -179,9 +221,9 @@ def main():
     - 🔧 **Configurable alert thresholds and settings**
     """)
 
-    # Initialize session state
-    if 'emotion_tracker' not in st.session_state:
-        st.session_state.emotion_tracker = EmotionTracker()
+    # Initialize session state: one EmotionTracker per face id
+    if 'emotion_trackers' not in st.session_state:
+        st.session_state.emotion_trackers = {}
 
     # Sidebar for configuration
     st.sidebar.header("⚙️ System Configuration")
@@ -201,9 +243,14 @@ def main():
 
     show_emotions_chart = st.sidebar.checkbox("Show Live Emotion Chart", True)
     show_overlay = st.sidebar.checkbox("Show Video Overlay", True)
+    pipelined = st.sidebar.checkbox(
+        "Pipelined Processing", True,
+        help="Capture, analyze and display in parallel threads instead of one after another"
+    )
 
-    # Update the tracker's alert threshold
-    st.session_state.emotion_tracker.update_alert_threshold(alert_threshold)
+    # Update the trackers' alert threshold
+    for tracker in st.session_state.emotion_trackers.values():
+        tracker.update_alert_threshold(alert_threshold)
 
     st.sidebar.markdown("---")
     st.sidebar.markdown("### 📋 Monitored Distress Emotions")
@@ -226,7 +273,8 @@ def main():
             reset_system = st.button("🔄 Reset System")
 
         if reset_system:
-            st.session_state.emotion_tracker = EmotionTracker(alert_threshold)
+            flush_trackers(st.session_state.emotion_trackers)
+            st.session_state.emotion_trackers = {}
             st.success("System reset successfully!")
 
         # Initialize detection state
@@ -250,6 +298,7 @@ def main():
 
             # Video placeholder
             video_placeholder = st.empty()
+            faces_placeholder = st.empty()
 
             # Camera initialization message
             with st.spinner("Initializing camera..."):
@@ -263,33 +312,60 @@ def main():
                     st.success("✅ Camera initialized successfully!")
 
             if st.session_state.detection_running and cap.isOpened():
-                # Detection loop
-                frame_count = 0
+                perf_placeholder = st.empty()
+                # Tracking state is per stream; the models are shared
+                analyzer = FaceAnalyzer(*load_emotion_models(), detect_every=DETECT_EVERY, max_faces=MAX_FACES)
+                # Analyses are spaced to the CPU budget, skipped while nothing moves, and kept frequent during distress
+                sampler = AdaptiveSampler(ANALYSIS_BUDGET, max_fps=MAX_ANALYSIS_FPS, idle_interval=IDLE_ANALYSIS_INTERVAL,
+                                          urgent_interval=DISTRESS_ANALYSIS_INTERVAL)
+                pipeline = VideoPipeline(cap, lambda frame: analyze_emotion(frame, analyzer),
+                                         threaded=pipelined, sampler=sampler).start()
+                trackers = st.session_state.emotion_trackers
+                faces, confidences = [], {}
+                log_root = os.path.join(EMOTION_LOG_DIR, datetime.now().strftime('%Y%m%d-%H%M%S')) if EMOTION_LOG_DIR else None
 
                 try:
                     while st.session_state.detection_running:
-                        ret, frame = cap.read()
-                        if not ret:
-                            st.error("Failed to capture frame from webcam.")
-                            break
-
-                        frame_count += 1
-
-                        # Analyze emotion every 3rd frame to save computation
-                        emotion, confidence, all_emotions = 'neutral', 0, {'neutral': 100}
-                        if frame_count % 3 == 0:
-                            emotion, confidence, all_emotions = analyze_emotion(frame)
-
-                            if confidence >= detection_threshold:
-                                st.session_state.emotion_tracker.add_emotion(emotion, confidence)
-
-                        # Get current status
-                        current_emotion = st.session_state.emotion_tracker.current_emotion
-                        distress_duration = st.session_state.emotion_tracker.get_distress_duration()
+                        loop_started = time.monotonic()
+                        latest, analyses = pipeline.poll()
+
+                        # Results are applied here, in the script thread, so alerts can use st.*
+                        for analysis in analyses:
+                            faces = analysis.result
+                            for face in faces:
+                                tracker = face_tracker(trackers, face.face_id, alert_threshold, log_root)
+                                tracker.last_seen = time.time()
+                                confidences[face.face_id] = face.confidence
+                                if face.confidence >= detection_threshold:
+                                    tracker.add_emotion(face.emotion, face.confidence)
+                        # People who left: drop their trackers and distress timers
+                        for face_id in [i for i, t in trackers.items() if time.time() - t.last_seen > FACE_FORGET_AFTER]:
+                            trackers.pop(face_id).history.flush()
+                            confidences.pop(face_id, None)
+                        # The sampler runs in the inference thread; the Event hands it the distress state
+                        if any(t.in_distress() for t in trackers.values()):
+                            sampler.urgent.set()
+                        else:
+                            sampler.urgent.clear()
 
-                        # Add overlay to frame if enabled
+                        if pipeline.error:
+                            st.error(pipeline.error)
+                            break
+                        if latest is None:
+                            time.sleep(0.01)
+                            continue
+                        _, frame, _ = latest
+
+                        # Get current status of the face most at risk
+                        face_id, tracker = primary_face(trackers)
+                        current_emotion = tracker.current_emotion if tracker else 'neutral'
+                        distress_duration = tracker.get_distress_duration() if tracker else 0
+                        confidence = confidences.get(face_id, 0)
+
+                        # Add overlay to frame if enabled (on a copy: inference may still be reading it)
                         if show_overlay:
-                            frame = draw_emotion_overlay(frame, current_emotion, confidence, distress_duration, alert_threshold)
+                            frame = draw_emotion_overlay(frame.copy(), current_emotion, confidence, distress_duration, alert_threshold)
+                            frame = draw_face_boxes(frame, faces, trackers, alert_threshold)
 
                         # Display frame
                         frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -310,22 +386,50 @@ def main():
 
                         if distress_duration > 0:
                             alert_status_placeholder.metric(
-                                "⚠️ Distress Duration", 
+                                f"⚠️ Distress Duration (Face {face_id})", 
                                 f"{distress_duration:.1f}s",
                                 delta="🚨 ALERT!" if distress_duration >= alert_threshold else "Monitoring..."
                             )
                         else:
                             alert_status_placeholder.metric("System Status", "✅ Normal", delta="OK")
 
-                        time.sleep(0.1)  # Control frame rate
+                        if len(trackers) > 1:
+                            faces_placeholder.markdown(" · ".join(
+                                f"{'🔴' if t.current_emotion in DISTRESS_EMOTIONS else '🟢'} **Face {i}**: {t.current_emotion.title()}"
+                                + (f" ({t.get_distress_duration():.0f}s)" if t.get_distress_duration() > 0 else "")
+                                for i, t in sorted(trackers.items())
+                            ))
+                        else:
+                            faces_placeholder.empty()
+
+                        pipeline.ui_fps.tick()
+                        stats = pipeline.stats()
+                        face_stats = analyzer.stats()
+                        sampling = sampler.stats()
+                        perf_placeholder.caption(
+                            f"Capture {stats['capture_fps']} fps · Inference {stats['inference_fps']} fps · "
+                            f"UI {stats['ui_fps']} fps · Latency {stats['latency_ms']} ms · "
+                            f"Dropped frames {stats['dropped_frames']} · "
+                            f"Face tracked in {face_stats['tracked_share']:.0%} of analyses · "
+                            f"Frames skipped {sampling['skipped_share']:.0%} (analysis {sampling['analysis_ms']} ms, "
+                            f"every ≥{sampling['interval_ms']} ms{', distress' if sampling['urgent'] else ''})"
+                        )
+
+                        # Render at the UI rate; capture and inference run at their own
+                        time.sleep(max(0.0, 1 / RENDER_FPS - (time.monotonic() - loop_started)))
 
                 except KeyboardInterrupt:
                     st.info("Detection stopped by user.")
                 except Exception as e:
                     st.error(f"Error during detection: {str(e)}")
                 finally:
+                    if 'pipeline' in locals():
+                        # Threads must stop reading before the camera is released
+                        pipeline.stop()
                     if 'cap' in locals():
                         cap.release()
+                    if 'trackers' in locals():
+                        flush_trackers(trackers)
 
         else:
             st.info("👆 Click 'Start Detection' to begin real-time emotion monitoring")
@@ -343,8 +447,11 @@ def main():
         # Current status display
         st.subheader("Current Status")
 
-        if st.session_state.emotion_tracker.emotion_buffer:
-            current_emotion = st.session_state.emotion_tracker.current_emotion
+        face_id, tracker = primary_face(st.session_state.emotion_trackers)
+        if tracker is not None and len(tracker.window):
+            if len(st.session_state.emotion_trackers) > 1:
+                st.caption(f"Face {face_id} of {len(st.session_state.emotion_trackers)} in view")
+            current_emotion = tracker.current_emotion
 
             # Emotion status indicator
             emotion_colors = {
@@ -360,7 +467,7 @@ def main():
             st.markdown(f"### {emotion_colors.get(current_emotion, '😐')} {current_emotion.title()}")
 
             # Alert status
-            distress_duration = st.session_state.emotion_tracker.get_distress_duration()
+            distress_duration = tracker.get_distress_duration()
             if distress_duration > 0:
                 progress = min(distress_duration / alert_threshold, 1.0)
                 st.progress(progress)
@@ -373,30 +480,28 @@ def main():
                 st.success("✅ No distress detected")
 
             # Emotion distribution chart
-            if show_emotions_chart and len(st.session_state.emotion_tracker.emotion_buffer) > 1:
+            if show_emotions_chart and len(tracker.window) > 1:
                 st.subheader("Recent Emotion Distribution")
 
-                emotions_list = list(st.session_state.emotion_tracker.emotion_buffer)
-                emotion_counts = {}
-                for e in emotions_list:
-                    emotion_counts[e] = emotion_counts.get(e, 0) + 1
-
                 chart_data = pd.DataFrame(
-                    list(emotion_counts.items()),
+                    list(tracker.window.distribution().items()),
                     columns=['Emotion', 'Count']
                 )
                 st.bar_chart(chart_data.set_index('Emotion'))
 
             # Emotion history
-            if len(st.session_state.emotion_tracker.emotion_history) > 0:
+            if len(tracker.history) > 0:
                 st.subheader("Recent Detection History")
 
                 # Show last 10 detections
-                recent_history = st.session_state.emotion_tracker.emotion_history[-10:]
-                history_df = pd.DataFrame(recent_history)
+                timestamps, emotions, confidences = tracker.history.recent(10)
+                history_df = pd.DataFrame({
+                    'timestamp': [datetime.fromtimestamp(t).strftime('%H:%M:%S') for t in timestamps],
+                    'emotion': emotions,
+                    'confidence': confidences
+                })
 
                 if not history_df.empty:
-                    history_df['timestamp'] = history_df['timestamp'].dt.strftime('%H:%M:%S')
                     st.dataframe(
                         history_df[['timestamp', 'emotion', 'confidence']], 
                         use_container_width=True,
@@ -414,6 +519,9 @@ def main():
             "Alert Threshold": f"{alert_threshold} seconds",
             "Detection Threshold": f"{detection_threshold:.1f}",
             "Buffer Size": f"{EMOTION_WINDOW_SIZE} frames",
+            "Emotion Log": EMOTION_LOG_DIR or "Off",
+            "Processing": "Pipelined" if pipelined else "Sequential",
+            "Analysis Budget": f"{ANALYSIS_BUDGET:.0%} of a CPU core",
             "Monitored Emotions": ", ".join(DISTRESS_EMOTIONS)
         }
 
@@ -0,0 +1,190 @@
+"""
+Fixed-size storage for the emotion stream of one face.
+
+A detection session can run for hours at several analyses per second, so
+nothing here grows with its length:
+  - EmotionWindow holds the last N detections (the majority-voting window)
+    in NumPy ring buffers, with the per-emotion counts updated as entries
+    come and go, so the majority is read off the counts instead of being
+    recounted on every detection,
+  - EmotionHistory keeps recent detections at full rate in a ring. When it
+    fills up, its older half is downsampled to one row per `bucket`
+    seconds (majority emotion, mean confidence; events such as alerts are
+    kept as they are). With a log directory set, the downsampled rows are
+    written out in chunks of column arrays (.npz); read_log() loads a log
+    back for analysis.
+"""
+
+import os
+import time
+
+import numpy as np
+
+
+class EmotionWindow:
+    """The last `size` detections as ring buffers of emotion codes, confidences and times."""
+
+    def __init__(self, labels, size):
+        self.labels = list(labels)
+        self.codes = np.zeros(size, dtype=np.int8)
+        self.confidences = np.zeros(size, dtype=np.float32)
+        self.times = np.zeros(size, dtype=np.float64)
+        self.counts = np.zeros(len(self.labels), dtype=np.int32)
+        self.next = 0
+        self.filled = 0
+
+    def __len__(self):
+        return self.filled
+
+    def add(self, code, confidence, timestamp):
+        if self.filled == len(self.codes):
+            self.counts[self.codes[self.next]] -= 1  # the oldest entry leaves the window
+        else:
+            self.filled += 1
+        self.codes[self.next] = code
+        self.confidences[self.next] = confidence
+        self.times[self.next] = timestamp
+        self.counts[code] += 1
+        self.next = (self.next + 1) % len(self.codes)
+
+    def latest(self):
+        """Code of the newest detection, or None while the window is empty."""
+        return int(self.codes[self.next - 1]) if self.filled else None
+
+    def majority(self):
+        """Code of the most frequent emotion in the window."""
+        return int(np.argmax(self.counts))
+
+    def distribution(self):
+        """{emotion: count} for the emotions present in the window."""
+        return {self.labels[code]: int(count) for code, count in enumerate(self.counts) if count}
+
+    def clear(self):
+        self.counts[:] = 0
+        self.next = self.filled = 0
+
+
+class EmotionHistory:
+    """
+    Recent detections (up to `capacity`) at full rate; older ones are
+    downsampled to `bucket`-second rows, which are written to `log_dir`
+    every `chunk_rows` rows if a directory is set, and dropped otherwise.
+    Codes are indexes into `labels` followed by `events`; events (alerts)
+    are never merged into buckets.
+    """
+
+    def __init__(self, labels, events=(), capacity=600, bucket=1.0, log_dir=None, chunk_rows=600):
+        self.labels = list(labels) + list(events)
+        self.event_code = len(labels)  # first event code
+        self.capacity = capacity
+        self.bucket = bucket
+        self.log_dir = log_dir
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.codes = np.zeros(capacity, dtype=np.int8)
+        self.confidences = np.zeros(capacity, dtype=np.float32)
+        self.start = 0
+        self.size = 0
+        self.unlogged = 0  # newest entries not yet downsampled into the log
+        # Downsampled rows waiting to be written
+        self.pending_times = np.zeros(chunk_rows, dtype=np.float64)
+        self.pending_codes = np.zeros(chunk_rows, dtype=np.int8)
+        self.pending_confidences = np.zeros(chunk_rows, dtype=np.float32)
+        self.pending = 0
+        self.chunks = 0
+        self.logged_rows = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, code, confidence, timestamp=None):
+        if self.size == self.capacity:
+            self._compact(self.capacity // 2)
+        i = (self.start + self.size) % self.capacity
+        self.times[i] = time.time() if timestamp is None else timestamp
+        self.codes[i] = code
+        self.confidences[i] = confidence
+        self.size += 1
+        self.unlogged += 1
+
+    def _ordered(self, count, newest=False):
+        """Indices of the oldest (or newest) `count` entries, in time order."""
+        offset = self.size - count if newest else 0
+        return (self.start + offset + np.arange(count)) % self.capacity
+
+    def recent(self, count):
+        """The newest `count` entries as (timestamps, labels, confidences), oldest first."""
+        idx = self._ordered(min(count, self.size), newest=True)
+        return self.times[idx], [self.labels[c] for c in self.codes[idx]], self.confidences[idx]
+
+    def downsample(self, times, codes, confidences):
+        """One row per bucket: first timestamp, majority code, mean confidence. Events pass through."""
+        events = codes >= self.event_code
+        t, c, f = times[~events], codes[~events], confidences[~events]
+        if len(t):
+            keys = np.floor(t / self.bucket)
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+            lengths = np.diff(np.append(starts, len(t)))
+            votes = np.add.reduceat(np.eye(self.event_code, dtype=np.int32)[c], starts, axis=0)
+            t, c, f = t[starts], votes.argmax(axis=1).astype(np.int8), np.add.reduceat(f, starts) / lengths
+        t = np.concatenate((t, times[events]))
+        order = np.argsort(t, kind="stable")
+        return (t[order], np.concatenate((c, codes[events]))[order],
+                np.concatenate((f, confidences[events])).astype(np.float32)[order])
+
+    def _compact(self, count):
+        """Drops the oldest `count` entries, logging those not logged yet."""
+        logged = self.size - self.unlogged
+        self._log(self._ordered(count)[logged:])
+        self.unlogged = min(self.unlogged, self.size - count)
+        self.start = (self.start + count) % self.capacity
+        self.size -= count
+
+    def _log(self, idx):
+        if not self.log_dir or not len(idx):
+            return
+        times, codes, confidences = self.downsample(self.times[idx], self.codes[idx], self.confidences[idx])
+        done = 0
+        while done < len(times):
+            n = min(len(times) - done, len(self.pending_times) - self.pending)
+            rows = slice(self.pending, self.pending + n)
+            self.pending_times[rows] = times[done:done + n]
+            self.pending_codes[rows] = codes[done:done + n]
+            self.pending_confidences[rows] = confidences[done:done + n]
+            self.pending += n
+            done += n
+            if self.pending == len(self.pending_times):
+                self._write()
+
+    def _write(self):
+        if not self.pending:
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.chunks += 1
+        rows = slice(0, self.pending)
+        np.savez(os.path.join(self.log_dir, f"chunk-{self.chunks:06d}.npz"),
+                 timestamp=self.pending_times[rows], emotion=self.pending_codes[rows],
+                 confidence=self.pending_confidences[rows], labels=np.array(self.labels))
+        self.logged_rows += self.pending
+        self.pending = 0
+
+    def flush(self):
+        """Logs everything not logged yet (e.g. when detection stops); recent entries stay readable."""
+        if not self.log_dir:
+            return
+        self._log(self._ordered(self.unlogged, newest=True))
+        self.unlogged = 0
+        self._write()
+
+
+def read_log(log_dir):
+    """A whole log as {"timestamp", "emotion" (labels), "confidence"} arrays, in time order."""
+    columns = {"timestamp": [], "emotion": [], "confidence": []}
+    for name in sorted(os.listdir(log_dir)):
+        if not name.endswith(".npz"):
+            continue
+        with np.load(os.path.join(log_dir, name)) as chunk:
+            labels = chunk["labels"]
+            columns["timestamp"].append(chunk["timestamp"])
+            columns["emotion"].append(labels[chunk["emotion"]])
+            columns["confidence"].append(chunk["confidence"])
+    return {name: np.concatenate(parts) if parts else np.array([]) for name, parts in columns.items()}
@@ -0,0 +1,276 @@
+"""
+Face detection, tracking and emotion classification for the webcam feed.
+
+DeepFace.analyze() on the whole frame detects the face, aligns and resizes
+it at full resolution, and rebuilds its preprocessing on every call. Here
+the pieces are split up so most frames only pay for the classifier:
+  - FaceDetector (OpenCV's Haar cascade, the detector DeepFace uses by
+    default) runs on a small grayscale copy of the frame, and only every
+    `detect_every` frames or when tracking is lost,
+  - in between, TemplateTracker follows each face box by template matching
+    in a window around its last position,
+  - EmotionModel (DeepFace's emotion network, loaded once) classifies the
+    48x48 grayscale face crops.
+
+Every face in view gets an id that follows it from frame to frame (matched
+by box overlap at each detection), and all face crops of a frame are
+classified in a single batch, so a second or third face adds far less
+than another full call would. The detector and model are shared (see
+load_emotion_models in the app); a FaceAnalyzer holds the tracking state
+of one video stream.
+"""
+
+import threading
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+from deepface import DeepFace
+
+# Output order of DeepFace's emotion model
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']
+EMOTION_INPUT_SIZE = 48
+
+
+class EmotionModel:
+    """DeepFace's facial-expression network, called directly on face crops."""
+
+    def __init__(self):
+        try:
+            client = DeepFace.build_model(task="facial_attribute", model_name="Emotion")
+        except TypeError:  # deepface < 0.0.93
+            client = DeepFace.build_model("Emotion")
+        # Older releases return the Keras model itself, newer ones wrap it
+        self.model = getattr(client, "model", client)
+
+    @staticmethod
+    def preprocess(face_bgr):
+        gray = cv2.cvtColor(face_bgr, cv2.COLOR_BGR2GRAY)
+        gray = cv2.resize(gray, (EMOTION_INPUT_SIZE, EMOTION_INPUT_SIZE), interpolation=cv2.INTER_AREA)
+        return gray.astype(np.float32) / 255.0
+
+    def classify(self, faces):
+        """Emotion percentages (as DeepFace reports them) for each BGR face crop."""
+        batch = np.stack([self.preprocess(face) for face in faces])[..., np.newaxis]
+        # Calling the model skips Keras predict()'s per-call setup, which
+        # costs more than the network itself for a few 48x48 images
+        scores = np.asarray(self.model(batch, training=False))
+        scores = 100 * scores / scores.sum(axis=1, keepdims=True)
+        return [dict(zip(EMOTION_LABELS, row.tolist())) for row in scores]
+
+
+class FaceDetector:
+    """Haar cascade face detection on a downscaled grayscale frame."""
+
+    def __init__(self, min_size=40):
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        self.min_size = min_size
+        self.lock = threading.Lock()  # one cascade is shared by all sessions
+
+    def detect(self, gray):
+        """Face boxes (x, y, w, h) in `gray` coordinates, largest first."""
+        with self.lock:
+            boxes = self.cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                                  minSize=(self.min_size, self.min_size))
+        return sorted((tuple(int(v) for v in box) for box in boxes), key=lambda b: b[2] * b[3], reverse=True)
+
+
+class TemplateTracker:
+    """Follows one face box by matching its last appearance near its last position."""
+
+    def __init__(self, search=0.5, min_score=0.55):
+        self.search = search  # search margin, as a fraction of the box size
+        self.min_score = min_score  # below this normalized correlation the face is lost
+        self.box = None
+        self.template = None
+
+    def init(self, gray, box):
+        x, y, w, h = box
+        self.box = box
+        self.template = gray[y:y + h, x:x + w].copy()
+
+    def update(self, gray):
+        """The box in the new frame, or None when the face was lost."""
+        if self.box is None:
+            return None
+        x, y, w, h = self.box
+        mx, my = int(w * self.search), int(h * self.search)
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(gray.shape[1], x + w + mx), min(gray.shape[0], y + h + my)
+        window = gray[y0:y1, x0:x1]
+        if window.shape[0] < h or window.shape[1] < w:
+            self.box = None
+            return None
+        scores = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (dx, dy) = cv2.minMaxLoc(scores)
+        if score < self.min_score:
+            self.box = None
+            return None
+        # Refresh the template so slow changes (pose, light) are followed
+        self.init(gray, (x0 + dx, y0 + dy, w, h))
+        return self.box
+
+
+def iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes."""
+    x0, y0 = max(a[0], b[0]), max(a[1], b[1])
+    x1, y1 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    inter = max(0, x1 - x0) * max(0, y1 - y0)
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+
+def associate(known, boxes, min_iou=0.3, max_shift=0.75):
+    """
+    Matches detected `boxes` to `known` {face id: last box}: greedily by
+    IoU, then, for faces that moved too far to overlap, by the nearest
+    centre within `max_shift` box sizes. Returns {box index: face id}.
+    """
+    pairs = sorted(((iou(box, boxes[i]), face_id, i) for face_id, box in known.items() for i in range(len(boxes))),
+                   reverse=True)
+    matches, used = {}, set()
+    for score, face_id, i in pairs:
+        if score < min_iou:
+            break
+        if i not in matches and face_id not in used:
+            matches[i] = face_id
+            used.add(face_id)
+
+    def centre(box):
+        return box[0] + box[2] / 2, box[1] + box[3] / 2
+
+    for i, box in enumerate(boxes):
+        if i in matches:
+            continue
+        cx, cy = centre(box)
+        candidates = []
+        for face_id, last in known.items():
+            if face_id in used:
+                continue
+            lx, ly = centre(last)
+            distance = ((cx - lx) ** 2 + (cy - ly) ** 2) ** 0.5
+            if distance <= max_shift * max(box[2], box[3]):
+                candidates.append((distance, face_id))
+        if candidates:
+            face_id = min(candidates)[1]
+            matches[i] = face_id
+            used.add(face_id)
+    return matches
+
+
+@dataclass
+class FaceTrack:
+    face_id: int
+    box: tuple  # last known box, in work-image coordinates
+    tracker: TemplateTracker = field(default_factory=TemplateTracker)
+    missed: int = 0  # consecutive detections that did not find the face
+
+
+@dataclass
+class FaceResult:
+    face_id: int
+    box: tuple  # (x, y, w, h) in frame coordinates
+    emotion: str
+    confidence: float
+    emotions: dict
+
+
+class FaceAnalyzer:
+    """
+    Emotions of every face in a stream of frames. Each face keeps an id
+    for as long as it stays in view. Full detection runs every
+    `detect_every` frames or when tracking loses a face; otherwise the
+    tracked crops are classified. All faces of a frame go through the
+    emotion model as one batch.
+    """
+
+    def __init__(self, detector, model, detect_every=10, work_width=320, max_faces=8, max_missed=2):
+        self.detector = detector
+        self.model = model
+        self.detect_every = detect_every
+        self.work_width = work_width  # detection and tracking run at this width
+        self.max_faces = max_faces
+        self.max_missed = max_missed  # detections a face may be missing before its id is dropped
+        self.tracks = {}
+        self.next_id = 1
+        self.since_detection = 0
+        self.counts = {"frames": 0, "detections": 0, "tracked": 0, "lost": 0, "no_face": 0, "faces": 0}
+
+    def _work_gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        scale = min(1.0, self.work_width / gray.shape[1])
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return gray, scale
+
+    def _detect(self, gray):
+        self.counts["detections"] += 1
+        self.since_detection = 0
+        boxes = self.detector.detect(gray)[:self.max_faces]
+        matches = associate({face_id: track.box for face_id, track in self.tracks.items()}, boxes)
+        located = {}
+        for i, box in enumerate(boxes):
+            face_id = matches.get(i)
+            if face_id is None:
+                face_id, self.next_id = self.next_id, self.next_id + 1
+                self.tracks[face_id] = FaceTrack(face_id, box)
+            track = self.tracks[face_id]
+            track.box, track.missed = box, 0
+            track.tracker.init(gray, box)
+            located[face_id] = box
+        for face_id, track in list(self.tracks.items()):
+            if face_id not in located:
+                track.tracker.box = None
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    del self.tracks[face_id]
+        if not boxes:
+            self.counts["no_face"] += 1
+        return located
+
+    def locate(self, frame):
+        """[(face id, box in frame coordinates)] for the faces in view."""
+        self.counts["frames"] += 1
+        gray, scale = self._work_gray(frame)
+        following = [track for track in self.tracks.values() if track.tracker.box is not None]
+        located = None
+        if following and self.since_detection < self.detect_every:
+            located = {}
+            for track in following:
+                box = track.tracker.update(gray)
+                if box is None:
+                    self.counts["lost"] += 1
+                    located = None  # someone moved away: look for everyone again
+                    break
+                track.box = located[track.face_id] = box
+        if located is None:
+            located = self._detect(gray)
+        else:
+            self.counts["tracked"] += 1
+        self.since_detection += 1
+        height, width = frame.shape[:2]
+        faces = []
+        for face_id, (x, y, w, h) in sorted(located.items()):
+            x0, y0 = max(0, int(round(x / scale))), max(0, int(round(y / scale)))
+            x1, y1 = min(width, int(round((x + w) / scale))), min(height, int(round((y + h) / scale)))
+            if x1 > x0 and y1 > y0:
+                faces.append((face_id, (x0, y0, x1 - x0, y1 - y0)))
+        return faces
+
+    def analyze(self, frame):
+        """A FaceResult for every face in view (empty when there is none)."""
+        faces = self.locate(frame)
+        if not faces:
+            return []
+        self.counts["faces"] += len(faces)
+        crops = [frame[y:y + h, x:x + w] for _, (x, y, w, h) in faces]
+        results = []
+        for (face_id, box), emotions in zip(faces, self.model.classify(crops)):
+            dominant = max(emotions, key=emotions.get)
+            results.append(FaceResult(face_id, box, dominant, emotions[dominant], emotions))
+        return results
+
+    def stats(self):
+        counts = dict(self.counts)
+        frames = counts["frames"]
+        return {**counts, "tracked_share": round(counts["tracked"] / frames, 2) if frames else 0.0}
@@ -0,0 +1,88 @@
+"""
+Decides which camera frames are worth an emotion analysis.
+
+Analyzing a fixed share of frames spends the same CPU on an empty or
+motionless scene as on a busy one, and is too much for slow machines and
+too little for fast ones. AdaptiveSampler instead:
+  - spaces analyses so that inference uses about `budget` of the time
+    (e.g. 0.5 = half of one core), from a running average of how long
+    recent analyses took, but never more often than `max_fps`,
+  - skips frames that hardly differ from the last analyzed one, compared
+    on a tiny grayscale thumbnail, while still analyzing an unchanging
+    scene every `idle_interval` seconds,
+  - while `urgent` is set (a distress timer is running, set from the
+    render loop), analyzes at least every `urgent_interval` seconds,
+    whatever the budget or motion, so alerts do not fire later.
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+
+class AdaptiveSampler:
+    """Motion-gated, CPU-budgeted choice of frames to analyze; safe to use from one inference thread."""
+
+    def __init__(self, budget=0.5, max_fps=15, idle_interval=1.0, urgent_interval=0.1,
+                 motion_threshold=0.005, thumb_size=(64, 48), pixel_threshold=12):
+        self.budget = budget
+        self.min_interval = 1.0 / max_fps
+        self.idle_interval = idle_interval
+        self.urgent_interval = urgent_interval
+        self.motion_threshold = motion_threshold  # share of thumbnail pixels that must change
+        self.thumb_size = thumb_size
+        self.pixel_threshold = pixel_threshold  # gray levels a thumbnail pixel must change by
+        self.urgent = threading.Event()
+        self.duration = 0.0  # running average of analysis time, in seconds
+        self.last = None  # when the last analyzed frame was picked
+        self.reference = None  # thumbnail of the last analyzed frame
+        self.counts = {"analyzed": 0, "static": 0, "throttled": 0}
+
+    def thumbnail(self, frame):
+        small = cv2.resize(frame, self.thumb_size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def motion(self, thumb):
+        """Share of thumbnail pixels that changed since the last analyzed frame."""
+        changed = cv2.absdiff(thumb, self.reference) > self.pixel_threshold
+        return float(np.count_nonzero(changed)) / changed.size
+
+    def interval(self):
+        """Seconds between analyses that keeps inference within the budget."""
+        return max(self.min_interval, self.duration / self.budget)
+
+    def should_analyze(self, frame, now=None):
+        now = time.monotonic() if now is None else now
+        gap = self.interval()
+        if self.urgent.is_set():
+            gap = heartbeat = min(gap, self.urgent_interval)
+        else:
+            heartbeat = max(gap, self.idle_interval)
+        elapsed = float("inf") if self.last is None else now - self.last
+        if elapsed < gap:
+            self.counts["throttled"] += 1
+            return False
+        thumb = self.thumbnail(frame)
+        if elapsed < heartbeat and self.reference is not None and self.motion(thumb) < self.motion_threshold:
+            self.counts["static"] += 1
+            return False
+        self.reference, self.last = thumb, now
+        self.counts["analyzed"] += 1
+        return True
+
+    def record(self, duration):
+        """Feeds back how long an analysis took."""
+        self.duration = duration if not self.duration else 0.8 * self.duration + 0.2 * duration
+
+    def stats(self):
+        counts = dict(self.counts)
+        seen = sum(counts.values())
+        return {
+            **counts,
+            "interval_ms": round(1000 * self.interval()),
+            "analysis_ms": round(1000 * self.duration),
+            "skipped_share": round((counts["static"] + counts["throttled"]) / seen, 2) if seen else 0.0,
+            "urgent": self.urgent.is_set(),
+        }
@@ -0,0 +1,54 @@
+import numpy as np
+
+from emotion_log import EmotionHistory, EmotionWindow, read_log
+
+LABELS = ["happy", "sad", "fear"]
+ALERT = len(LABELS)  # first event code
+
+
+def test_window_counts_follow_the_ring():
+    window = EmotionWindow(LABELS, size=3)
+    assert window.latest() is None
+    for code in (0, 0, 1, 2, 2):
+        window.add(code, 0.9, 0.0)
+    assert len(window) == 3
+    assert window.distribution() == {"sad": 1, "fear": 2}
+    assert window.majority() == 2 and window.latest() == 2
+    window.clear()
+    assert len(window) == 0 and window.distribution() == {}
+
+
+def test_downsample_keeps_events_apart():
+    history = EmotionHistory(LABELS, events=["alert"], bucket=1.0)
+    times = np.array([0.0, 0.3, 0.6, 0.7, 1.2])
+    codes = np.array([1, 1, 0, ALERT, 2], dtype=np.int8)
+    confidences = np.array([0.2, 0.4, 0.6, 1.0, 0.5], dtype=np.float32)
+    t, c, f = history.downsample(times, codes, confidences)
+    assert t.tolist() == [0.0, 0.7, 1.2]
+    assert c.tolist() == [1, ALERT, 2]
+    assert np.allclose(f, [0.4, 1.0, 0.5])
+
+
+def test_history_is_bounded_and_logs_everything_once(tmp_path):
+    history = EmotionHistory(LABELS, events=["alert"], capacity=10, bucket=1.0, log_dir=str(tmp_path), chunk_rows=4)
+    for i in range(25):
+        history.append(i % 3, 0.5, timestamp=float(i))
+    assert len(history) <= 10
+    times, labels, _ = history.recent(3)
+    assert times.tolist() == [22.0, 23.0, 24.0] and labels == ["sad", "fear", "happy"]
+
+    history.flush()
+    assert len(history.recent(3)[0]) == 3  # flushing keeps recent entries readable
+    history.flush()
+    log = read_log(str(tmp_path))
+    assert log["timestamp"].tolist() == [float(i) for i in range(25)]
+    assert log["emotion"].tolist() == [LABELS[i % 3] for i in range(25)]
+
+
+def test_without_a_log_dir_old_entries_are_dropped(tmp_path):
+    history = EmotionHistory(LABELS, capacity=4)
+    for i in range(9):
+        history.append(0, 1.0, timestamp=float(i))
+    history.flush()
+    assert len(history) <= 4
+    assert history.logged_rows == 0
@@ -0,0 +1,43 @@
+import numpy as np
+
+from frame_sampling import AdaptiveSampler
+
+STILL = np.zeros((240, 320, 3), dtype=np.uint8)
+MOVED = np.full((240, 320, 3), 200, dtype=np.uint8)
+
+
+def test_first_frame_is_analyzed_and_max_fps_throttles():
+    sampler = AdaptiveSampler(max_fps=10)
+    assert sampler.should_analyze(STILL, now=0.0)
+    assert not sampler.should_analyze(MOVED, now=0.05)
+    assert sampler.should_analyze(MOVED, now=0.1)
+    assert sampler.counts == {"analyzed": 2, "static": 0, "throttled": 1}
+
+
+def test_still_scene_is_only_analyzed_every_idle_interval():
+    sampler = AdaptiveSampler(max_fps=10, idle_interval=1.0)
+    assert sampler.should_analyze(STILL, now=0.0)
+    assert not sampler.should_analyze(STILL, now=0.5)
+    assert sampler.should_analyze(STILL, now=1.0)
+    assert sampler.counts["static"] == 1
+
+
+def test_slow_analysis_spreads_out_frames_within_budget():
+    sampler = AdaptiveSampler(budget=0.5, max_fps=15)
+    sampler.record(0.2)
+    assert sampler.interval() == 0.4
+    sampler.record(0.7)
+    assert round(sampler.duration, 3) == 0.3
+    assert sampler.should_analyze(STILL, now=0.0)
+    assert not sampler.should_analyze(MOVED, now=0.5)
+    assert sampler.should_analyze(MOVED, now=0.7)
+
+
+def test_urgent_overrides_budget_and_motion():
+    sampler = AdaptiveSampler(budget=0.5, urgent_interval=0.1)
+    sampler.record(1.0)
+    sampler.urgent.set()
+    assert sampler.should_analyze(STILL, now=0.0)
+    assert sampler.should_analyze(STILL, now=0.1)
+    stats = sampler.stats()
+    assert stats["urgent"] and stats["analyzed"] == 2 and stats["interval_ms"] == 2000
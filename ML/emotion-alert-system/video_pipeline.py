@@ -0,0 +1,202 @@
+"""
+Capture, inference and rendering of the webcam feed, each at its own pace.
+
+In pipelined mode a capture thread reads the camera as fast as it delivers
+and keeps only the newest frame (older ones are dropped, never queued), an
+inference thread analyzes whichever frame is newest when it becomes free,
+and the Streamlit script thread renders the newest frame and the newest
+results at the UI rate. A slow analysis therefore no longer stalls capture
+or leaves the camera buffer full of stale frames: a result is at most one
+inference old, however long rendering or capture take.
+
+Sequential mode runs the same steps one after another in the script
+thread, as the original loop did, for machines where the threads do not
+help.
+
+In both modes a sampler (see frame_sampling.AdaptiveSampler) picks which
+frames are analyzed; without one every frame the inference step gets to
+is analyzed.
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+
+class RateMeter:
+    """Events per second over the last `window` seconds."""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self.times = deque()
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.times.append(now)
+        while self.times[0] < now - self.window:
+            self.times.popleft()
+
+    def rate(self, now=None):
+        now = time.monotonic() if now is None else now
+        times = [t for t in list(self.times) if t >= now - self.window]
+        if len(times) < 2:
+            return 0.0
+        # Counted up to now, so the rate falls off when events stop coming
+        return (len(times) - 1) / max(now - times[0], 1e-6)
+
+
+class LatestFrame:
+    """One-slot frame buffer: put() replaces the frame, so take() always gets the newest."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.captured = 0.0
+        self.taken = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, frame):
+        with self.cond:
+            if self.seq > self.taken:
+                self.dropped += 1  # replaced before inference got to it
+            self.seq += 1
+            self.frame = frame
+            self.captured = time.monotonic()
+            self.cond.notify_all()
+
+    def take(self, timeout):
+        """Waits for a frame newer than the last one taken; returns (seq, frame, captured) or None."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > self.taken or self.closed, timeout):
+                return None
+            if self.seq <= self.taken:
+                return None
+            self.taken = self.seq
+            return self.seq, self.frame, self.captured
+
+    def peek(self):
+        """The newest frame without consuming it, or None before the first one."""
+        with self.cond:
+            if self.frame is None:
+                return None
+            return self.seq, self.frame, self.captured
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+@dataclass
+class Analysis:
+    seq: int  # frame the result belongs to
+    captured: float
+    finished: float
+    result: object  # whatever analyze() returned
+
+    @property
+    def latency(self):
+        return self.finished - self.captured
+
+
+class VideoPipeline:
+    """
+    Feeds frames from `capture` (a cv2.VideoCapture) to `analyze(frame)`.
+    The render loop calls poll() for the newest frame and the analyses
+    finished since its last call. `sampler` (should_analyze(frame) and
+    record(seconds)) decides which frames are analyzed.
+    """
+
+    def __init__(self, capture, analyze, threaded=True, sampler=None):
+        self.capture = capture
+        self.analyze = analyze
+        self.threaded = threaded
+        self.sampler = sampler
+        self.frames = LatestFrame()
+        self.results = deque(maxlen=256)  # finished analyses not yet drained by poll()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.error = None
+        self.capture_fps = RateMeter()
+        self.inference_fps = RateMeter()
+        self.ui_fps = RateMeter()
+        self.latencies = deque(maxlen=30)
+
+    def start(self):
+        if self.threaded:
+            self.threads = [
+                threading.Thread(target=self._capture_loop, name="emotion-capture", daemon=True),
+                threading.Thread(target=self._inference_loop, name="emotion-inference", daemon=True),
+            ]
+            for thread in self.threads:
+                thread.start()
+        return self
+
+    def stop(self):
+        """Stops the threads; the capture may be released once this returns."""
+        self.stopping.set()
+        self.frames.close()
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+    def _read(self):
+        ret, frame = self.capture.read()
+        if not ret:
+            self.error = "Failed to capture frame from webcam."
+            return None
+        self.frames.put(frame)
+        self.capture_fps.tick()
+        return frame
+
+    def _run_analysis(self, seq, frame, captured):
+        if self.sampler is not None and not self.sampler.should_analyze(frame):
+            return
+        started = time.monotonic()
+        result = self.analyze(frame)
+        analysis = Analysis(seq, captured, time.monotonic(), result)
+        if self.sampler is not None:
+            self.sampler.record(analysis.finished - started)
+        self.results.append(analysis)
+        self.inference_fps.tick(analysis.finished)
+        self.latencies.append(analysis.latency)
+
+    def _capture_loop(self):
+        try:
+            while not self.stopping.is_set():
+                if self._read() is None:
+                    break
+        finally:
+            self.frames.close()
+
+    def _inference_loop(self):
+        while not self.stopping.is_set():
+            item = self.frames.take(timeout=0.5)
+            if item is None:
+                if self.frames.closed:
+                    break
+                continue
+            self._run_analysis(*item)
+
+    def poll(self):
+        """Returns (newest frame item or None, analyses finished since the last poll)."""
+        if not self.threaded and self.error is None:
+            if self._read() is not None:
+                self._run_analysis(*self.frames.take(timeout=0))
+        analyses = []
+        while self.results:
+            analyses.append(self.results.popleft())
+        return self.frames.peek(), analyses
+
+    def stats(self):
+        now = time.monotonic()
+        latencies = list(self.latencies)
+        return {
+            "capture_fps": round(self.capture_fps.rate(now), 1),
+            "inference_fps": round(self.inference_fps.rate(now), 1),
+            "ui_fps": round(self.ui_fps.rate(now), 1),
+            "latency_ms": round(1000 * sum(latencies) / len(latencies)) if latencies else 0,
+            "dropped_frames": self.frames.dropped,
+        }
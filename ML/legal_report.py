@@ -1,143 +1,380 @@
-import io
+import json
 import os
+import threading
 from datetime import datetime
 
-from flask import Flask, request, send_file, abort
+from flask import Flask, request, send_file, abort, url_for
 from flask_cors import CORS
 from PIL import Image
-import pytesseract
 import google.generativeai as genai
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+from google.api_core import exceptions as api_exceptions
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from ocr_engine import OcrEngine, OcrOptions
+from report_jobs import DONE, FAILED, QUEUED, JobQueue, QueueFull
+from report_pdf import report_to_pdf
+from report_templates import TemplateRegistry
+from statute_matcher import StatuteMatcher
+from transcript_stitch import stitch
 
 # -----------------------------------------------------------------------------
 # Configuration
 # -----------------------------------------------------------------------------
 OCR_LANG   = "eng"            
-KEYWORDS   = {
-    "abuse":        "Section 506 IPC – Criminal intimidation",
-    "harassment":   "Section 354A IPC – Sexual harassment",
-    "cheating":     "Section 420 IPC – Cheating",
-    "defamation":   "Section 499 IPC – Defamation",
-    "threat":       "Section 503 IPC – Criminal threat",
-    "insult":       "Section 509 IPC – Word/gesture insulting woman’s modesty",
-}
+# Phrases, synonyms and the IPC/BNS/POSH sections they point to (reloaded on change)
+LEXICON_PATH = os.getenv("REPORT_LEXICON", os.path.join(os.path.dirname(os.path.abspath(__file__)), "statute_lexicon.txt"))
 PDF_TITLE  = "Legal_Report.pdf"
-
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel("gemini-1.5-flash")
+# Flask answers 413 as soon as a request body passes MAX_UPLOAD_BYTES; file
+# parts are spooled to a temporary file by Werkzeug, not held in memory.
+MAX_UPLOAD_BYTES = int(os.getenv("REPORT_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+# A report may be built from a series of scrolled screenshots
+MAX_SCREENSHOTS = int(os.getenv("REPORT_MAX_SCREENSHOTS", "20"))
+# Screenshots whose header declares more pixels are refused undecoded
+MAX_IMAGE_PIXELS = int(os.getenv("REPORT_MAX_IMAGE_PIXELS", "40000000"))
+# Gemini-compatible REST endpoint to use instead of the public API
+# (the shared gateway in aiml/gemini_gateway or the fake server in loadtest/)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+MODEL_NAME = "gemini-1.5-flash"
+# Reference documents, one <name>.txt per report type
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference_templates")
+DEFAULT_TEMPLATE = "legal_notice"
+TEMPLATE_TITLES = {
+    "legal_notice":   "legal notice/report",
+    "posh_complaint": "POSH complaint to the Internal Committee",
+}
+# Gemini cached content needs a pinned model version and a minimum prefix size
+CACHE_MODEL_NAME = os.getenv("REPORT_CACHE_MODEL", "models/gemini-1.5-flash-002")
+CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "3600"))
+CACHE_MIN_TOKENS = int(os.getenv("REPORT_CACHE_MIN_TOKENS", "32768"))
+# Report jobs: queued in SQLite under JOB_DIR and run by a pool of workers
+JOB_DIR        = os.getenv("REPORT_JOB_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "report_jobs"))
+JOB_WORKERS    = int(os.getenv("REPORT_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("REPORT_MAX_QUEUED", "100"))
+JOB_TTL        = int(os.getenv("REPORT_JOB_TTL", "3600"))
+JOB_RETRY_AFTER = os.getenv("REPORT_RETRY_AFTER", "5")
+# How long /generate_report waits for its job before answering 202
+SYNC_TIMEOUT   = float(os.getenv("REPORT_SYNC_TIMEOUT", "120"))
+# OCR runs in a process pool (default: one process per core, 0 = in-thread)
+# and results are cached on disk by image hash
+OCR_WORKERS    = int(os.environ["OCR_WORKERS"]) if os.getenv("OCR_WORKERS") else None
+OCR_CACHE_DIR  = os.getenv("OCR_CACHE_DIR", os.path.join(JOB_DIR, "ocr_cache"))
+OCR_BINARIZE   = os.getenv("OCR_BINARIZE", "1") == "1"
 
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
 CORS(app)
 
 # -----------------------------------------------------------------------------
 # Utility helpers
 # -----------------------------------------------------------------------------
-def run_ocr(image_bytes: bytes) -> str:
+def open_evidence(image_file) -> Image.Image:
+    # Image.open only parses the header, so a decompression bomb is caught
+    # here before its pixels are decoded.
+    img = Image.open(image_file)
+    if img.width * img.height > MAX_IMAGE_PIXELS:
+        raise RequestEntityTooLarge(
+            f"Image is {img.width}x{img.height} pixels, above the {MAX_IMAGE_PIXELS} pixel limit."
+        )
+    return img
+
+ocr_engine = OcrEngine(
+    OcrOptions(lang=OCR_LANG, max_pixels=MAX_IMAGE_PIXELS, binarize=OCR_BINARIZE),
+    workers=OCR_WORKERS, cache_dir=OCR_CACHE_DIR,
+)
+
+def ocr_failure_text(e: Exception) -> str:
+    if "tesseract" in str(e).lower():
+        # If Tesseract is not installed, return a placeholder text
+        return "TEXT_EXTRACTED_FROM_IMAGE: [OCR not available - Tesseract not installed]"
+    else:
+        # For other OCR errors, return a generic message
+        return "TEXT_EXTRACTED_FROM_IMAGE: [OCR processing failed]"
+
+# Totals for /stats (OCR stage timings are kept by ocr_engine)
+report_stats = {"reports": 0, "pages": 0, "stitched_series": 0, "stitched_screenshots": 0,
+                "stitched_lines_in": 0, "stitched_lines_out": 0, "overlap_lines": 0}
+_report_stats_lock = threading.Lock()
+
+def count_report_stats(**amounts) -> None:
+    with _report_stats_lock:
+        for name, amount in amounts.items():
+            report_stats[name] += amount
+
+def run_ocr_many(image_files) -> list:
+    """OCRs several screenshots in parallel; texts come back in input order."""
+    futures = [ocr_engine.submit(f.read()) for f in image_files]
+    texts = []
+    for future in futures:
+        try:
+            result = future.result()
+        except Exception as e:
+            texts.append(ocr_failure_text(e))
+            continue
+        texts.append(result.text)
+    return texts
+
+def run_ocr(image_file) -> str:
+    return run_ocr_many([image_file])[0]
+
+def evidence_text(paths: list) -> str:
+    """OCR text of the evidence; overlapping scrolled screenshots are stitched into one transcript."""
+    files = [open(path, "rb") for path in paths]
     try:
-        img = Image.open(io.BytesIO(image_bytes))
-        return pytesseract.image_to_string(img, lang=OCR_LANG).strip()
-    except Exception as e:
-        if "tesseract" in str(e).lower():
-            # If Tesseract is not installed, return a placeholder text
-            return "TEXT_EXTRACTED_FROM_IMAGE: [OCR not available - Tesseract not installed]"
-        else:
-            # For other OCR errors, return a generic message
-            return "TEXT_EXTRACTED_FROM_IMAGE: [OCR processing failed]"
+        texts = run_ocr_many(files)
+    finally:
+        for f in files:
+            f.close()
+    if len(texts) == 1:
+        return texts[0]
+    stitched = stitch(texts)
+    count_report_stats(stitched_series=1, stitched_screenshots=len(texts), stitched_lines_in=stitched.lines_in,
+                       stitched_lines_out=stitched.lines_out, overlap_lines=sum(stitched.overlaps))
+    return stitched.text
 
 def extract_sender(ocr_text: str) -> str:
     first_line = next((ln for ln in ocr_text.splitlines() if ln.strip()), "")
     return first_line.split(":")[0].strip()
 
 def fake_nlp(ocr_text: str) -> dict:
-    lc_text = ocr_text.lower()
-    matched = [kw for kw in KEYWORDS if kw in lc_text]
+    found = statutes.summarize(ocr_text)
     return {
         "person_name": extract_sender(ocr_text) or "Unknown",
-        "keywords": matched,
+        "keywords": found["keywords"],
+        "keyword_counts": found["keyword_counts"],
+        "matches": found["matches"],  # character offsets into ocr_text
         "entities": [],  # Expand if needed
-        "sentiment": "negative" if matched else "neutral",
-        "possible_laws": [KEYWORDS[k] for k in matched],
+        "sentiment": "negative" if found["keywords"] else "neutral",
+        "possible_laws": found["possible_laws"],
     }
 
-def ask_gemini(ocr_text: str, nlp: dict, sample_txt: str) -> str:
-    prompt = f"""
-You are a legal assistant. Your task is to draft a formal legal notice/report in plain English, 
-strictly following the structure, style, and language of the following reference legal notice.
+def build_instruction(title: str, reference_txt: str) -> str:
+    """The static part of the prompt: identical for every report of one type."""
+    return f"""
+You are a legal assistant. Your task is to draft a formal {title} in plain English, 
+strictly following the structure, style, and language of the following reference document.
 
-Inputs to guide your drafting:
 - REFERENCE_DOCUMENT (the format/sample): 
 \"\"\"
-{sample_txt}
+{reference_txt}
 \"\"\"
 
+Instructions:
+- Match all major headings, signature blocks, overall flow of the reference document.
+- Adapt names, addresses, facts, and case details from the EVIDENCE_TEXT and NLP_STRUCTURED given with each request.
+- Do NOT use bold/italics; keep standard legal formatting.
+- Do NOT use any Hindi or bilingual content.
+-Just use the reference document for reference dont include any personal detail from it.
+"""
+
+def ask_gemini(ocr_text: str, nlp: dict, template) -> str:
+    # Match offsets are of no use to the model; keep them out of the prompt
+    prompt_nlp = {k: v for k, v in nlp.items() if k != "matches"}
+    prompt = f"""
+Inputs to guide your drafting:
 - EVIDENCE_TEXT: 
 \"\"\"
 {ocr_text}
 \"\"\"
 
 - NLP_STRUCTURED: 
-{nlp}
+{prompt_nlp}
 
-Instructions:
-- Match all major headings, signature blocks, overall flow of the reference document.
-- Adapt names, addresses, facts, and case details from the latest evidence and NLP output above.
-- Do NOT use bold/italics; keep standard legal formatting.
-- Do NOT use any Hindi or bilingual content.
--Just use the sample_text for reference dont include any personal detail from it.
-
-Produce a ready-to-send, professional English legal notice.
+Produce a ready-to-send, professional English {template.title}.
 """
-    response = model.generate_content(prompt)
+    try:
+        response = template.model.generate_content(prompt)
+    except (api_exceptions.NotFound, api_exceptions.PermissionDenied):
+        if template.cached is None:
+            raise
+        # The cached prefix expired or was deleted upstream: send it inline.
+        template = templates.uncache(template.name)
+        response = template.model.generate_content(prompt)
     return response.text.strip()
 
-def report_to_pdf(report_text: str) -> bytes:
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-    y = height - 40
-    for line in report_text.splitlines():
-        if not line:
-            y -= 18
-            continue
-        c.drawString(40, y, line)
-        y -= 14
-        if y < 40:
-            c.showPage()
-            y = height - 40
-    c.save()
-    buffer.seek(0)
-    return buffer.read()
+templates = TemplateRegistry(
+    TEMPLATE_DIR, build_instruction, MODEL_NAME,
+    cache_model_name=CACHE_MODEL_NAME, cache_ttl=CACHE_TTL,
+    cache_min_tokens=CACHE_MIN_TOKENS, titles=TEMPLATE_TITLES,
+)
 
 # -----------------------------------------------------------------------------
-# Main endpoint
+# Report jobs
 # -----------------------------------------------------------------------------
-@app.route("/generate_report", methods=["POST"])
-def generate_report():
+def run_report_job(job: dict, progress) -> None:
+    """The report pipeline, run by a queue worker."""
+    params = json.loads(job["params"])
+    template = templates.get(params["template"])
+
+    progress("ocr", 0.1)
+    ocr_text = evidence_text(jobs.input_paths(job["id"]))
+    progress("nlp", 0.3)
+    nlp_out = fake_nlp(ocr_text)
+    progress("drafting", 0.4)
+    gemini_report = ask_gemini(ocr_text, nlp_out, template)
+    progress("rendering", 0.9)
+    # Rendered straight into the file that send_file streams to the client
+    pages = report_to_pdf(gemini_report, jobs.result_path(job["id"]))
+    count_report_stats(reports=1, pages=pages)
+
+# -----------------------------------------------------------------------------
+# Service setup
+# -----------------------------------------------------------------------------
+# Set up by init_services(), not on import: the OCR pool's spawned processes
+# re-import the main script (as __mp_main__), and must not configure Gemini,
+# open and recover the job queue or build the lexicon again.
+statutes = None
+jobs = None
+_services_lock = threading.Lock()
+
+def configure_gemini() -> None:
+    if GEMINI_API_ENDPOINT:
+        # Reports are batch work: the gateway serves chat and image analysis first.
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"), transport="rest",
+                        client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+                        default_metadata=[("x-gateway-priority", "batch")])
+    else:
+        genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+
+def init_services() -> None:
+    """Configures Gemini and builds the statute matcher and job queue, once per process."""
+    global statutes, jobs
+    with _services_lock:
+        if jobs is not None:
+            return
+        configure_gemini()
+        statutes = StatuteMatcher(LEXICON_PATH)
+        jobs = JobQueue(JOB_DIR, run_report_job, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED, ttl=JOB_TTL)
+
+@app.before_request
+def start_workers():
+    # Started lazily so only the serving process (not the reloader) runs them
+    init_services()
+    jobs.start()
+
+def submit_report():
+    """Validates the upload and queues a job for it. Returns (job, created)."""
     if "evidence" not in request.files:
         abort(400, "Upload the screenshot as form-data field 'evidence'.")
+    # Repeat the field for a series of screenshots, in scroll order
+    evidence = request.files.getlist("evidence")
+    if len(evidence) > MAX_SCREENSHOTS:
+        abort(400, f"Upload at most {MAX_SCREENSHOTS} screenshots per report.")
 
-    img_bytes = request.files["evidence"].read()
-    ocr_text  = run_ocr(img_bytes)
-    nlp_out   = fake_nlp(ocr_text)
-    
-    # Always read the latest sample.txt
+    # Templates are re-read only when their file changes
+    template_name = request.form.get("template", DEFAULT_TEMPLATE)
     try:
-        with open("sample.txt", "r", encoding="utf-8") as f:
-            sample_txt = f.read()
-    except Exception as e:
-        abort(500, f"Could not read legal format (sample.txt): {e}")
+        templates.get(template_name)
+    except KeyError:
+        abort(400, f"Unknown template '{template_name}'. Available: {', '.join(templates.names())}")
+    except OSError as e:
+        abort(500, f"Could not read reference template '{template_name}': {e}")
 
-    gemini_report = ask_gemini(ocr_text, nlp_out, sample_txt)
-    pdf_bytes = report_to_pdf(gemini_report)
+    # Refuse decompression bombs now rather than in the worker. Unreadable
+    # images still get a report, as before.
+    for screenshot in evidence:
+        try:
+            open_evidence(screenshot.stream)
+        except RequestEntityTooLarge:
+            raise
+        except Exception:
+            pass
+
+    def save_input(job_id):
+        for index, screenshot in enumerate(evidence):
+            screenshot.stream.seek(0)
+            screenshot.save(jobs.input_path(job_id, index))
+
+    params = {"template": template_name, "screenshots": len(evidence)}
+    try:
+        return jobs.submit(save_input, json.dumps(params),
+                           idempotency_key=request.headers.get("Idempotency-Key"))
+    except QueueFull as e:
+        abort(429, f"Too many reports in progress ({e}), please retry shortly.")
 
+def job_body(job: dict) -> dict:
+    params = json.loads(job["params"])
+    body = {
+        "job_id":   job["id"],
+        "status":   job["status"],
+        "stage":    job["stage"],
+        "progress": job["progress"],
+        "template": params.get("template"),
+        "screenshots": params.get("screenshots", 1),
+        "status_url": url_for("report_status", job_id=job["id"]),
+    }
+    if job["status"] == QUEUED:
+        body["queue_position"] = jobs.position(job)
+    if job["status"] == DONE:
+        body["result_url"] = url_for("report_pdf", job_id=job["id"])
+    if job["status"] == FAILED:
+        body["error"] = job["error"]
+    return body
+
+def send_report(job: dict):
     return send_file(
-        io.BytesIO(pdf_bytes),
+        jobs.result_path(job["id"]),
         mimetype="application/pdf",
         as_attachment=True,
         download_name=PDF_TITLE,
     )
 
+@app.errorhandler(429)
+def too_many_reports(e):
+    return {"error": e.description}, 429, {"Retry-After": JOB_RETRY_AFTER}
+
+# -----------------------------------------------------------------------------
+# Main endpoints
+# -----------------------------------------------------------------------------
+@app.route("/reports", methods=["POST"])
+def create_report():
+    """Queues a report and returns at once; poll status_url, then fetch result_url."""
+    job, created = submit_report()
+    body = job_body(job)
+    return body, 202 if created else 200, {"Location": body["status_url"]}
+
+@app.route("/reports/<job_id>", methods=["GET"])
+def report_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return {"error": "Unknown or expired report job."}, 404
+    return job_body(job)
+
+@app.route("/reports/<job_id>/pdf", methods=["GET"])
+def report_pdf(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return {"error": "Unknown or expired report job."}, 404
+    if job["status"] != DONE:
+        return {**job_body(job), "error": "Report is not ready yet."}, 409, {"Retry-After": JOB_RETRY_AFTER}
+    return send_report(job)
+
+@app.route("/generate_report", methods=["POST"])
+def generate_report():
+    """
+    One-shot variant of POST /reports for existing clients: waits for the job
+    and returns the PDF, or 202 with the job if it takes too long.
+    """
+    job, _ = submit_report()
+    job = jobs.wait(job["id"], SYNC_TIMEOUT)
+    if job is None:
+        return {"error": "Report job expired or was removed before it finished."}, 404
+    if job["status"] == DONE:
+        return send_report(job)
+    if job["status"] == FAILED:
+        abort(500, f"Report generation failed: {job['error']}")
+    body = job_body(job)
+    return body, 202, {"Location": body["status_url"]}
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    with _report_stats_lock:
+        reports = dict(report_stats)
+    return {"jobs": jobs.stats(), "ocr": ocr_engine.stats(), "lexicon": statutes.info(), "reports": reports}
+
+@app.route("/templates", methods=["GET"])
+def list_templates():
+    return {"default": DEFAULT_TEMPLATE, "templates": templates.info()}
+
 # -----------------------------------------------------------------------------
 # Run
 # -----------------------------------------------------------------------------
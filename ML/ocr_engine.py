@@ -0,0 +1,243 @@
+"""
+OCR for evidence screenshots.
+
+Tesseract is CPU-bound and single-threaded per image. OcrEngine therefore
+runs it in a process pool sized to the machine: reports being generated at
+the same time, or the screenshots of one report, are OCR'd on separate cores.
+
+Before Tesseract sees an image it is prepared for recognition:
+  - converted to grayscale, with dark-mode screenshots inverted so the text
+    is dark on light,
+  - scaled so the text has a size Tesseract reads well: very wide captures
+    are shrunk, and small ones enlarged,
+  - binarized with a local mean threshold (NumPy integral image). This copes
+    with chat bubbles of different colours, where a single global threshold
+    would lose text.
+
+Results are cached by a hash of the image bytes and the OCR options, in
+memory and (optionally) on disk, so the same evidence is only OCR'd once.
+"""
+
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+STAGES = ("decode_ms", "preprocess_ms", "tesseract_ms")
+
+
+class OcrError(RuntimeError):
+    """Tesseract failed. pytesseract's own errors cannot be pickled back from a pool process."""
+
+
+@dataclass(frozen=True)
+class OcrOptions:
+    lang: str = "eng"
+    max_pixels: int = 40_000_000
+    min_width: int = 1000  # narrower images are enlarged (up to 2x)
+    max_width: int = 2000  # wider images are shrunk
+    binarize: bool = True
+    window: int = 31  # side of the local threshold window, in pixels
+    offset: int = 10  # how much darker than its surroundings a pixel must be to count as ink
+
+
+@dataclass
+class OcrResult:
+    text: str
+    timings: dict = field(default_factory=dict)
+    cached: bool = False
+
+
+def adaptive_binarize(gray: np.ndarray, window: int = 31, offset: int = 10) -> np.ndarray:
+    """Marks a pixel as ink when it is `offset` darker than the mean of its window."""
+    pad = window // 2
+    padded = np.pad(gray, pad, mode="edge").astype(np.int64)
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1), dtype=np.int64)
+    integral[1:, 1:] = padded.cumsum(0).cumsum(1)
+    h, w = gray.shape
+    sums = (integral[window:window + h, window:window + w] - integral[:h, window:window + w]
+            - integral[window:window + h, :w] + integral[:h, :w])
+    ink = gray.astype(np.int64) * (window * window) < sums - offset * window * window
+    return np.where(ink, 0, 255).astype(np.uint8)
+
+
+def prepare_for_ocr(img: Image.Image, options: OcrOptions) -> Image.Image:
+    gray = img.convert("L")
+    width, height = gray.size
+    if width > options.max_width:
+        scale = options.max_width / width
+    elif width < options.min_width:
+        scale = min(2.0, options.min_width / width)
+    else:
+        scale = 1.0
+    if scale != 1.0:
+        gray = gray.resize((round(width * scale), round(height * scale)), Image.Resampling.LANCZOS)
+
+    pixels = np.asarray(gray)
+    if np.median(pixels) < 128:
+        # Dark mode: light text on a dark background.
+        pixels = 255 - pixels
+    if options.binarize:
+        pixels = adaptive_binarize(pixels, options.window, options.offset)
+    return Image.fromarray(pixels)
+
+
+def ocr_image(data: bytes, options: OcrOptions) -> tuple:
+    """Decodes, prepares and OCRs one image. Runs in a pool process; returns (text, timings)."""
+    timings = {}
+    started = time.perf_counter()
+    img = Image.open(io.BytesIO(data))
+    if img.width * img.height > options.max_pixels:
+        raise ValueError(f"Image is {img.width}x{img.height} pixels, above the {options.max_pixels} pixel limit.")
+    img.load()
+    timings["decode_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    prepared = prepare_for_ocr(img, options)
+    timings["preprocess_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    try:
+        text = pytesseract.image_to_string(prepared, lang=options.lang).strip()
+    except (pytesseract.TesseractNotFoundError, pytesseract.TesseractError) as e:
+        raise OcrError(str(e)) from None
+    timings["tesseract_ms"] = (time.perf_counter() - started) * 1000
+    return text, {k: round(v, 1) for k, v in timings.items()}
+
+
+class OcrEngine:
+    """
+    `workers` processes run OCR (default: one per core; 0 runs it in the
+    calling thread). Results are cached in memory (`memory_entries`) and,
+    when `cache_dir` is set, on disk as one text file per image hash.
+    """
+
+    def __init__(self, options: OcrOptions = OcrOptions(), workers=None, cache_dir=None, memory_entries=256):
+        self.options = options
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = None
+        self.counts = {"images": 0, "cache_hits": 0, "errors": 0}
+        self.totals = {stage: 0.0 for stage in STAGES}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.pool is None:
+                # spawn: the pool is started from threaded code, where fork is unsafe.
+                # Workers only need this module (ocr_image); spawn also re-imports the
+                # main script, which therefore leaves service setup to an explicit call
+                # (see legal_report.init_services).
+                self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+            return self.pool
+
+    def cache_key(self, data: bytes) -> str:
+        return hashlib.sha256(repr(self.options).encode() + b"\0" + data).hexdigest()
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def _cached(self, key: str):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+        if self.cache_dir:
+            try:
+                with open(self._cache_path(key), "r", encoding="utf-8") as f:
+                    text = f.read()
+            except OSError:
+                return None
+            self._remember(key, text)
+            return text
+        return None
+
+    def _remember(self, key: str, text: str) -> None:
+        with self.lock:
+            self.memory[key] = text
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def _store(self, key: str, text: str) -> None:
+        self._remember(key, text)
+        if self.cache_dir:
+            path = self._cache_path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+
+    def submit(self, data: bytes) -> Future:
+        """Starts OCR of one image; the future resolves to an OcrResult."""
+        result = Future()
+        key = self.cache_key(data)
+        text = self._cached(key)
+        if text is not None:
+            with self.lock:
+                self.counts["images"] += 1
+                self.counts["cache_hits"] += 1
+            result.set_result(OcrResult(text, cached=True))
+            return result
+
+        def finish(job):
+            try:
+                text, timings = job.result()
+            except BaseException as e:
+                with self.lock:
+                    self.counts["errors"] += 1
+                    if isinstance(e, BrokenProcessPool) and self.pool is job_pool:
+                        # A worker died (e.g. killed for memory); start afresh next time.
+                        self.pool = None
+                result.set_exception(e)
+                return
+            self._store(key, text)
+            with self.lock:
+                self.counts["images"] += 1
+                for stage, ms in timings.items():
+                    self.totals[stage] += ms
+            result.set_result(OcrResult(text, timings))
+
+        job_pool = None
+        if self.workers == 0:
+            job = Future()
+            try:
+                job.set_result(ocr_image(data, self.options))
+            except Exception as e:
+                job.set_exception(e)
+            finish(job)
+        else:
+            job_pool = self._pool()
+            job_pool.submit(ocr_image, data, self.options).add_done_callback(finish)
+        return result
+
+    def ocr(self, data: bytes) -> OcrResult:
+        return self.submit(data).result()
+
+    def ocr_many(self, images: list) -> list:
+        """OCRs several images in parallel; results are in input order."""
+        return [future.result() for future in [self.submit(data) for data in images]]
+
+    def stats(self) -> dict:
+        with self.lock:
+            computed = self.counts["images"] - self.counts["cache_hits"]
+            return {
+                **self.counts,
+                "workers": self.workers,
+                "avg_ms": {stage.removesuffix("_ms"): round(total / computed, 1) if computed else 0.0
+                           for stage, total in self.totals.items()},
+            }
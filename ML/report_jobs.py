@@ -0,0 +1,308 @@
+"""
+Persistent job queue for report generation.
+
+POST /reports stores the evidence files in the job directory, records a queued job
+in SQLite and returns at once. A small pool of worker threads claims queued
+jobs one at a time and runs the pipeline, which reports its progress as it
+moves through its stages. Clients poll the job and download the PDF when it
+is done.
+
+  - Jobs survive restarts. A claimed job is leased to the process running
+    it, which renews the lease while the job runs; a job whose lease ran
+    out (its process stopped or hung) is queued again.
+  - Submitting again with the same idempotency key returns the existing job
+    instead of generating a second report.
+  - Finished jobs (and their files) are deleted `ttl` seconds after they
+    complete.
+
+Several processes can share one database: a job is claimed inside an
+IMMEDIATE transaction and records its owner, and a worker only finishes
+(and cleans up) a job it still owns, so a job is never run by two live
+processes at once.
+"""
+
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, directory, run_job, workers=2, max_queued=100, ttl=3600, poll_interval=2.0, lease=60.0):
+        """`run_job(job, progress)` produces the result file; progress(stage, fraction) updates the job."""
+        self.directory = directory
+        self.run_job = run_job
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.lease = lease  # seconds a claimed job stays ours without a renewal
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.running = set()  # ids of the jobs this process is running
+        self.running_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.db_path = os.path.join(directory, "jobs.db")
+        self.wakeup = threading.Condition()
+        self.started = False
+        self.start_lock = threading.Lock()
+        self.local = threading.local()
+
+        db = self._db()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, idempotency_key TEXT UNIQUE, status TEXT NOT NULL,"
+            " stage TEXT, progress REAL NOT NULL DEFAULT 0, params TEXT NOT NULL DEFAULT '{}',"
+            " error TEXT, created REAL NOT NULL, updated REAL NOT NULL, expires REAL,"
+            " owner TEXT, lease_expires REAL)"
+        )
+        columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+        for column in ("owner TEXT", "lease_expires REAL"):
+            if column.split()[0] not in columns:  # databases created before leases
+                try:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+                except sqlite3.OperationalError as e:
+                    if "duplicate column" not in str(e):  # another process added it first
+                        raise
+        db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created)")
+        db.commit()
+
+    def _db(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite handles the locking between them.
+        if not hasattr(self.local, "db"):
+            self.local.db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self.local.db.row_factory = sqlite3.Row
+        return self.local.db
+
+    # -- paths -----------------------------------------------------------------
+
+    def job_dir(self, job_id: str) -> str:
+        return os.path.join(self.directory, job_id)
+
+    def input_path(self, job_id: str, index: int = 0) -> str:
+        return os.path.join(self.job_dir(job_id), f"evidence-{index:03d}")
+
+    def input_paths(self, job_id: str) -> list:
+        directory = self.job_dir(job_id)
+        return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.startswith("evidence-"))
+
+    def result_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir(job_id), "report.pdf")
+
+    # -- HTTP side -------------------------------------------------------------
+
+    def submit(self, save_input, params: str, idempotency_key=None):
+        """
+        Creates a job and returns (job, created). `save_input(job_id)` writes
+        the evidence files (see input_path). With a known idempotency key the
+        existing job is returned and nothing is saved.
+        """
+        db = self._db()
+        if idempotency_key:
+            existing = self._by_key(idempotency_key)
+            if existing is not None:
+                return existing, False
+        queued = db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        if queued >= self.max_queued:
+            raise QueueFull(f"{queued} reports are already waiting")
+
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.job_dir(job_id))
+        save_input(job_id)
+        now = time.time()
+        stale = None
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            if idempotency_key:
+                # An expired job keeps its key until _expire() gets to it;
+                # it must not block a new job with the same key.
+                stale = db.execute(
+                    "SELECT id FROM jobs WHERE idempotency_key = ? AND expires IS NOT NULL AND expires <= ?",
+                    (idempotency_key, now),
+                ).fetchone()
+                if stale is not None:
+                    db.execute("DELETE FROM jobs WHERE id = ?", (stale["id"],))
+            db.execute(
+                "INSERT INTO jobs (id, idempotency_key, status, stage, params, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, idempotency_key, QUEUED, QUEUED, params, now, now),
+            )
+            db.execute("COMMIT")
+        except sqlite3.IntegrityError:
+            # Lost a race with a concurrent submit using the same key.
+            db.execute("ROLLBACK")
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+            return self._by_key(idempotency_key), False
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if stale is not None:
+            shutil.rmtree(self.job_dir(stale["id"]), ignore_errors=True)
+        with self.wakeup:
+            self.wakeup.notify()
+        return self.get(job_id), True
+
+    def _by_key(self, key):
+        row = self._db().execute(
+            "SELECT * FROM jobs WHERE idempotency_key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def get(self, job_id: str):
+        row = self._db().execute(
+            "SELECT * FROM jobs WHERE id = ? AND (expires IS NULL OR expires > ?)", (job_id, time.time())
+        ).fetchone()
+        return dict(row) if row else None
+
+    def position(self, job: dict) -> int:
+        """Number of queued jobs ahead of `job`."""
+        return self._db().execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ? AND created < ?", (QUEUED, job["created"])
+        ).fetchone()[0]
+
+    def wait(self, job_id: str, timeout: float):
+        """
+        Blocks until the job finishes or `timeout` passes; returns the job
+        (still queued or running after a timeout), or None if it is gone.
+        """
+        deadline = time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in (DONE, FAILED) or time.time() >= deadline:
+                return job
+            time.sleep(0.2)
+
+    def stats(self) -> dict:
+        rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"workers": self.workers, **{status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)},
+                **{status: count for status, count in rows}}
+
+    # -- workers ---------------------------------------------------------------
+
+    def start(self) -> None:
+        """Starts the worker threads once per process."""
+        with self.start_lock:
+            if self.started:
+                return
+            self.started = True
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"report-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._renew_leases, name="report-leases", daemon=True).start()
+
+    def _claim(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            # Jobs whose process died or hung are picked up again. Rows from
+            # before leases count from their last update.
+            db.execute(
+                "UPDATE jobs SET status = ?, stage = ?, progress = 0, owner = NULL, lease_expires = NULL,"
+                " updated = ? WHERE status = ? AND COALESCE(lease_expires, updated + ?) < ?",
+                (QUEUED, QUEUED, now, RUNNING, self.lease, now),
+            )
+            row = db.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is not None:
+                db.execute("UPDATE jobs SET status = ?, stage = ?, owner = ?, lease_expires = ?, updated = ?"
+                           " WHERE id = ?", (RUNNING, "starting", self.owner, now + self.lease, now, row["id"]))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        with self.running_lock:
+            self.running.add(row["id"])
+        return dict(row)
+
+    def _update(self, job_id: str, **fields) -> bool:
+        """Updates a job this process owns; False if the job is no longer ours."""
+        fields["updated"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        cursor = self._db().execute(f"UPDATE jobs SET {columns} WHERE id = ? AND owner = ?",
+                                    (*fields.values(), job_id, self.owner))
+        return cursor.rowcount > 0
+
+    def _renew_leases(self) -> None:
+        while True:
+            time.sleep(self.lease / 3)
+            with self.running_lock:
+                running = list(self.running)
+            for job_id in running:
+                try:
+                    self._update(job_id, lease_expires=time.time() + self.lease)
+                except sqlite3.Error as e:
+                    print(f"Could not renew the lease of report job {job_id}: {e}")
+
+    def _work(self) -> None:
+        backoff = self.poll_interval
+        while True:
+            try:
+                self._expire()
+                job = self._claim()
+            except sqlite3.Error as e:
+                # e.g. "database is locked" while other processes hold it
+                print(f"Report queue unavailable, retrying in {backoff:.0f}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+            backoff = self.poll_interval
+            if job is None:
+                with self.wakeup:
+                    self.wakeup.wait(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _run(self, job: dict) -> None:
+        def progress(stage, fraction, job_id=job["id"]):
+            try:
+                self._update(job_id, stage=stage, progress=round(fraction, 2))
+            except sqlite3.Error as e:  # progress is informational; the job goes on
+                print(f"Could not update the progress of report job {job_id}: {e}")
+
+        try:
+            self.run_job(job, progress)
+        except Exception as e:
+            print(f"Report job {job['id']} failed: {e}")
+            fields = dict(status=FAILED, stage=FAILED, error=str(e))
+        else:
+            fields = dict(status=DONE, stage=DONE, progress=1.0)
+        with self.running_lock:
+            self.running.discard(job["id"])
+        try:
+            owned = self._update(job["id"], **fields, owner=None, lease_expires=None,
+                                 expires=time.time() + self.ttl)
+        except sqlite3.Error as e:
+            # Left running: the lease runs out and the job is queued again.
+            print(f"Could not record the result of report job {job['id']}: {e}")
+            return
+        if not owned:
+            # Our lease ran out and another worker has the job now: its files are not ours to touch.
+            print(f"Report job {job['id']} was taken over by another worker; result discarded")
+            return
+        # The evidence is only needed while the job runs.
+        for path in self.input_paths(job["id"]):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _expire(self) -> None:
+        expired = self._db().execute(
+            "SELECT id FROM jobs WHERE expires IS NOT NULL AND expires <= ?", (time.time(),)
+        ).fetchall()
+        for (job_id,) in expired:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+            self._db().execute("DELETE FROM jobs WHERE id = ?", (job_id,))
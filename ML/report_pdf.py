@@ -0,0 +1,169 @@
+"""
+PDF rendering of generated reports.
+
+Gemini returns plain text with arbitrarily long lines. layout() turns it
+into positioned lines on A4 pages:
+  - every source line starts a new line (address blocks, signatures and
+    numbered clauses keep their shape) and is wrapped at word boundaries
+    to the text width; words wider than a line (URLs) are broken,
+  - wrapped list items ("1)", "a.", "-") hang under their text, and leading
+    spaces are kept as indentation,
+  - blank lines become paragraph gaps,
+  - headings (upper-case lines, "# ..." or "**...**") are set in bold and
+    never left alone at the bottom of a page.
+
+Text widths come from per-font tables of word and character widths, filled
+as words are first seen, so each distinct word is measured once per font.
+
+report_to_pdf() draws the layout straight into a file (or any binary
+stream), so the PDF is never held as a separate bytes copy.
+"""
+
+import re
+from dataclasses import dataclass
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfgen import canvas
+
+MARGIN = 40
+BLANK_LINE = 8  # extra space for a blank line between paragraphs
+
+
+@dataclass(frozen=True)
+class Style:
+    font: str
+    size: float
+    leading: float  # baseline-to-baseline distance
+    space_before: float = 0.0
+
+
+BODY = Style("Helvetica", 11, 14)
+HEADING = Style("Helvetica-Bold", 12, 16, space_before=4)
+
+LIST_MARKER = re.compile(r"(?:[-*•]|\(?(?:\d{1,3}|[a-zA-Z]|[ivxIVX]{1,4})[.)])\s+")
+MARKDOWN_HEADING = re.compile(r"\s*#{1,6}\s+(.*)")
+
+# font -> {word: width at size 1000}; cleared if it grows past _MAX_WORDS
+_word_widths = {}
+_char_widths = {}
+_MAX_WORDS = 100_000
+
+
+def word_width(word: str, style: Style) -> float:
+    table = _word_widths.get(style.font)
+    if table is None:
+        table = _word_widths[style.font] = {}
+    width = table.get(word)
+    if width is None:
+        if len(table) >= _MAX_WORDS:
+            table.clear()
+        width = table[word] = pdfmetrics.stringWidth(word, style.font, 1000)
+    return width * style.size / 1000
+
+
+def char_width(char: str, style: Style) -> float:
+    table = _char_widths.get(style.font)
+    if table is None:
+        table = _char_widths[style.font] = {}
+    width = table.get(char)
+    if width is None:
+        width = table[char] = pdfmetrics.stringWidth(char, style.font, 1000)
+    return width * style.size / 1000
+
+
+def _fit(word: str, style: Style, width: float) -> str:
+    """The longest prefix of `word` (at least one character) that fits `width`."""
+    used = 0.0
+    for i, char in enumerate(word):
+        used += char_width(char, style)
+        if used > width:
+            return word[:max(i, 1)]
+    return word
+
+
+def line_style(line: str) -> tuple:
+    """Returns (style, text) for one non-blank source line."""
+    m = MARKDOWN_HEADING.match(line)
+    if m:
+        return HEADING, m.group(1).strip("* ")
+    stripped = line.strip()
+    if len(stripped) > 4 and stripped.startswith("**") and stripped.endswith("**"):
+        return HEADING, stripped.strip("* ")
+    # Upper-case lines are headings, but not address lines ("NEW DELHI - 110001,")
+    if (len(stripped) <= 100 and not stripped.endswith((",", ".")) and stripped == stripped.upper()
+            and sum(c.isalpha() for c in stripped) >= 3):
+        return HEADING, line
+    return BODY, line
+
+
+def wrap(line: str, style: Style, width: float) -> list:
+    """Splits one source line into (x offset, text) pieces no wider than `width`."""
+    stripped = line.lstrip()
+    indent = min(word_width(" ", style) * len(line[:len(line) - len(stripped)].expandtabs(4)), width / 2)
+    marker = LIST_MARKER.match(stripped)
+    hang = min(indent + (word_width(marker.group().rstrip(), style) + word_width(" ", style) if marker else 0),
+               width / 2)
+    space = word_width(" ", style)
+
+    pieces, current, current_width, x = [], [], 0.0, indent
+    for word in stripped.split():
+        w = word_width(word, style)
+        if current and current_width + space + w > width - x:
+            pieces.append((x, " ".join(current)))
+            current, current_width, x = [], 0.0, hang
+        while w > width - x:
+            head = _fit(word, style, width - x)
+            pieces.append((x, head))
+            word, x = word[len(head):], hang
+            w = word_width(word, style)
+        if current:
+            current_width += space
+        current.append(word)
+        current_width += w
+    if current:
+        pieces.append((x, " ".join(current)))
+    return pieces
+
+
+def layout(text: str, page_size=A4, margin=MARGIN):
+    """Yields (page, x, y, style, text) for every line to draw; pages count from 1."""
+    page_width, page_height = page_size
+    width = page_width - 2 * margin
+    top, bottom = page_height - margin, margin
+    page, y = 1, top
+    previous = None  # style of the line above, None after a blank line
+    for line in text.splitlines():
+        if not line.strip():
+            if y < top:
+                y -= BLANK_LINE
+            previous = None
+            continue
+        style, line = line_style(line)
+        pieces = wrap(line, style, width)
+        if y < top and previous is not None and previous is not style:
+            y -= style.space_before
+        previous = style
+        if style is HEADING and y < top and y - style.leading * len(pieces) - BODY.leading < bottom:
+            page, y = page + 1, top  # keep the heading with what follows
+        for x, piece in pieces:
+            if y < bottom:
+                page, y = page + 1, top
+            yield page, margin + x, y, style, piece
+            y -= style.leading
+
+
+def report_to_pdf(report_text: str, out) -> int:
+    """Renders the report into `out` (a path or binary file); returns the page count."""
+    c = canvas.Canvas(out, pagesize=A4, pageCompression=1)
+    page, font = 1, None
+    for line_page, x, y, style, text in layout(report_text):
+        if line_page != page:
+            c.showPage()
+            page, font = line_page, None
+        if font != (style.font, style.size):
+            font = (style.font, style.size)
+            c.setFont(*font)
+        c.drawString(x, y, text)
+    c.save()
+    return page
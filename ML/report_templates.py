@@ -0,0 +1,186 @@
+"""
+Reference templates for report generation.
+
+Every report type has a reference document in reference_templates/<name>.txt
+(legal_notice, posh_complaint, ...). The static part of a report prompt is
+the drafting instructions plus that document. It is the same for every
+request, so the registry builds it once per template and re-reads the file
+only when its modification time changes.
+
+Where possible the prefix lives in Gemini cached content, so a request only
+uploads (and is billed in full for) the evidence and NLP output. Gemini only
+caches prefixes above a minimum size (32k tokens for 1.5 Flash). Smaller
+templates are sent as the model's system instruction instead: still one
+fixed prefix, just not pre-stored. Creating a cache is a network call, so
+it runs outside the registry lock: one caller creates it while the others
+keep using the plain prefix.
+"""
+
+import datetime
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+import google.generativeai as genai
+from google.generativeai import caching
+
+TEMPLATE_NAME = re.compile(r"^[a-z0-9_]+$")
+
+
+@dataclass
+class ReportTemplate:
+    name: str
+    title: str
+    path: str
+    mtime: float
+    text: str
+    model: genai.GenerativeModel  # model carrying the static prefix
+    cached: caching.CachedContent = None  # set when the prefix is cached server-side
+    cache_expires: float = 0.0
+    cache_pending: bool = False  # large enough to cache, and no attempt made yet
+    caching: bool = False  # a caller is creating the cached prefix
+
+
+class TemplateRegistry:
+    """
+    Loads templates from `directory` on first use and rebuilds them when the
+    file changes. `build_instruction(title, text)` returns the static prompt
+    prefix for a template.
+    """
+
+    def __init__(self, directory, build_instruction, model_name, cache_model_name=None,
+                 cache_ttl=3600, cache_min_tokens=32768, titles=None):
+        self.directory = directory
+        self.build_instruction = build_instruction
+        self.model_name = model_name
+        self.cache_model_name = cache_model_name
+        self.cache_ttl = cache_ttl
+        self.cache_min_tokens = cache_min_tokens
+        self.titles = titles or {}
+        self.lock = threading.Lock()
+        self.templates = {}
+
+    def names(self) -> list:
+        return sorted(
+            f[:-4] for f in os.listdir(self.directory)
+            if f.endswith(".txt") and TEMPLATE_NAME.match(f[:-4])
+        )
+
+    def get(self, name: str) -> ReportTemplate:
+        """Returns the current template; raises KeyError for unknown names."""
+        if not TEMPLATE_NAME.match(name):
+            raise KeyError(name)
+        path = os.path.join(self.directory, f"{name}.txt")
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            raise KeyError(name)
+
+        stale = None
+        with self.lock:
+            template = self.templates.get(name)
+            if template is None or template.mtime != mtime:
+                if template is not None:
+                    stale = self._detach_cache(template)
+                template = self._load(name, path, mtime)
+                self.templates[name] = template
+            claimed = self._claim_cache(template)
+        if stale is not None:
+            self._delete(stale)
+        if claimed:
+            self._cache(template)
+        return template
+
+    def uncache(self, name: str) -> ReportTemplate:
+        """Stops using the cached prefix of `name`, e.g. after it was deleted upstream."""
+        with self.lock:
+            template = self.templates[name]
+            stale = self._detach_cache(template)
+        if stale is not None:
+            self._delete(stale)
+        return template
+
+    def _load(self, name, path, mtime) -> ReportTemplate:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        title = self.titles.get(name, name.replace("_", " "))
+        instruction = self.build_instruction(title, text)
+        return ReportTemplate(name=name, title=title, path=path, mtime=mtime, text=text,
+                              model=self._plain_model(title, text),
+                              # Cheap size estimate (4 characters per token); small prefixes are not cached.
+                              cache_pending=bool(self.cache_model_name)
+                              and len(instruction) // 4 >= self.cache_min_tokens)
+
+    def _plain_model(self, title, text) -> genai.GenerativeModel:
+        return genai.GenerativeModel(self.model_name, system_instruction=self.build_instruction(title, text))
+
+    @staticmethod
+    def _claim_cache(template: ReportTemplate) -> bool:
+        """Whether the caller (holding the lock) should create the cached prefix now."""
+        if template.caching:
+            return False
+        # Replace a cached prefix shortly before it expires.
+        expiring = template.cached is not None and time.time() > template.cache_expires - 60
+        if not (template.cache_pending or expiring):
+            return False
+        template.cache_pending = False
+        template.caching = True
+        return True
+
+    def _cache(self, template: ReportTemplate) -> None:
+        """Creates the cached prefix of a claimed template, without holding the lock."""
+        try:
+            cached = caching.CachedContent.create(
+                model=self.cache_model_name,
+                display_name=f"report-template-{template.name}",
+                system_instruction=self.build_instruction(template.title, template.text),
+                ttl=datetime.timedelta(seconds=self.cache_ttl),
+            )
+            model = genai.GenerativeModel.from_cached_content(cached)
+        except Exception as e:
+            # Caching is an optimisation; keep using the plain prefix.
+            print(f"Could not cache template {template.name}: {e}")
+            with self.lock:
+                template.caching = False
+            return
+        with self.lock:
+            template.caching = False
+            if self.templates.get(template.name) is not template:
+                stale = cached  # the file changed meanwhile
+            else:
+                stale = template.cached
+                template.cached = cached
+                template.cache_expires = time.time() + self.cache_ttl
+                template.model = model
+        if stale is not None:
+            self._delete(stale)
+
+    def _detach_cache(self, template: ReportTemplate):
+        """Switches a template back to the plain prefix; returns the cache to delete (outside the lock)."""
+        cached = template.cached
+        if cached is not None:
+            template.cached = None
+            template.model = self._plain_model(template.title, template.text)
+        return cached
+
+    @staticmethod
+    def _delete(cached) -> None:
+        try:
+            cached.delete()
+        except Exception:
+            pass  # expires on its own
+
+    def info(self) -> list:
+        with self.lock:
+            loaded = dict(self.templates)
+        return [
+            {
+                "name": name,
+                "title": loaded[name].title if name in loaded else self.titles.get(name, name.replace("_", " ")),
+                "loaded": name in loaded,
+                "cached": name in loaded and loaded[name].cached is not None,
+            }
+            for name in self.names()
+        ]
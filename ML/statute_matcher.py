@@ -0,0 +1,179 @@
+"""
+Statute matching for evidence text.
+
+The lexicon (statute_lexicon.txt) lists statutes as [section headers]
+followed by lines of comma-separated synonyms; the first phrase on a line is
+the keyword reported for all of them:
+
+    [Section 503 IPC / Section 351(1) BNS – Criminal intimidation]
+    threat, threaten, threatened, threatening, threats
+
+All phrases are compiled into one Aho-Corasick automaton over word tokens,
+so a text is matched in a single pass over its words however large the
+lexicon is. Working on whole tokens gives word boundaries for free:
+"threat" matches "a threat" but not "threatened", so inflections are listed
+as synonyms. Overlapping phrases are all reported ("harassment" and
+"harassment at work"), except that only the longest of a keyword's
+synonyms ending at the same word counts ("i will kill you", not also
+"kill you").
+
+StatuteMatcher rebuilds the automaton when the lexicon file changes.
+"""
+
+import os
+import re
+import threading
+from collections import Counter, deque
+from dataclasses import dataclass
+
+TOKEN = re.compile(r"[0-9a-z]+", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class Match:
+    keyword: str
+    text: str  # the matched span as it appears in the input
+    start: int
+    end: int
+    laws: tuple
+
+
+def tokenize(text: str) -> list:
+    return [m.group().lower() for m in TOKEN.finditer(text)]
+
+
+def parse_lexicon(lines) -> dict:
+    """Maps each phrase (as a token tuple) to (keyword, laws)."""
+    phrases = {}
+    law = None
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            law = line[1:-1].strip()
+            continue
+        if law is None:
+            raise ValueError(f"line {number}: phrase outside a [statute] section")
+        synonyms = [s.strip() for s in line.split(",") if s.strip()]
+        keyword = synonyms[0].lower()
+        for phrase in synonyms:
+            tokens = tuple(tokenize(phrase))
+            if not tokens:
+                continue
+            known_keyword, laws = phrases.get(tokens, (keyword, ()))
+            if law not in laws:
+                laws += (law,)
+            phrases[tokens] = (known_keyword, laws)
+    return phrases
+
+
+class Automaton:
+    """Aho-Corasick automaton whose alphabet is word tokens."""
+
+    def __init__(self, phrases: dict):
+        self.goto = [{}]  # state -> {token: next state}
+        self.fail = [0]
+        self.output = [[]]  # state -> [(phrase length in tokens, keyword, laws)]
+        for tokens, (keyword, laws) in phrases.items():
+            state = 0
+            for token in tokens:
+                nxt = self.goto[state].get(token)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][token] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append((len(tokens), keyword, laws))
+
+        # Breadth-first failure links; each state also inherits the outputs
+        # of its failure state, so shorter phrases ending here are reported.
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and token not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(token, 0)
+                # Longest first, so a shorter synonym ending at the same word can be skipped
+                self.output[nxt] = sorted(self.output[nxt] + self.output[self.fail[nxt]], key=lambda o: -o[0])
+        self.phrases = len(phrases)
+        self.laws = len({law for _, laws in phrases.values() for law in laws})
+
+    def scan(self, text: str) -> list:
+        """All phrase occurrences in `text`, in order of where they end."""
+        matches = []
+        spans = []  # (start, end) offsets of the tokens seen so far
+        state = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for m in TOKEN.finditer(text):
+            token = m.group().lower()
+            spans.append(m.span())
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            reported = set()
+            for length, keyword, laws in output[state]:
+                if keyword in reported:
+                    continue  # "will kill you" inside "i will kill you"
+                reported.add(keyword)
+                start = spans[-length][0]
+                end = m.end()
+                matches.append(Match(keyword, text[start:end], start, end, laws))
+        return matches
+
+
+class StatuteMatcher:
+    """Holds the automaton for a lexicon file and rebuilds it when the file changes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.automaton = None
+        self.reload()
+
+    def reload(self) -> None:
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path, "r", encoding="utf-8") as f:
+            automaton = Automaton(parse_lexicon(f))
+        # Swapped in whole; scans already running keep the old automaton.
+        self.automaton, self.mtime = automaton, mtime
+
+    def current(self) -> Automaton:
+        try:
+            changed = os.stat(self.path).st_mtime != self.mtime
+        except OSError:
+            changed = False  # keep serving the last good lexicon
+        if changed:
+            with self.lock:
+                if os.stat(self.path).st_mtime != self.mtime:
+                    self.reload()
+        return self.automaton
+
+    def info(self) -> dict:
+        automaton = self.current()
+        return {"path": self.path, "phrases": automaton.phrases, "statutes": automaton.laws,
+                "states": len(automaton.goto), "loaded": self.mtime}
+
+    def match(self, text: str) -> list:
+        return self.current().scan(text)
+
+    def summarize(self, text: str) -> dict:
+        """Keywords (first-seen order), their counts, statutes and match offsets."""
+        matches = self.match(text)
+        counts = Counter(m.keyword for m in matches)
+        laws = {}
+        for m in matches:
+            for law in m.laws:
+                laws.setdefault(law, None)
+        return {
+            "keywords": list(dict.fromkeys(m.keyword for m in matches)),
+            "keyword_counts": dict(counts),
+            "possible_laws": list(laws),
+            "matches": [{"keyword": m.keyword, "text": m.text, "start": m.start, "end": m.end} for m in matches],
+        }
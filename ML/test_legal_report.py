@@ -0,0 +1,50 @@
+import importlib
+import os
+import runpy
+import sys
+
+import pytest
+
+
+@pytest.fixture
+def job_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("REPORT_JOB_DIR", str(tmp_path))
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.delenv("GEMINI_API_ENDPOINT", raising=False)
+    return tmp_path
+
+
+def test_import_does_not_set_up_services(job_dir):
+    # What a spawned OCR pool process does with the main script
+    namespace = runpy.run_path(os.path.join(os.path.dirname(__file__), "legal_report.py"), run_name="__mp_main__")
+    assert namespace["jobs"] is None and namespace["statutes"] is None
+    assert not os.path.exists(os.path.join(job_dir, "jobs.db"))
+
+
+def test_services_start_with_the_first_request(job_dir):
+    sys.modules.pop("legal_report", None)
+    legal_report = importlib.import_module("legal_report")
+    response = legal_report.app.test_client().get("/reports/unknown")
+    assert response.status_code == 404
+    assert os.path.exists(os.path.join(job_dir, "jobs.db"))
+    assert legal_report.statutes is not None
+
+
+def test_stitching_is_counted_on_stats_not_printed(job_dir, monkeypatch, capsys):
+    sys.modules.pop("legal_report", None)
+    legal_report = importlib.import_module("legal_report")
+    screenshots = []
+    for i in range(2):
+        path = job_dir / f"evidence-{i}"
+        path.write_bytes(b"image")
+        screenshots.append(str(path))
+    lines = [f"Ramesh: message number {i} about the rent" for i in range(8)]
+    texts = ["\n".join(lines[:5]), "\n".join(lines[2:])]
+    monkeypatch.setattr(legal_report, "run_ocr_many", lambda files: texts)
+    capsys.readouterr()
+
+    assert legal_report.evidence_text(screenshots) == "\n".join(lines)
+    assert capsys.readouterr().out == ""
+    reports = legal_report.app.test_client().get("/stats").get_json()["reports"]
+    assert reports["stitched_series"] == 1 and reports["stitched_screenshots"] == 2
+    assert reports["overlap_lines"] == 3
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import threading
+import time
+
+from report_jobs import DONE, RUNNING, JobQueue
+
+
+def make_queue(directory, run_job=None, **kwargs):
+    return JobQueue(str(directory), run_job or (lambda job, progress: None), poll_interval=0.05, **kwargs)
+
+
+def submit(queue, content=b"evidence"):
+    def save_input(job_id):
+        with open(queue.input_path(job_id), "wb") as f:
+            f.write(content)
+    job, _ = queue.submit(save_input, "{}")
+    return job
+
+
+def test_job_runs_and_evidence_is_removed(tmp_path):
+    results = []
+    queue = make_queue(tmp_path, lambda job, progress: results.append(job["id"]))
+    job = submit(queue)
+    queue.start()
+    done = queue.wait(job["id"], timeout=5)
+    assert done["status"] == DONE
+    assert results == [job["id"]]
+    assert queue.input_paths(job["id"]) == []
+
+
+def test_second_process_does_not_requeue_a_live_job(tmp_path):
+    first = make_queue(tmp_path)
+    job = submit(first)
+    assert first._claim()["id"] == job["id"]
+
+    # Another worker process starting on the same database
+    second = make_queue(tmp_path)
+    assert second._claim() is None
+    assert second.get(job["id"])["status"] == RUNNING
+    assert second.get(job["id"])["owner"] == first.owner
+
+
+def test_expired_lease_is_requeued_and_the_old_owner_backs_off(tmp_path):
+    first = make_queue(tmp_path, lease=0.1)
+    job = submit(first)
+    first._claim()
+    time.sleep(0.2)
+
+    second = make_queue(tmp_path, lease=60)
+    assert second._claim()["id"] == job["id"]
+    # The first worker finishes late: it must not record a result or delete the new runner's evidence
+    first._run(first.get(job["id"]))
+    row = second.get(job["id"])
+    assert row["status"] == RUNNING and row["owner"] == second.owner
+    assert len(second.input_paths(job["id"])) == 1
+
+
+def test_database_errors_do_not_kill_the_worker(tmp_path, monkeypatch):
+    ran = threading.Event()
+    queue = make_queue(tmp_path, lambda job, progress: ran.set())
+    claim, failures = queue._claim, []
+
+    def flaky_claim():
+        if len(failures) < 2:
+            failures.append(1)
+            raise sqlite3.OperationalError("database is locked")
+        return claim()
+
+    monkeypatch.setattr(queue, "_claim", flaky_claim)
+    submit(queue)
+    queue.start()
+    assert ran.wait(timeout=5)
+    assert len(failures) == 2
+
+
+def test_wait_returns_none_for_an_unknown_job(tmp_path):
+    assert make_queue(tmp_path).wait("missing", timeout=0.1) is None
+
+
+def test_pre_lease_databases_are_migrated(tmp_path):
+    db = sqlite3.connect(os.path.join(tmp_path, "jobs.db"))
+    db.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, idempotency_key TEXT UNIQUE, status TEXT NOT NULL,"
+        " stage TEXT, progress REAL NOT NULL DEFAULT 0, params TEXT NOT NULL DEFAULT '{}',"
+        " error TEXT, created REAL NOT NULL, updated REAL NOT NULL, expires REAL)"
+    )
+    db.execute("INSERT INTO jobs (id, status, created, updated) VALUES ('old', ?, 0, 0)", (RUNNING,))
+    db.commit()
+    db.close()
+    os.makedirs(os.path.join(tmp_path, "old"))
+    queue = make_queue(tmp_path)
+    # Left running long ago by a process without leases: picked up again
+    assert queue._claim()["id"] == "old"
+    assert queue.get("old")["owner"] == queue.owner
+
+
+def test_expired_job_does_not_block_its_idempotency_key(tmp_path):
+    queue = make_queue(tmp_path, ttl=0)
+
+    def save_input(job_id):
+        with open(queue.input_path(job_id), "wb") as f:
+            f.write(b"evidence")
+
+    old, created = queue.submit(save_input, "{}", idempotency_key="report-1")
+    assert created
+    queue._run(queue._claim())  # done and already past its expiry; _expire() has not run yet
+
+    new, created = queue.submit(save_input, "{}", idempotency_key="report-1")
+    assert created and new["id"] != old["id"]
+    assert not os.path.exists(queue.job_dir(old["id"]))
+    assert queue.submit(save_input, "{}", idempotency_key="report-1") == (new, False)
@@ -0,0 +1,80 @@
+import os
+import threading
+
+import report_templates
+from report_templates import TemplateRegistry
+
+
+class FakeCache:
+    def __init__(self, name):
+        self.name = name
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+
+def registry(tmp_path, **kwargs):
+    (tmp_path / "legal_notice.txt").write_text("Reference notice " * 200, encoding="utf-8")
+    return TemplateRegistry(str(tmp_path), lambda title, text: f"Draft a {title}.\n{text}", "gemini-1.5-flash",
+                            cache_model_name="models/gemini-1.5-flash-001", cache_min_tokens=100, **kwargs)
+
+
+def fake_caching(monkeypatch, create):
+    monkeypatch.setattr(report_templates.caching.CachedContent, "create", create)
+    monkeypatch.setattr(report_templates.genai.GenerativeModel, "from_cached_content",
+                        staticmethod(lambda cached: f"model for {cached.name}"))
+
+
+def test_cache_creation_does_not_block_other_callers(tmp_path, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_create(**kwargs):
+        started.set()
+        release.wait(5)
+        return FakeCache(kwargs["display_name"])
+
+    fake_caching(monkeypatch, slow_create)
+    templates = registry(tmp_path)
+    first = threading.Thread(target=templates.get, args=("legal_notice",))
+    first.start()
+    assert started.wait(5)
+
+    # While the first caller creates the cache, others get the plain prefix at once
+    waiting = threading.Thread(target=templates.get, args=("legal_notice",))
+    waiting.start()
+    waiting.join(1)
+    assert not waiting.is_alive()
+    assert templates.templates["legal_notice"].cached is None
+
+    release.set()
+    first.join(5)
+    template = templates.get("legal_notice")
+    assert template.cached.name == "report-template-legal_notice"
+    assert template.model == "model for report-template-legal_notice"
+
+
+def test_failed_creation_keeps_the_plain_prefix(tmp_path, monkeypatch):
+    calls = []
+
+    def failing_create(**kwargs):
+        calls.append(kwargs)
+        raise RuntimeError("quota exceeded")
+
+    fake_caching(monkeypatch, failing_create)
+    templates = registry(tmp_path)
+    template = templates.get("legal_notice")
+    assert template.cached is None and not template.caching
+    assert template.model.model_name == "models/gemini-1.5-flash"
+    templates.get("legal_notice")
+    assert len(calls) == 1  # not retried on every request
+
+
+def test_changed_file_replaces_the_cache(tmp_path, monkeypatch):
+    fake_caching(monkeypatch, lambda **kwargs: FakeCache(kwargs["display_name"]))
+    templates = registry(tmp_path)
+    old = templates.get("legal_notice").cached
+    (tmp_path / "legal_notice.txt").write_text("Revised notice " * 200, encoding="utf-8")
+    os.utime(tmp_path / "legal_notice.txt", (1, 1))
+    new = templates.get("legal_notice")
+    assert old.deleted and new.cached is not old and "Revised" in new.text
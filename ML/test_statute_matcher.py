@@ -0,0 +1,65 @@
+import os
+
+import pytest
+
+from statute_matcher import Automaton, StatuteMatcher, parse_lexicon
+
+LEXICON = """
+[Threats]
+threat, threats
+kill you, will kill you, i will kill you
+
+[Workplace]
+harassment, harassment at work
+
+[Stalking]
+threat
+"""
+
+
+def automaton(text=LEXICON):
+    return Automaton(parse_lexicon(text.splitlines()))
+
+
+def test_whole_words_only():
+    assert [m.keyword for m in automaton().scan("A THREAT, then threatened again")] == ["threat"]
+
+
+def test_longest_synonym_wins_and_overlaps_are_kept():
+    text = "He said: I will kill you. Harassment at work continues."
+    matches = automaton().scan(text)
+    assert [(m.keyword, m.text) for m in matches] == [
+        ("kill you", "I will kill you"),
+        ("harassment", "Harassment"),
+        ("harassment", "Harassment at work"),
+    ]
+    assert text[matches[0].start:matches[0].end] == "I will kill you"
+
+
+def test_a_phrase_can_belong_to_several_statutes():
+    (match,) = automaton().scan("that was a threat")
+    assert match.laws == ("Threats", "Stalking")
+
+
+def test_phrase_outside_a_section_is_rejected():
+    with pytest.raises(ValueError, match="line 1"):
+        parse_lexicon(["threat"])
+
+
+def test_matcher_reloads_a_changed_lexicon(tmp_path):
+    path = tmp_path / "lexicon.txt"
+    path.write_text(LEXICON, encoding="utf-8")
+    matcher = StatuteMatcher(str(path))
+    assert matcher.summarize("stalker")["keywords"] == []
+
+    path.write_text(LEXICON + "stalker, stalking\n", encoding="utf-8")
+    os.utime(path, (matcher.mtime + 10, matcher.mtime + 10))
+    summary = matcher.summarize("a stalker, a threat, a threat")
+    assert summary["keywords"] == ["stalker", "threat"]
+    assert summary["keyword_counts"] == {"stalker": 1, "threat": 2}
+    assert summary["possible_laws"] == ["Stalking", "Threats"]
+
+
+def test_shipped_lexicon_parses():
+    lexicon = os.path.join(os.path.dirname(__file__), "statute_lexicon.txt")
+    assert StatuteMatcher(lexicon).info()["phrases"] > 0
@@ -0,0 +1,44 @@
+from transcript_stitch import find_overlap, stitch
+
+HEADER = "Ramesh Kumar\nonline\n"
+
+
+def messages(first, last):
+    return "\n".join(f"Ramesh: message number {i} about the rent" for i in range(first, last))
+
+
+def test_scrolled_screenshots_are_merged_once():
+    first = HEADER + messages(0, 10) + "\nType a message"
+    second = HEADER + messages(7, 15) + "\nType a message"
+    result = stitch([first, second])
+    lines = result.text.splitlines()
+    assert [line for line in lines if line.startswith("Ramesh:")] == messages(0, 15).splitlines()
+    assert result.overlaps == [3]
+
+
+def test_shared_header_alone_is_not_an_overlap():
+    first = HEADER + messages(0, 10)
+    second = HEADER + messages(10, 20)
+    result = stitch([first, second])
+    assert result.overlaps == [0]
+    for line in messages(0, 20).splitlines():
+        assert line in result.text
+    assert result.lines_out == result.lines_in
+
+
+def test_lines_after_the_match_are_never_cut():
+    result = stitch(["Bob: ok\nBob: ok\nAlice: see you", "Bob: ok\nBob: ok\nAlice: bye now"])
+    assert "Alice: see you" in result.text
+    assert "Alice: bye now" in result.text
+    assert result.overlaps == [0]
+
+
+def test_overlap_must_reach_the_end_of_the_tail():
+    assert find_overlap([1, 2, 3], [1, 2, 4]) == (-1, -1, 0)
+    assert find_overlap([1, 2, 3], [2, 3, 4]) == (2, 1, 2)
+    assert find_overlap([1, 2, 3, 9], [2, 3, 4], tail_end=2) == (2, 1, 2)
+
+
+def test_unrelated_screenshots_are_concatenated():
+    result = stitch(["Alice: hi\nBob: hello there", "Carol: different chat\nDave: ok"])
+    assert result.text == "Alice: hi\nBob: hello there\n\nCarol: different chat\nDave: ok"
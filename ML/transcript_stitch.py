@@ -0,0 +1,131 @@
+"""
+Stitching of OCR text from overlapping, scrolled chat screenshots.
+
+Consecutive screenshots of one conversation usually share a run of lines:
+the bottom of one capture reappears at the top of the next. stitch() finds
+that common run between the end of the transcript so far and the next
+screenshot, and continues the transcript after it, so every line appears
+once. The screenshot's lines above the run (status bar, chat header, a
+half-visible message) are dropped with it.
+
+Evidence is never dropped to make an overlap fit: the run must reach the
+end of the transcript (only app chrome such as "online", a clock or "Type
+a message" may follow it), otherwise the screenshot is appended whole.
+App chrome and the chat header repeated at the top of every screenshot do
+not count as matching lines, since they are the same in screenshots that
+share no messages at all.
+
+Lines are compared through hashes of a normalised form (case, spacing and
+punctuation removed). OCR still misreads the odd line differently in two
+captures, so the run is found as the scroll offset at which the most lines
+agree, rather than as a strictly unbroken run of equal lines.
+"""
+
+import re
+import zlib
+from dataclasses import dataclass, field
+
+_NOISE = re.compile(r"[^0-9a-z]+")
+# Status and footer lines of chat apps, as OCR reads them
+_CHROME = re.compile(
+    r"(?:online|typing\W*|last seen\b.*|type a message\W*|message|today|yesterday"
+    r"|\d{1,2}[:.]\d{2}(?:\s*[ap]\.?m\.?)?|\d{1,3}\s*%)",
+    re.IGNORECASE,
+)
+HEADER_LINES = 3  # leading lines compared to find a repeated chat header
+
+
+@dataclass
+class StitchResult:
+    text: str
+    lines_in: int
+    lines_out: int
+    overlaps: list = field(default_factory=list)  # lines matched with the previous screenshot
+
+
+def line_key(line: str) -> int:
+    return zlib.crc32(_NOISE.sub("", line.lower()).encode())
+
+
+def _content_lines(text: str) -> list:
+    return [line.rstrip() for line in text.splitlines() if _NOISE.sub("", line.lower())]
+
+
+def is_chrome(line: str) -> bool:
+    return bool(_CHROME.fullmatch(line.strip()))
+
+
+def header_length(keys: list, previous: list) -> int:
+    """How many leading lines `keys` shares with the previous screenshot's (the chat header)."""
+    n = 0
+    while n < min(HEADER_LINES, len(keys), len(previous)) and keys[n] == previous[n]:
+        n += 1
+    return n
+
+
+def find_overlap(tail: list, head: list, min_density: float = 0.5, tail_end: int = None) -> tuple:
+    """
+    Aligns the start of `head` with the end of `tail`, i.e. tail[j + shift]
+    against head[j], for every shift at which `head` runs past the end of
+    `tail` (as the next screenshot of a scroll does). Returns
+    (last_tail, last_head, matches) for the shift with the most equal lines:
+    the positions of its last matching pair, and the number of matches.
+    Mismatches inside the matched span are tolerated as long as at least
+    `min_density` of its lines agree. None keys never match. Only shifts
+    whose last match is at or after `tail_end` (default: the last line of
+    `tail`) count, so nothing in `tail` is left after the overlap.
+    (-1, -1, 0) if nothing matches.
+    """
+    tail_end = len(tail) - 1 if tail_end is None else tail_end
+    best = (-1, -1, 0)
+    for shift in range(max(len(tail) - len(head), -len(head) + 1), len(tail)):
+        matched = [j for j in range(max(0, -shift), min(len(head), len(tail) - shift))
+                   if head[j] is not None and tail[j + shift] == head[j]]
+        if not matched or matched[-1] + shift < tail_end:
+            continue
+        span = matched[-1] - matched[0] + 1
+        # Later shifts win ties: the smallest overlap that explains the match.
+        if len(matched) / span >= min_density and len(matched) >= best[2]:
+            best = (matched[-1] + shift, matched[-1], len(matched))
+    return best
+
+
+def stitch(texts: list, min_run: int = 2, min_single_line_chars: int = 20) -> StitchResult:
+    """
+    Merges OCR texts of screenshots given in scroll order. Fewer than
+    `min_run` matching lines count as overlap only when the match is one
+    distinctive line (at least `min_single_line_chars` long); otherwise
+    short, common lines like "ok" would splice unrelated screenshots together.
+    Screenshots that do not overlap are appended after a blank line.
+    """
+    merged, keys, overlaps = [], [], []
+    previous = []  # keys of the previous screenshot, to spot its repeated header
+    lines_in = 0
+    for text in texts:
+        lines = _content_lines(text)
+        lines_in += len(lines)
+        line_keys = [line_key(line) for line in lines]
+        header, previous = header_length(line_keys, previous), line_keys
+        if not merged:
+            merged, keys = lines, line_keys
+            continue
+
+        # The overlap can only involve the last screenful of the transcript,
+        # and has to reach its last line that is not app chrome.
+        offset = max(0, len(keys) - len(lines))
+        tail_end = len(keys) - 1
+        while tail_end > offset and is_chrome(merged[tail_end]):
+            tail_end -= 1
+        head = [None if j < header or is_chrome(line) else key
+                for j, (line, key) in enumerate(zip(lines, line_keys))]
+        last_tail, last_head, matches = find_overlap(keys[offset:], head, tail_end=tail_end - offset)
+        distinctive = matches == 1 and len(_NOISE.sub("", lines[last_head].lower())) >= min_single_line_chars
+        if matches >= min_run or distinctive:
+            cut = offset + last_tail + 1
+            merged = merged[:cut] + lines[last_head + 1:]
+            keys = keys[:cut] + line_keys[last_head + 1:]
+            overlaps.append(matches)
+        else:
+            merged, keys = merged + [""] + lines, keys + [0] + line_keys
+            overlaps.append(0)
+    return StitchResult("\n".join(merged), lines_in, len([line for line in merged if line]), overlaps)
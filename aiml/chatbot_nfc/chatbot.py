@@ -1,20 +1,154 @@
 # chatbot.py
 
-from fastapi import FastAPI, Request
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import Optional
 import google.generativeai as genai
 import os
 from dotenv import load_dotenv
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+import asyncio
+import contextlib
+import functools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from response_cache import ResponseCache
+from sessions import SessionStore, fallback_summary
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-genai.configure(api_key=GEMINI_API_KEY)
+# GEMINI_API_ENDPOINT points the SDK at a Gemini-compatible REST endpoint
+# instead of the public API: the shared gateway (aiml/gemini_gateway) or the
+# fake server in loadtest/.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
 
-model = genai.GenerativeModel(model_name="gemini-1.5-flash")
+if GEMINI_API_ENDPOINT:
+    # Chat is interactive traffic; the gateway serves it before batch work.
+    genai.configure(api_key=GEMINI_API_KEY, transport="rest",
+                    client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+                    default_metadata=[("x-gateway-priority", "interactive")])
+else:
+    genai.configure(api_key=GEMINI_API_KEY)
+
+SYSTEM_PROMPT = (
+    "You are a calm, emotionally aware, and well-informed assistant trained to support individuals facing workplace harassment under POSH and related Indian laws. "
+    "Your tone should be supportive, therapeutic, and empowering — as if you're a trained counselor. "
+    "When someone describes an incident or asks a legal question, do the following:\n"
+    "- Give a short empathetic intro acknowledging their experience.\n"
+    "- Offer a helpful and elaborative response (at least 4–5 lines) including legal insight.\n"
+    "- Mention the relevant section of Indian law or POSH Act if possible (e.g., IPC 354A, POSH Sec 9).\n"
+    "- If the user asks or hints at drafting something, offer a well-worded 100-word incident message or complaint template.\n"
+    "- End with 1–2 actionable next steps that the AI itself can assist with (e.g., 'I can help you draft a report' or 'Would you like me to explain how to file it?')\n"
+    "- If the user's message is vague, gently ask clarifying questions while offering emotional reassurance.\n\n"
+    "Respond in a warm but clear tone. Always avoid robotic or generic replies. NOTE: AVOID USING EM-DASHES\n\n"
+)
+
+# The counselor instructions go in the system instruction rather than being
+# pasted in front of every user message.
+model = genai.GenerativeModel(model_name="gemini-1.5-flash", system_instruction=SYSTEM_PROMPT.strip())
+summary_model = genai.GenerativeModel(model_name="gemini-1.5-flash")
+
+# Gemini concurrency limits (per worker process)
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "16"))
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "64"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+GEMINI_RETRY_AFTER = os.getenv("GEMINI_RETRY_AFTER", "5")
+
+class GeminiPool:
+    """
+    Runs the blocking Gemini SDK calls on a bounded thread pool so they never
+    block the event loop. At most `max_in_flight` calls run at once and at most
+    `max_queue` requests wait for a slot; anything beyond that is rejected
+    with 429, and requests that wait longer than `queue_timeout` get 503.
+    """
+
+    def __init__(self, max_in_flight, max_queue, queue_timeout, timeout):
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="gemini")
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _busy(self, status_code, detail):
+        return HTTPException(status_code=status_code, detail=detail,
+                             headers={"Retry-After": GEMINI_RETRY_AFTER})
+
+    async def acquire(self):
+        if not self.slots.locked():
+            # A slot is free: take it without going through the queue.
+            await self.slots.acquire()
+            self.in_flight += 1
+            return
+        if self.waiting >= self.max_queue:
+            raise self._busy(429, "Too many requests in progress, please retry shortly.")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._busy(503, "Assistant is busy, please retry shortly.")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self, *_):
+        self.in_flight -= 1
+        self.slots.release()
+
+    def spawn(self, fn, *args, **kwargs):
+        """Runs fn on the pool using a slot already taken with acquire()."""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        # The slot is held until the thread really finishes, even if the
+        # caller stopped waiting for it.
+        future.add_done_callback(self.release)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        await self.acquire()
+        future = self.spawn(fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Gemini did not respond in time.")
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "waiting": self.waiting}
+
+gemini_pool = GeminiPool(GEMINI_MAX_IN_FLIGHT, GEMINI_MAX_QUEUE, GEMINI_QUEUE_TIMEOUT, GEMINI_TIMEOUT)
+# Also bounds the SDK call itself so timed-out threads free their slot.
+GEMINI_REQUEST_OPTIONS = {"timeout": GEMINI_TIMEOUT}
+
+# Answers to repeated / near-identical questions are served from memory
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "1000")),
+    ttl=float(os.getenv("CHAT_CACHE_TTL", "3600")),
+    similarity=float(os.getenv("CHAT_CACHE_SIMILARITY", "0.85")),
+)
+
+# Multi-turn sessions: recent turns are kept verbatim and older ones are
+# folded into a summary once a session exceeds its token budget.
+CHAT_SESSION_TOKEN_BUDGET = int(os.getenv("CHAT_SESSION_TOKEN_BUDGET", "2000"))
+CHAT_SESSION_KEEP_TURNS = int(os.getenv("CHAT_SESSION_KEEP_TURNS", "4"))
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+session_store = SessionStore(
+    max_sessions=int(os.getenv("CHAT_MAX_SESSIONS", "5000")),
+    ttl=float(os.getenv("CHAT_SESSION_TTL", "3600")),
+)
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below between a person facing workplace harassment and a POSH support assistant. "
+    "Keep the facts of the incident, people and places involved, legal sections already discussed, and anything the user asked for. "
+    "Write at most {max_words} words in plain sentences.\n\n"
+    "Earlier summary: {previous}\n\n"
+    "Conversation:\n{transcript}"
+)
 
 app = FastAPI()
 
@@ -28,31 +162,226 @@ app.add_middleware(
 
 class ChatRequest(BaseModel):
     message: str
+    # Optional opaque id (e.g. a UUID generated by the client). When set, the
+    # conversation history is kept server-side between requests.
+    session_id: Optional[str] = None
 
-@app.post("/chat")
-async def chat_with_gemini(request: ChatRequest):
-    user_msg = request.message.strip()
+def prepare_chat(body: ChatRequest):
+    """Returns (user_msg, session, contents) for a chat request."""
+    user_msg = body.message.strip()
+    if not body.session_id:
+        return user_msg, None, user_msg
+    session = session_store.get(body.session_id)
+    return user_msg, session, session.contents(user_msg)
 
-    prompt = (
-    "You are a calm, emotionally aware, and well-informed assistant trained to support individuals facing workplace harassment under POSH and related Indian laws. "
-    "Your tone should be supportive, therapeutic, and empowering — as if you're a trained counselor. "
-    "When someone describes an incident or asks a legal question, do the following:\n"
-    "- Give a short empathetic intro acknowledging their experience.\n"
-    "- Offer a helpful and elaborative response (at least 4–5 lines) including legal insight.\n"
-    "- Mention the relevant section of Indian law or POSH Act if possible (e.g., IPC 354A, POSH Sec 9).\n"
-    "- If the user asks or hints at drafting something, offer a well-worded 100-word incident message or complaint template.\n"
-    "- End with 1–2 actionable next steps that the AI itself can assist with (e.g., 'I can help you draft a report' or 'Would you like me to explain how to file it?')\n"
-    "- If the user's message is vague, gently ask clarifying questions while offering emotional reassurance.\n\n"
-    "Respond in a warm but clear tone. Always avoid robotic or generic replies. NOTE: AVOID USING EM-DASHES\n\n"
-    "User: " + user_msg
-)
+def is_cacheable(session) -> bool:
+    # Follow-up questions depend on earlier turns, so only the opening message
+    # of a conversation may be answered from (or stored in) the cache.
+    return session is None or not (session.turns or session.summary)
+
+async def compact_session(session) -> None:
+    """Folds the oldest turns of an over-budget session into its summary."""
+    if session.compacting:
+        return
+    folded = session.turns_to_compact(CHAT_SESSION_TOKEN_BUDGET, CHAT_SESSION_KEEP_TURNS)
+    if not folded:
+        return
+    session.compacting = True
+    try:
+        transcript = "\n".join(
+            f"{'User' if t.role == 'user' else 'Assistant'}: {t.text}" for t in folded
+        )
+        prompt = SUMMARY_PROMPT.format(
+            max_words=CHAT_SUMMARY_MAX_TOKENS * 3 // 4,
+            previous=session.summary or "(none)",
+            transcript=transcript,
+        )
+        try:
+            response = await gemini_pool.run(
+                summary_model.generate_content, prompt, request_options=GEMINI_REQUEST_OPTIONS
+            )
+            summary = response.text.strip()
+        except Exception as e:
+            print(f"Session summary failed, using extractive fallback: {e}")
+            summary = fallback_summary(session.summary, folded, CHAT_SUMMARY_MAX_TOKENS)
+        session.apply_compaction(folded, summary)
+    finally:
+        session.compacting = False
+
+def record_exchange(session, user_msg: str, answer: str, background: BackgroundTasks) -> None:
+    session.add_turn("user", user_msg)
+    session.add_turn("model", answer)
+    # Summarizing happens after the response is sent, off the request path.
+    background.add_task(compact_session, session)
+
+@app.post("/chat")
+async def chat_with_gemini(request: ChatRequest, background: BackgroundTasks):
+    user_msg, session, contents = prepare_chat(request)
+    cacheable = is_cacheable(session)
+    cached = response_cache.get(user_msg) if cacheable else None
+    if cached is not None:
+        if session is not None:
+            record_exchange(session, user_msg, cached, background)
+        return {"response": cached, "cached": True, "session_id": request.session_id}
 
     try:
-        response = model.generate_content(prompt)
-        return {"response": response.text}
+        response = await gemini_pool.run(
+            model.generate_content, contents, request_options=GEMINI_REQUEST_OPTIONS
+        )
+        if cacheable:
+            response_cache.put(user_msg, response.text)
+        if session is not None:
+            record_exchange(session, user_msg, response.text, background)
+        return {"response": response.text, "session_id": request.session_id}
+    except HTTPException:
+        raise
     except Exception as e:
         return {"error": str(e)}
-    
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _cancel_upstream(response) -> None:
+    # Both the gRPC and REST stream iterators expose cancel(); closing the
+    # stream stops Gemini from generating (and billing) the rest of the answer.
+    iterator = getattr(response, "_iterator", None)
+    cancel = getattr(iterator, "cancel", None)
+    if cancel is not None:
+        try:
+            cancel()
+        except Exception:
+            pass
+
+class GeminiStream:
+    """
+    A streaming generate_content call running on a Gemini pool thread. Text
+    chunks are handed to the event loop through a queue as they arrive, and
+    cancel() closes the upstream stream. The caller must already hold a pool
+    slot; it is released when the thread finishes.
+    """
+
+    def __init__(self, prompt):
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.cancelled = threading.Event()
+        self.response = None
+        # True once every chunk of a finished stream has been relayed.
+        self.completed = False
+        gemini_pool.spawn(self._produce, prompt)
+
+    def _put(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            pass  # event loop already closed
+
+    def _produce(self, prompt):
+        finished = False
+        try:
+            self.response = model.generate_content(
+                prompt, stream=True, request_options=GEMINI_REQUEST_OPTIONS
+            )
+            if self.cancelled.is_set():
+                _cancel_upstream(self.response)
+                return
+            for chunk in self.response:
+                if self.cancelled.is_set():
+                    break
+                self._put(("chunk", chunk.text))
+            else:
+                finished = True
+        except Exception as e:
+            if not self.cancelled.is_set():
+                self._put(("error", str(e)))
+        finally:
+            self._put(("end", finished))
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.response is not None:
+            _cancel_upstream(self.response)
+
+    async def relay(self, request: Request):
+        """Yields (kind, payload) items until the stream ends or the client leaves."""
+        try:
+            while True:
+                try:
+                    kind, payload = await asyncio.wait_for(self.queue.get(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    continue
+                if kind == "end":
+                    self.completed = payload
+                    break
+                if await request.is_disconnected():
+                    break
+                yield kind, payload
+        finally:
+            self.cancel()
+
+@app.post("/chat/stream")
+async def chat_with_gemini_stream(body: ChatRequest, request: Request, background: BackgroundTasks):
+    """
+    Same as /chat but streams the answer as Server-Sent Events:
+    `chunk` events carry partial text, followed by a final `done` or `error`.
+    """
+    user_msg, session, contents = prepare_chat(body)
+    cacheable = is_cacheable(session)
+    cached = response_cache.get(user_msg) if cacheable else None
+    if cached is not None:
+        if session is not None:
+            record_exchange(session, user_msg, cached, background)
+
+        async def replay():
+            yield _sse("chunk", {"text": cached})
+            yield _sse("done", {"cached": True})
+        return StreamingResponse(replay(), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache"}, background=background)
+
+    # Admission control happens before the response starts so a saturated
+    # worker can still answer with a proper 429/503 status.
+    await gemini_pool.acquire()
+    stream = GeminiStream(contents)
+
+    async def events():
+        parts = []
+        # aclosing: leaving the loop early (on an error) must still run
+        # relay's cleanup, which cancels the upstream stream.
+        async with contextlib.aclosing(stream.relay(request)) as relay:
+            async for kind, payload in relay:
+                if kind == "error":
+                    yield _sse("error", {"error": payload})
+                    return
+                parts.append(payload)
+                yield _sse("chunk", {"text": payload})
+        if stream.completed:
+            answer = "".join(parts)
+            if cacheable:
+                response_cache.put(user_msg, answer)
+            if session is not None:
+                record_exchange(session, user_msg, answer, background)
+        yield _sse("done", {"session_id": body.session_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=background,
+    )
+
+@app.delete("/chat/sessions/{session_id}")
+async def end_session(session_id: str):
+    return {"deleted": session_store.drop(session_id)}
+
+@app.get("/stats")
+async def stats():
+    return {
+        "gemini": gemini_pool.stats(),
+        "cache": response_cache.info(),
+        "sessions": session_store.info(),
+    }
+
     #PDF generation when the word pdf appears
 @app.get("/download-sample-pdf")
 async def download_sample_pdf():
@@ -0,0 +1,181 @@
+# response_cache.py
+#
+# In-process cache for chatbot answers. Exact repeats are matched on the
+# normalized message; near-duplicates ("what is POSH sec 9?" vs "What is POSH
+# Sec. 9") are found with MinHash signatures over character shingles and an
+# LSH band index, so no external service is needed.
+
+import re
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+_PUNCT_RE = re.compile(r"[^\w\s]")
+_SPACE_RE = re.compile(r"\s+")
+_NUMBER_RE = re.compile(r"\d+")
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_message(message: str) -> str:
+    """Lowercases, drops punctuation and collapses whitespace."""
+    text = _PUNCT_RE.sub(" ", message.lower())
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def shingles(text: str, size: int = 3) -> set:
+    padded = f" {text} "
+    if len(padded) <= size:
+        return {padded}
+    return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash over 32-bit shingle hashes using universal hash permutations."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 7):
+        # A fixed LCG keeps signatures stable across restarts.
+        state = seed
+        self.params = []
+        for _ in range(num_perm):
+            state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            a = (state >> 3) % (_MERSENNE_PRIME - 1) + 1
+            state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            b = (state >> 3) % _MERSENNE_PRIME
+            self.params.append((a, b))
+
+    def signature(self, items: set) -> tuple:
+        hashes = [zlib.crc32(item.encode("utf-8")) for item in items]
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self.params
+        )
+
+
+@dataclass
+class CacheEntry:
+    response: str
+    created: float
+    shingles: set
+    numbers: tuple
+    band_keys: list = field(default_factory=list)
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of chatbot responses with near-duplicate lookup.
+
+    A near-duplicate must share an LSH band with the query, have a shingle
+    Jaccard similarity of at least `similarity`, and mention exactly the same
+    numbers (so "Sec 9" never answers a question about "Sec 4").
+
+    Not thread-safe: it is only touched from the event loop.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, similarity=0.85, num_perm=64, bands=16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.buckets: dict = {}
+        self.stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def _band_keys(self, signature: tuple) -> list:
+        return [(i, signature[i * self.rows:(i + 1) * self.rows]) for i in range(self.bands)]
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        for band_key in entry.band_keys:
+            bucket = self.buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+
+    def _fresh(self, key: str, now: float):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if now - entry.created > self.ttl:
+            self._remove(key)
+            self.stats["expired"] += 1
+            return None
+        return entry
+
+    def get(self, message: str):
+        """Returns the cached response for message or a near-duplicate, else None."""
+        key = normalize_message(message)
+        now = time.monotonic()
+
+        entry = self._fresh(key, now)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return entry.response
+
+        query_shingles = shingles(key)
+        numbers = tuple(_NUMBER_RE.findall(key))
+        candidates = set()
+        for band_key in self._band_keys(self.hasher.signature(query_shingles)):
+            candidates |= self.buckets.get(band_key, set())
+
+        best_key, best_score = None, self.similarity
+        for candidate in candidates:
+            entry = self._fresh(candidate, now)
+            if entry is None or entry.numbers != numbers:
+                continue
+            score = jaccard(query_shingles, entry.shingles)
+            if score >= best_score:
+                best_key, best_score = candidate, score
+
+        if best_key is None:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(best_key)
+        self.stats["near_hits"] += 1
+        return self.entries[best_key].response
+
+    def put(self, message: str, response: str) -> None:
+        key = normalize_message(message)
+        if not key:
+            return
+        self._remove(key)
+        key_shingles = shingles(key)
+        entry = CacheEntry(
+            response=response,
+            created=time.monotonic(),
+            shingles=key_shingles,
+            numbers=tuple(_NUMBER_RE.findall(key)),
+            band_keys=self._band_keys(self.hasher.signature(key_shingles)),
+        )
+        self.entries[key] = entry
+        for band_key in entry.band_keys:
+            self.buckets.setdefault(band_key, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def info(self) -> dict:
+        lookups = self.stats["exact_hits"] + self.stats["near_hits"] + self.stats["misses"]
+        hits = self.stats["exact_hits"] + self.stats["near_hits"]
+        return {
+            **self.stats,
+            "size": len(self.entries),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
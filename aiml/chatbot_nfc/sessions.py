@@ -0,0 +1,124 @@
+# sessions.py
+#
+# Server-side conversation memory for the chatbot. Each session keeps its
+# recent turns verbatim plus a running summary of older turns, so the input
+# sent to Gemini stays within a fixed token budget however long the
+# conversation gets.
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+SUMMARY_PREFIX = "Summary of our earlier conversation (for context): "
+
+
+def estimate_tokens(text: str) -> int:
+    # Gemini averages roughly 4 characters per token for English text; good
+    # enough for budgeting without a count_tokens round trip.
+    return len(text) // 4 + 1
+
+
+@dataclass
+class Turn:
+    role: str  # "user" or "model"
+    text: str
+    tokens: int
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    turns: list = field(default_factory=list)
+    summary: str = ""
+    last_used: float = field(default_factory=time.monotonic)
+    compacting: bool = False
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(t.tokens for t in self.turns)
+
+    def add_turn(self, role: str, text: str) -> None:
+        self.turns.append(Turn(role, text, estimate_tokens(text)))
+
+    def contents(self, user_msg: str) -> list:
+        """Builds the generate_content history for the next user message."""
+        contents = []
+        if self.summary:
+            contents.append({"role": "user", "parts": [SUMMARY_PREFIX + self.summary]})
+            contents.append({"role": "model", "parts": ["Understood, I will keep that in mind."]})
+        contents.extend({"role": t.role, "parts": [t.text]} for t in self.turns)
+        contents.append({"role": "user", "parts": [user_msg]})
+        return contents
+
+    def turns_to_compact(self, budget: int, keep_turns: int) -> list:
+        """
+        Returns the oldest turns that must be folded into the summary to bring
+        the session back under `budget`, always keeping the last `keep_turns`
+        turns verbatim. Returns [] when the session is within budget.
+        """
+        excess = self.tokens - budget
+        if excess <= 0:
+            return []
+        selected = []
+        for turn in self.turns[:max(len(self.turns) - keep_turns, 0)]:
+            if excess <= 0:
+                break
+            selected.append(turn)
+            excess -= turn.tokens
+        # Fold whole user/model exchanges so history keeps alternating roles.
+        if len(selected) % 2 and len(selected) < len(self.turns) - keep_turns:
+            selected.append(self.turns[len(selected)])
+        elif len(selected) % 2:
+            selected.pop()
+        return selected
+
+    def apply_compaction(self, folded: list, summary: str) -> None:
+        # Only appends happen while a compaction runs, so the folded turns are
+        # still at the front of the list.
+        del self.turns[:len(folded)]
+        self.summary = summary
+
+
+def fallback_summary(previous: str, folded: list, max_tokens: int) -> str:
+    """Extractive summary used when the summarization call fails."""
+    lines = [previous] if previous else []
+    for turn in folded:
+        speaker = "User" if turn.role == "user" else "Assistant"
+        first_sentence = turn.text.strip().split(". ")[0][:200]
+        lines.append(f"{speaker}: {first_sentence}")
+    summary = " ".join(lines)
+    max_chars = max_tokens * 4
+    return summary[-max_chars:] if len(summary) > max_chars else summary
+
+
+class SessionStore:
+    """LRU-bounded session map; idle sessions expire after `ttl` seconds."""
+
+    def __init__(self, max_sessions=5000, ttl=3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+
+    def get(self, session_id: str) -> ChatSession:
+        """Returns the session, creating a fresh one if it is unknown or expired."""
+        now = time.monotonic()
+        session = self.sessions.get(session_id)
+        if session is not None and now - session.last_used > self.ttl:
+            session = None
+        if session is None:
+            session = ChatSession(session_id)
+            self.sessions[session_id] = session
+        session.last_used = now
+        self.sessions.move_to_end(session_id)
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        return session
+
+    def drop(self, session_id: str) -> bool:
+        return self.sessions.pop(session_id, None) is not None
+
+    def info(self) -> dict:
+        return {
+            "sessions": len(self.sessions),
+            "tokens": sum(s.tokens for s in self.sessions.values()),
+        }
@@ -0,0 +1,46 @@
+import asyncio
+
+from fastapi import BackgroundTasks
+
+import chatbot
+
+
+class Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FailingModel:
+    """A streaming answer that breaks off after its first chunk."""
+
+    def generate_content(self, contents, stream=False, request_options=None):
+        def chunks():
+            yield Chunk("Partial answer")
+            raise RuntimeError("quota exceeded")
+        return chunks()
+
+
+class ConnectedRequest:
+    async def is_disconnected(self):
+        return False
+
+
+def test_stream_error_closes_the_relay(monkeypatch):
+    cancelled = []
+    cancel = chatbot.GeminiStream.cancel
+    monkeypatch.setattr(chatbot, "model", FailingModel())
+    monkeypatch.setattr(chatbot.GeminiStream, "cancel", lambda self: (cancelled.append(self), cancel(self)))
+
+    async def main():
+        monkeypatch.setattr(chatbot, "gemini_pool", chatbot.GeminiPool(1, 1, 1, 5))
+        body = chatbot.ChatRequest(message="What does POSH Sec 9 say?")
+        response = await chatbot.chat_with_gemini_stream(body, ConnectedRequest(), BackgroundTasks())
+        events = [event async for event in response.body_iterator]
+        # Checked before the event loop runs again: an abandoned generator
+        # would only be closed later by its finalizer.
+        assert cancelled, "relay was left open after the error"
+        return events
+
+    events = asyncio.run(main())
+    assert [event.split("\n")[0] for event in events] == ["event: chunk", "event: error"]
+    assert chatbot.response_cache.get("What does POSH Sec 9 say?") is None
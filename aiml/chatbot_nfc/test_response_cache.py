@@ -0,0 +1,36 @@
+from response_cache import ResponseCache, normalize_message
+
+
+def test_exact_repeat_is_served_after_normalizing():
+    cache = ResponseCache()
+    cache.put("What is POSH Sec. 9?", "answer")
+    assert normalize_message("  what is posh SEC 9 ") == "what is posh sec 9"
+    assert cache.get("what is posh sec 9") == "answer"
+    assert cache.stats["exact_hits"] == 1
+
+
+def test_near_duplicate_is_served():
+    cache = ResponseCache()
+    cache.put("How do I file a complaint with the internal committee at my office", "answer")
+    assert cache.get("how do i file a complaint with the internal committee at my offices") == "answer"
+    assert cache.stats["near_hits"] == 1
+
+
+def test_different_numbers_never_match():
+    cache = ResponseCache()
+    cache.put("What does section 9 of the POSH Act say about complaints", "sec 9")
+    assert cache.get("What does section 4 of the POSH Act say about complaints") is None
+
+
+def test_expired_and_evicted_entries_are_gone():
+    cache = ResponseCache(max_entries=2, ttl=0)
+    cache.put("first question", "a")
+    assert cache.get("first question") is None
+    assert cache.stats["expired"] == 1
+
+    cache = ResponseCache(max_entries=2)
+    for question in ("first question", "second question", "third question"):
+        cache.put(question, question)
+    assert cache.get("first question") is None
+    assert cache.info()["size"] == 2
+    assert not any("first question" in keys for keys in cache.buckets.values())
@@ -0,0 +1,50 @@
+from sessions import SUMMARY_PREFIX, ChatSession, SessionStore, fallback_summary
+
+
+def session_with(turns):
+    session = ChatSession("s")
+    for i in range(turns):
+        session.add_turn("user" if i % 2 == 0 else "model", f"turn {i} " + "x" * 400)
+    return session
+
+
+def test_contents_put_the_summary_before_recent_turns():
+    session = session_with(2)
+    session.summary = "earlier facts"
+    contents = session.contents("next question")
+    assert contents[0] == {"role": "user", "parts": [SUMMARY_PREFIX + "earlier facts"]}
+    assert [c["role"] for c in contents] == ["user", "model", "user", "model", "user"]
+    assert contents[-1]["parts"] == ["next question"]
+
+
+def test_compaction_folds_whole_exchanges_and_keeps_recent_turns():
+    session = session_with(8)
+    assert session.turns_to_compact(budget=10_000, keep_turns=4) == []
+    folded = session.turns_to_compact(budget=session.tokens - 150, keep_turns=4)
+    assert len(folded) == 2
+    assert [t.role for t in folded] == ["user", "model"]
+    folded = session.turns_to_compact(budget=0, keep_turns=4)
+    assert folded == session.turns[:4]
+    session.apply_compaction(folded, "summary")
+    assert len(session.turns) == 4 and session.summary == "summary"
+
+
+def test_fallback_summary_is_bounded():
+    summary = fallback_summary("before", session_with(6).turns, max_tokens=50)
+    assert len(summary) <= 200
+    assert summary.endswith("x" * 10)
+
+
+def test_store_evicts_least_recently_used_and_expires_idle_sessions():
+    store = SessionStore(max_sessions=2)
+    a = store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    assert set(store.sessions) == {"a", "c"}
+    assert store.get("a") is a
+
+    store = SessionStore(ttl=-1)
+    a = store.get("a")
+    assert store.get("a") is not a
+    assert store.drop("a") and not store.drop("a")
@@ -0,0 +1,332 @@
+# gateway.py
+#
+# Shared Gemini gateway for the chatbot, nlp and legal report services. It
+# speaks the Gemini REST API, so a service only needs
+# GEMINI_API_ENDPOINT=http://<gateway>:8003 to route through it. The gateway:
+#   - holds the API key and enforces one requests/minute and tokens/minute
+#     budget (token buckets) for all services together,
+#   - coalesces identical in-flight generateContent calls into one upstream
+#     request (single-flight),
+#   - serves interactive traffic (chat, abuse analysis) before batch traffic
+#     (report generation), using the x-gateway-priority header,
+#   - exposes queue depth and bucket levels on /stats.
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import time
+
+import httpx
+from dotenv import load_dotenv
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+UPSTREAM_URL = os.getenv("GATEWAY_UPSTREAM", "https://generativelanguage.googleapis.com")
+REQUESTS_PER_MINUTE = float(os.getenv("GATEWAY_RPM", "15"))
+TOKENS_PER_MINUTE = float(os.getenv("GATEWAY_TPM", "1000000"))
+MAX_WAIT = float(os.getenv("GATEWAY_MAX_WAIT", "30"))
+MAX_QUEUE = int(os.getenv("GATEWAY_MAX_QUEUE", "500"))
+UPSTREAM_TIMEOUT = float(os.getenv("GATEWAY_UPSTREAM_TIMEOUT", "120"))
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+PRIORITY_NAMES = {v: k for k, v in PRIORITIES.items()}
+# Gemini bills an image at a flat 258 tokens
+IMAGE_TOKENS = 258
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it already is)."""
+        self.refill()
+        # Requests larger than the whole bucket are let through once it is full.
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.refill()
+        self.level -= amount
+
+    def adjust(self, delta: float) -> None:
+        """Corrects an earlier estimate once the real usage is known."""
+        self.refill()
+        self.level = min(self.capacity, self.level - delta)
+
+
+class GatewayBusy(Exception):
+    pass
+
+
+class Scheduler:
+    """
+    Priority admission queue in front of the token buckets. Waiters are served
+    strictly by (priority, arrival order): a batch request never overtakes a
+    queued interactive one. A queue entry is a mutable
+    [priority, arrival, tokens, future] list, so a waiting request can be
+    promoted (see promote).
+    """
+
+    def __init__(self, rpm: float, tpm: float, max_queue: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_queue = max_queue
+        self.heap = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def depth(self) -> dict:
+        depth = {name: 0 for name in PRIORITIES}
+        for priority, _, _, future in self.heap:
+            if not future.done():
+                depth[PRIORITY_NAMES[priority]] += 1
+        return depth
+
+    def entry(self, priority: int, tokens: int) -> list:
+        """A place in the queue for acquire(); its arrival order is fixed now."""
+        return [priority, next(self.counter), tokens, None]
+
+    def promote(self, entry: list, priority: int) -> None:
+        """Raises an entry to `priority` if that is better, whether or not it is queued yet."""
+        if priority >= entry[0]:
+            return
+        entry[0] = priority
+        if entry[3] is not None and not entry[3].done():
+            heapq.heapify(self.heap)
+            self.wakeup.set()
+
+    def _prune(self) -> None:
+        # Waiters that timed out or disconnected are otherwise only dropped
+        # once they reach the top of the heap.
+        self.heap = [entry for entry in self.heap if not entry[3].done()]
+        heapq.heapify(self.heap)
+
+    async def acquire(self, entry: list, timeout: float) -> None:
+        if len(self.heap) >= self.max_queue:
+            self._prune()
+            if len(self.heap) >= self.max_queue:
+                raise GatewayBusy("Gateway queue is full")
+        if self.task is None:
+            self.task = asyncio.create_task(self._dispatch())
+        future = entry[3] = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.heap, entry)
+        self.wakeup.set()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise GatewayBusy("Timed out waiting for rate limit budget")
+
+    async def _dispatch(self) -> None:
+        while True:
+            # Drop waiters that gave up.
+            while self.heap and self.heap[0][3].done():
+                heapq.heappop(self.heap)
+            if not self.heap:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            _, _, tokens, future = self.heap[0]
+            delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if delay > 0:
+                # Sleep until the budget refills, but re-check if a higher
+                # priority request arrives in the meantime.
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self.heap)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        self.requests.refill()
+        self.tokens.refill()
+        return {
+            "queue_depth": self.depth(),
+            "requests_available": round(self.requests.level, 2),
+            "tokens_available": round(self.tokens.level),
+        }
+
+
+def estimate_tokens(body: dict) -> int:
+    chars, images = 0, 0
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                chars += len(part["text"])
+            elif "inlineData" in part:
+                images += 1
+    for part in (body.get("systemInstruction") or {}).get("parts", []):
+        chars += len(part.get("text", ""))
+    # Reserve room for the answer too; corrected from usageMetadata later.
+    max_output = (body.get("generationConfig") or {}).get("maxOutputTokens", 1024)
+    return chars // 4 + images * IMAGE_TOKENS + max_output
+
+
+scheduler = Scheduler(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE, MAX_QUEUE)
+client = httpx.AsyncClient(base_url=UPSTREAM_URL, timeout=UPSTREAM_TIMEOUT)
+# generateContent calls currently queued or running upstream, keyed by request
+# hash, as (task, queue entry)
+inflight = {}
+counters = {"upstream_calls": 0, "coalesced": 0, "rejected": 0, "upstream_errors": 0}
+
+app = FastAPI()
+
+
+def busy_response(detail: str) -> JSONResponse:
+    counters["rejected"] += 1
+    return JSONResponse(
+        status_code=429,
+        content={"error": {"code": 429, "message": detail, "status": "RESOURCE_EXHAUSTED"}},
+        headers={"Retry-After": "5"},
+    )
+
+
+def upstream_headers() -> dict:
+    return {"x-goog-api-key": GEMINI_API_KEY or "", "content-type": "application/json"}
+
+
+def settle_usage(estimated: int, payload: bytes) -> None:
+    try:
+        usage = json.loads(payload).get("usageMetadata", {})
+    except (ValueError, AttributeError):
+        return
+    actual = usage.get("totalTokenCount")
+    if actual is not None:
+        scheduler.tokens.adjust(actual - estimated)
+
+
+def error_result(status: int, message: str, code: str) -> tuple:
+    payload = {"error": {"code": status, "message": message, "status": code}}
+    return status, "application/json", json.dumps(payload).encode()
+
+
+async def forward(path: str, params, raw: bytes, entry: list, estimated: int) -> tuple:
+    """Waits for rate-limit budget, then makes one upstream generateContent call."""
+    try:
+        await scheduler.acquire(entry, MAX_WAIT)
+    except GatewayBusy as e:
+        counters["rejected"] += 1
+        return error_result(429, str(e), "RESOURCE_EXHAUSTED")
+
+    counters["upstream_calls"] += 1
+    try:
+        response = await client.post(path, params=params, content=raw, headers=upstream_headers())
+    except httpx.HTTPError as e:
+        counters["upstream_errors"] += 1
+        return error_result(502, f"Upstream call failed: {e}", "UNAVAILABLE")
+    if response.status_code >= 400:
+        counters["upstream_errors"] += 1
+    else:
+        settle_usage(estimated, response.content)
+    return response.status_code, response.headers.get("content-type", "application/json"), response.content
+
+
+@app.post("/{version}/models/{model_method}")
+async def models(version: str, model_method: str, request: Request):
+    _, _, method = model_method.partition(":")
+    raw = await request.body()
+    try:
+        body = json.loads(raw or b"{}")
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": {"code": 400, "message": "Invalid JSON body"}})
+
+    path = f"/{version}/models/{model_method}"
+    # The caller's (dummy) key is replaced by the gateway's own.
+    params = {k: v for k, v in request.query_params.items() if k != "key"}
+
+    if method == "countTokens":
+        response = await client.post(path, params=params, content=raw, headers=upstream_headers())
+        return Response(response.content, status_code=response.status_code,
+                        media_type=response.headers.get("content-type"))
+
+    priority = PRIORITIES.get(request.headers.get("x-gateway-priority", "interactive"), 0)
+    estimated = estimate_tokens(body)
+
+    if method == "generateContent":
+        key = hashlib.sha256(path.encode() + b"\0" + raw).hexdigest()
+        shared = inflight.get(key)
+        if shared is None:
+            # The upstream call runs as its own task so that one caller
+            # disconnecting does not cancel it for the others sharing it.
+            entry = scheduler.entry(priority, estimated)
+            task = asyncio.create_task(forward(path, params, raw, entry, estimated))
+            inflight[key] = task, entry
+            task.add_done_callback(lambda _: inflight.pop(key, None))
+        else:
+            task, entry = shared
+            counters["coalesced"] += 1
+            # An interactive caller joining a queued batch call must not wait
+            # at batch priority.
+            scheduler.promote(entry, priority)
+        status, media_type, payload = await asyncio.shield(task)
+        headers = {"Retry-After": "5"} if status == 429 else None
+        return Response(payload, status_code=status, media_type=media_type, headers=headers)
+
+    # Streaming and other calls are rate limited but not coalesced.
+    try:
+        await scheduler.acquire(scheduler.entry(priority, estimated), MAX_WAIT)
+    except GatewayBusy as e:
+        return busy_response(str(e))
+
+    counters["upstream_calls"] += 1
+    upstream_request = client.build_request("POST", path, params=params, content=raw, headers=upstream_headers())
+    try:
+        upstream = await client.send(upstream_request, stream=True)
+    except httpx.HTTPError as e:
+        counters["upstream_errors"] += 1
+        status, media_type, payload = error_result(502, f"Upstream call failed: {e}", "UNAVAILABLE")
+        return Response(payload, status_code=status, media_type=media_type)
+
+    async def relay():
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            # Closing the upstream response when the caller disconnects
+            # stops the generation early.
+            await upstream.aclose()
+
+    return StreamingResponse(relay(), status_code=upstream.status_code,
+                             media_type=upstream.headers.get("content-type", "application/json"))
+
+
+@app.api_route("/{version}/cachedContents{rest:path}", methods=["GET", "POST", "PATCH", "DELETE"])
+async def cached_contents(version: str, rest: str, request: Request):
+    # Context-cache management is not rate limited, but must use the
+    # gateway's key: a cache only exists for the key that created it.
+    params = {k: v for k, v in request.query_params.items() if k != "key"}
+    try:
+        response = await client.request(request.method, f"/{version}/cachedContents{rest}", params=params,
+                                        content=await request.body(), headers=upstream_headers())
+    except httpx.HTTPError as e:
+        status, media_type, payload = error_result(502, f"Upstream call failed: {e}", "UNAVAILABLE")
+        return Response(payload, status_code=status, media_type=media_type)
+    return Response(response.content, status_code=response.status_code,
+                    media_type=response.headers.get("content-type", "application/json"))
+
+
+@app.get("/stats")
+async def stats():
+    return {**scheduler.stats(), **counters, "inflight_keys": len(inflight)}
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from gateway import PRIORITIES, GatewayBusy, Scheduler
+
+INTERACTIVE, BATCH = PRIORITIES["interactive"], PRIORITIES["batch"]
+
+
+def drained(rpm=1200, max_queue=10):
+    scheduler = Scheduler(rpm, 1_000_000, max_queue)
+    scheduler.requests.level = 0  # every waiter has to queue
+    return scheduler
+
+
+def test_waiters_that_gave_up_do_not_fill_the_queue():
+    async def main():
+        scheduler = drained(rpm=1, max_queue=3)
+        # A live waiter at the top keeps the dispatcher from popping the others.
+        live = asyncio.create_task(scheduler.acquire(scheduler.entry(INTERACTIVE, 1), 5))
+        await asyncio.sleep(0)
+        for _ in range(2):
+            with pytest.raises(GatewayBusy, match="Timed out"):
+                await scheduler.acquire(scheduler.entry(BATCH, 1), 0.01)
+        assert len(scheduler.heap) == 3  # still in the heap, but nobody waits on them
+        with pytest.raises(GatewayBusy, match="Timed out"):
+            await scheduler.acquire(scheduler.entry(BATCH, 1), 0.01)
+        assert scheduler.depth() == {"interactive": 1, "batch": 0}
+        live.cancel()
+
+    asyncio.run(main())
+
+
+def test_full_queue_is_rejected():
+    async def main():
+        scheduler = drained(rpm=1, max_queue=1)
+        waiter = asyncio.create_task(scheduler.acquire(scheduler.entry(BATCH, 1), 5))
+        await asyncio.sleep(0)
+        with pytest.raises(GatewayBusy, match="full"):
+            await scheduler.acquire(scheduler.entry(BATCH, 1), 5)
+        waiter.cancel()
+
+    asyncio.run(main())
+
+
+def test_promoted_entry_is_served_before_earlier_batch_work():
+    async def main():
+        scheduler = drained()
+        served = []
+
+        async def wait(name, entry):
+            await scheduler.acquire(entry, 5)
+            served.append(name)
+
+        first, second = scheduler.entry(BATCH, 1), scheduler.entry(BATCH, 1)
+        tasks = [asyncio.create_task(wait("first", first)), asyncio.create_task(wait("second", second))]
+        await asyncio.sleep(0)
+        scheduler.promote(second, INTERACTIVE)
+        scheduler.promote(first, BATCH)  # never demotes
+        assert scheduler.depth() == {"interactive": 1, "batch": 1}
+        await asyncio.gather(*tasks)
+        assert served == ["second", "first"]
+
+    asyncio.run(main())
+
+
+def test_promotion_before_queueing_is_kept():
+    scheduler = Scheduler(60, 1000, 10)
+    entry = scheduler.entry(BATCH, 1)
+    scheduler.promote(entry, INTERACTIVE)
+    assert entry[0] == INTERACTIVE
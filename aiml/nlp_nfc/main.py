@@ -1,18 +1,126 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import ORJSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from dotenv import load_dotenv
 import google.generativeai as genai
-from PIL import Image
-import io
+from google.api_core import exceptions as google_exceptions
+from PIL import UnidentifiedImageError
+from starlette.formparsers import MultiPartParser
+import asyncio
+import functools
+import math
 import os
 import json
+import time
+import zipfile
+import orjson
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List
+from phash_cache import VerdictCache
+from preprocess import MIME_TYPES, ImageTooLarge, PreprocessStats, prepare_image
+from prefilter import SAFE, Prefilter, safe_verdict
+from resilience import CircuitBreaker, CircuitOpen, InvalidOutput, first_valid
+from uploads import BodySizeLimit, upload_size
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini with API key
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Configure Gemini with API key. GEMINI_API_ENDPOINT points the SDK at a
+# Gemini-compatible REST endpoint instead: the shared gateway
+# (aiml/gemini_gateway) or the fake server in loadtest/.
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+if GEMINI_API_ENDPOINT:
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport="rest",
+                    client_options={"api_endpoint": GEMINI_API_ENDPOINT},
+                    default_metadata=[("x-gateway-priority", "interactive")])
+else:
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+# Gemini concurrency limits (per worker process)
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "16"))
+GEMINI_MAX_QUEUE = int(os.getenv("GEMINI_MAX_QUEUE", "64"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "10"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+GEMINI_RETRY_AFTER = os.getenv("GEMINI_RETRY_AFTER", "5")
+
+GEMINI_MODEL_NAME = "gemini-1.5-flash"
+# Warm-up is an optional background probe; startup never waits on the network
+GEMINI_WARMUP = os.getenv("GEMINI_WARMUP", "0") == "1"
+# /readyz re-probes the backend at most this often (seconds)
+READY_PROBE_TTL = float(os.getenv("READY_PROBE_TTL", "30"))
+# /readyz reports not ready when recent p95 Gemini latency exceeds this (ms, 0 = off)
+READY_MAX_P95_MS = float(os.getenv("READY_MAX_P95_MS", "0"))
+
+# Verdicts for previously seen screenshots (perceptual hash, confirmed on a detail thumbnail)
+verdict_cache = VerdictCache(
+    path=os.getenv("PHASH_CACHE_DB", "phash_cache.db"),
+    max_entries=int(os.getenv("PHASH_CACHE_MAX_ENTRIES", "50000")),
+    max_distance=int(os.getenv("PHASH_MAX_DISTANCE", "6")),
+    ttl=float(os.getenv("PHASH_CACHE_TTL", str(30 * 24 * 3600))),
+    algorithm=os.getenv("PHASH_ALGORITHM", "dhash"),
+    detail_tolerance=int(os.getenv("PHASH_DETAIL_TOLERANCE", "16")),
+)
+
+# Uploads are downscaled and re-encoded before being sent to Gemini
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1600"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+if IMAGE_FORMAT not in MIME_TYPES:
+    raise ValueError(f"IMAGE_FORMAT must be one of {', '.join(MIME_TYPES)}, not {IMAGE_FORMAT!r}")
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+# Images whose header declares more pixels than this are refused undecoded
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "40000000"))
+preprocess_stats = PreprocessStats()
+
+# Upload limits: larger request bodies are cut off with 413 while streaming,
+# and file parts above UPLOAD_SPOOL_BYTES are spooled to disk, not memory.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+MultiPartParser.spool_max_size = UPLOAD_SPOOL_BYTES
+
+
+def prepare_upload(source):
+    """
+    Decodes and shrinks an upload and computes its cache key (CPU-bound).
+    `source` is bytes, a spooled file, or a callable returning either (a zip
+    entry that is only decompressed when its turn comes).
+    """
+    if callable(source):
+        source = source()
+    prepared = prepare_image(source, IMAGE_MAX_SIDE, IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_MAX_PIXELS)
+    preprocess_stats.record(prepared)
+    return prepared, verdict_cache.image_key(prepared.image)
+
+
+# Local pre-filter that answers clearly safe images without calling Gemini
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "1") == "1"
+prefilter = Prefilter(
+    lexicon_path=os.getenv("PREFILTER_LEXICON", os.path.join(os.path.dirname(__file__), "abuse_lexicon.txt")),
+    min_words=int(os.getenv("PREFILTER_MIN_WORDS", "8")),
+    min_ocr_confidence=float(os.getenv("PREFILTER_MIN_OCR_CONFIDENCE", "75")),
+    blank_std=float(os.getenv("PREFILTER_BLANK_STD", "3")),
+)
+
+# A second Gemini request is sent when the first reply does not parse, or
+# (as a hedge) when it has not arrived after ABUSE_HEDGE_AFTER seconds (0 = off)
+ABUSE_HEDGE_AFTER = float(os.getenv("ABUSE_HEDGE_AFTER", "8"))
+ABUSE_MAX_ATTEMPTS = int(os.getenv("ABUSE_MAX_ATTEMPTS", "2"))
+# After BREAKER_FAILURES consecutive upstream failures, fail fast for BREAKER_RESET seconds
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("BREAKER_RESET", "30")),
+)
+abuse_stats = {}
+
+# Batch analysis limits
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_ZIP_BYTES = int(os.getenv("BATCH_MAX_ZIP_BYTES", str(200 * 1024 * 1024)))
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+IMAGE_TYPES = ("image/jpeg", "image/png", "image/gif")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif")
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
 
 # Define allowed origins (for React frontend)
 origins = [
@@ -20,8 +128,20 @@ origins = [
     "http://127.0.0.1:3000"
 ]
 
+@asynccontextmanager
+async def lifespan(app):
+    if GEMINI_WARMUP:
+        refresh_backend_status()
+    yield
+
+
 # Initialize FastAPI app
-app = FastAPI(default_response_class=ORJSONResponse)
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+
+# Middleware added last runs first: CORS wraps the size limit, so its 413
+# responses carry CORS headers and browsers can read them.
+app.add_middleware(BodySizeLimit, max_bytes=UPLOAD_MAX_BYTES,
+                   path_limits={"/analyze-abuse/batch/": BATCH_MAX_UPLOAD_BYTES})
 
 # Apply CORS middleware
 app.add_middleware(
@@ -32,13 +152,115 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-model = genai.GenerativeModel(model_name="gemini-1.5-flash")
+_model = None
+
+
+def get_model():
+    """Builds the Gemini model client on first use."""
+    global _model
+    if _model is None:
+        _model = genai.GenerativeModel(model_name=GEMINI_MODEL_NAME)
+    return _model
+
+
+class GeminiPool:
+    """
+    Runs the blocking Gemini SDK calls on a bounded thread pool so they never
+    block the event loop. At most `max_in_flight` calls run at once and at most
+    `max_queue` requests wait for a slot; anything beyond that is rejected
+    with 429, and requests that wait longer than `queue_timeout` get 503.
+    """
+
+    def __init__(self, max_in_flight, max_queue, queue_timeout, timeout):
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="gemini")
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        # Durations of recent successful calls, for /readyz
+        self.latencies = deque(maxlen=200)
+
+    def _busy(self, status_code, detail):
+        return HTTPException(status_code=status_code, detail=detail,
+                             headers={"Retry-After": GEMINI_RETRY_AFTER})
+
+    async def acquire(self):
+        if not self.slots.locked():
+            await self.slots.acquire()
+            self.in_flight += 1
+            return
+        if self.waiting >= self.max_queue:
+            raise self._busy(429, "Too many images in progress, please retry shortly.")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._busy(503, "Analysis service is busy, please retry shortly.")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self, *_):
+        self.in_flight -= 1
+        self.slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        await self.acquire()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        # Keep the slot until the thread really finishes, even after a timeout.
+        future.add_done_callback(self.release)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Gemini did not respond in time.")
+        self.latencies.append(time.perf_counter() - started)
+        return result
+
+    def p95_ms(self):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 1)
+
+    def stats(self):
+        return {"in_flight": self.in_flight, "waiting": self.waiting, "p95_ms": self.p95_ms()}
+
+
+gemini_pool = GeminiPool(GEMINI_MAX_IN_FLIGHT, GEMINI_MAX_QUEUE, GEMINI_QUEUE_TIMEOUT, GEMINI_TIMEOUT)
+
+# Result of the last backend probe, shared by warm-up and /readyz
+backend_status = {"reachable": False, "checked_at": 0.0, "error": "not checked yet"}
+# The probe currently running, if any
+backend_probe = None
+
+
+async def probe_backend():
+    """
+    Checks that Gemini is reachable with a countTokens call, which needs no
+    generation quota, and builds the model client if it does not exist yet.
+    """
+    try:
+        await gemini_pool.run(get_model().count_tokens, "ping", request_options={"timeout": 10})
+        backend_status.update(reachable=True, error=None)
+    except HTTPException as he:
+        # A full pool (429/503) says nothing about Gemini: keep the last answer.
+        if he.status_code not in (429, 503):
+            backend_status.update(reachable=False, error=he.detail)
+    except Exception as e:
+        backend_status.update(reachable=False, error=str(e))
+    backend_status["checked_at"] = time.time()
+    return backend_status["reachable"]
 
-try:
-    test_response = model.generate_content("Give 3 ideas for a tech hackathon")
-    print("Gemini Test:", test_response.text)
-except Exception as e:
-    print("Gemini Test Failed:", str(e))
+
+def refresh_backend_status() -> None:
+    """Starts a probe in the background unless one is already running."""
+    global backend_probe
+    if backend_probe is None or backend_probe.done():
+        backend_probe = asyncio.create_task(probe_backend())
 
 
 @app.get("/")
@@ -46,22 +268,46 @@ async def root():
     return {"message": "FastAPI + Gemini is running"}
 
 
-@app.post("/analyze-abuse/")
-async def analyze_image_for_abuse(file: UploadFile = File(...)):
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz():
     """
-    Analyzes an uploaded image for abusive content using the Gemini Vision API.
-    Returns a structured JSON response indicating if abuse was found, the type,
-    and a brief analysis.
+    Readiness: Gemini is reachable and recent latency is acceptable. Answers
+    from the last probe at once; a stale result only triggers a new probe in
+    the background, so a busy pool cannot make this outlast the caller's
+    probe timeout.
     """
-    try:
-        if file.content_type not in ["image/jpeg", "image/png", "image/gif"]:
-            raise HTTPException(status_code=400, detail="Only JPEG, PNG, and GIF images are supported.")
+    if time.time() - backend_status["checked_at"] > READY_PROBE_TTL:
+        refresh_backend_status()
+    p95 = gemini_pool.p95_ms()
+    ready = backend_status["reachable"]
+    reason = backend_status["error"]
+    if ready and READY_MAX_P95_MS and p95 is not None and p95 > READY_MAX_P95_MS:
+        ready, reason = False, f"p95 latency {p95}ms above {READY_MAX_P95_MS}ms"
+    if ready and breaker.state == "open":
+        ready, reason = False, "circuit breaker is open"
+    body = {"ready": ready, "p95_ms": p95, "in_flight": gemini_pool.in_flight, "reason": reason}
+    return ORJSONResponse(content=body, status_code=200 if ready else 503)
+
 
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+@app.get("/stats")
+async def stats():
+    return {
+        "gemini": gemini_pool.stats(),
+        "verdict_cache": verdict_cache.info(),
+        "preprocess": preprocess_stats.info(),
+        "prefilter": prefilter.info(),
+        "abuse": {**abuse_stats, "breaker": breaker.info()},
+    }
 
-        # The improved core prompt for Gemini Vision with explicit keywords
-        prompt = (
+
+# The improved core prompt for Gemini Vision with explicit keywords
+ABUSE_PROMPT = (
     "You are a highly accurate and professional content analysis system for identifying workplace harassment cases, especially under POSH (Prevention of Sexual Harassment) guidelines in India. "
     "Your task is to analyze the following user-submitted content, which may describe a real incident of inappropriate behavior, verbal abuse, or harassment. "
     "Use Natural Language Processing to identify the presence and type of harassment. "
@@ -69,52 +315,273 @@ async def analyze_image_for_abuse(file: UploadFile = File(...)):
 
     "The JSON must have the following fields:\n"
     "1. is_abusive: true/false — Whether harassment or abuse is present\n"
-    "2. abuse_type: One of ['Sexual Harassment', 'Verbal Abuse', 'Hate Speech', 'Threats', 'Cyberbullying', 'Safe']\n"
-    "3. keywords: A list of offensive or sensitive words found (e.g., ['bitch', 'fuck'])\n"
+    "2. abuse_type: One of \"Sexual Harassment\", \"Verbal Abuse\", \"Hate Speech\", \"Threats\", \"Cyberbullying\", \"Safe\"\n"
+    "3. keywords: A list of offensive or sensitive words found (e.g., [\"bitch\", \"fuck\"])\n"
     "4. analysis: A formal explanation of why it is considered abusive or not\n"
     "5. suggested_action: Recommended next step (e.g., 'File a POSH complaint', 'Flag for review', 'No action needed')\n"
 
     "Here is an example of a valid response if abuse is found:\n"
     "{\n"
-    "  'is_abusive': true,\n"
-    "  'abuse_type': 'Sexual Harassment',\n"
-    "  'keywords': ['touching', 'uncomfortable'],\n"
-    "  'analysis': 'The message describes a workplace incident where inappropriate physical behavior occurred.',\n"
-    "  'suggested_action': 'File a POSH complaint'\n"
+    "  \"is_abusive\": true,\n"
+    "  \"abuse_type\": \"Sexual Harassment\",\n"
+    "  \"keywords\": [\"touching\", \"uncomfortable\"],\n"
+    "  \"analysis\": \"The message describes a workplace incident where inappropriate physical behavior occurred.\",\n"
+    "  \"suggested_action\": \"File a POSH complaint\"\n"
     "}\n"
 
     "If no abuse is detected, respond like:\n"
     "{\n"
-    "  'is_abusive': false,\n"
-    "  'abuse_type': 'Safe',\n"
-    "  'keywords': [],\n"
-    "  'analysis': 'No abusive, harassing, or offensive language was found.',\n"
-    "  'suggested_action': 'No action needed'\n"
+    "  \"is_abusive\": false,\n"
+    "  \"abuse_type\": \"Safe\",\n"
+    "  \"keywords\": [],\n"
+    "  \"analysis\": \"No abusive, harassing, or offensive language was found.\",\n"
+    "  \"suggested_action\": \"No action needed\"\n"
     "}\n"
 
     "Now analyze this input and return your JSON response only, without any explanation or extra text.\n\n"
     "User Content:\n"
 )
 
-        # Generate content with the structured prompt
-        response = model.generate_content([prompt, image])
-        
-        gemini_text = response.text
-        # Clean the response string by removing Markdown fences if they exist
-        if gemini_text.strip().startswith('```json') and gemini_text.strip().endswith('```'):
-            gemini_text = gemini_text.strip()[7:-3].strip()
+ABUSE_TYPES = ("Sexual Harassment", "Verbal Abuse", "Hate Speech", "Threats", "Cyberbullying", "Safe")
+ABUSE_FIELD_TYPES = {"is_abusive": bool, "abuse_type": str, "keywords": list, "analysis": str, "suggested_action": str}
+
+# Gemini is constrained to this schema, so replies are bare JSON with exactly
+# the five fields documented in ABUSE_PROMPT.
+ABUSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "is_abusive": {"type": "boolean"},
+        "abuse_type": {"type": "string", "format": "enum", "enum": list(ABUSE_TYPES)},
+        "keywords": {"type": "array", "items": {"type": "string"}},
+        "analysis": {"type": "string"},
+        "suggested_action": {"type": "string"},
+    },
+    "required": list(ABUSE_FIELD_TYPES),
+}
+
+
+def parse_verdict(text: str) -> dict:
+    """Parses and validates a Gemini reply; raises InvalidOutput if it is not a verdict."""
+    text = text.strip()
+    # Schema-constrained replies have no fences, but tolerate them anyway.
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        verdict = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise InvalidOutput(f"Reply is not JSON: {e}", text)
+    if not isinstance(verdict, dict):
+        raise InvalidOutput("Reply is not a JSON object", text)
+    for field, kind in ABUSE_FIELD_TYPES.items():
+        if not isinstance(verdict.get(field), kind):
+            raise InvalidOutput(f"Field {field!r} is missing or not a {kind.__name__}", text)
+    if verdict["abuse_type"] not in ABUSE_TYPES:
+        raise InvalidOutput(f"Unknown abuse_type {verdict['abuse_type']!r}", text)
+    if not all(isinstance(k, str) for k in verdict["keywords"]):
+        raise InvalidOutput("keywords must be strings", text)
+    return verdict
+
+
+# The SDK would otherwise retry 503s on its own for up to 10 minutes; retries
+# are decided by classify_image() and the circuit breaker instead.
+ABUSE_REQUEST_OPTIONS = {"timeout": GEMINI_TIMEOUT, "retry": None}
+
+
+def abuse_generation_config(attempt: int) -> dict:
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": ABUSE_SCHEMA,
+        # Later attempts sample a little, so a retry is not a replay of the
+        # reply that failed (and the gateway does not coalesce a hedge with it).
+        "temperature": 0.0 if attempt == 0 else 0.4,
+    }
+
+
+# Errors that say Gemini itself is down or overloaded. Client errors such as
+# InvalidArgument for one bad upload must not open the breaker for everyone.
+UPSTREAM_FAILURES = (
+    google_exceptions.ServerError,  # 5xx, including ServiceUnavailable and DeadlineExceeded
+    google_exceptions.TooManyRequests,  # and ResourceExhausted
+    asyncio.TimeoutError,
+)
+
+
+def is_upstream_failure(error: Exception) -> bool:
+    """Whether an error counts against the circuit breaker."""
+    if isinstance(error, HTTPException):
+        # Local 429/503 rejections say nothing about Gemini; a 504 does.
+        return error.status_code == 504
+    return isinstance(error, UPSTREAM_FAILURES)
 
+
+async def classify_image(prepared) -> dict:
+    """
+    Gets a validated verdict from Gemini: one request, plus at most one retry
+    on invalid output or one hedge past the latency deadline.
+    """
+    attempts = iter(range(ABUSE_MAX_ATTEMPTS))
+
+    async def attempt():
+        config = abuse_generation_config(next(attempts))
         try:
-            # Use json.loads() for safe and proper parsing of the JSON string
-            gemini_output = json.loads(gemini_text)
-        except json.JSONDecodeError:
-            # Fallback for unexpected or malformed responses
-            gemini_output = {"is_abusive": False, "abuse_type": "Uncertain", "analysis": response.text}
-        
-        return {"gemini_output": gemini_output}
+            response = await breaker.call(
+                lambda: gemini_pool.run(
+                    get_model().generate_content, [ABUSE_PROMPT, prepared.blob],
+                    generation_config=config, request_options=ABUSE_REQUEST_OPTIONS,
+                ),
+                is_failure=is_upstream_failure,
+            )
+        except CircuitOpen as e:
+            raise HTTPException(status_code=503, detail="Analysis service is temporarily unavailable.",
+                                headers={"Retry-After": str(math.ceil(e.retry_after))})
+        return parse_verdict(response.text)
+
+    return await first_valid(
+        attempt, ABUSE_HEDGE_AFTER, ABUSE_MAX_ATTEMPTS, abuse_stats,
+        can_hedge=lambda: not gemini_pool.slots.locked(),
+    )
+
+
+def too_large(detail: str) -> HTTPException:
+    return HTTPException(status_code=413, detail=detail)
+
+
+async def analyze_image(source) -> dict:
+    """
+    Runs one image through the cache and the Gemini Vision path. Returns the
+    JSON body of a successful analysis; raises HTTPException on failure.
+    """
+    # Decoding, resizing and hashing happen off the event loop
+    try:
+        prepared, image_key = await asyncio.to_thread(prepare_upload, source)
+    except UnidentifiedImageError:
+        raise HTTPException(status_code=400, detail="File is not a readable image.")
+    except ImageTooLarge as e:
+        raise too_large(str(e))
+    # The cache reads and writes SQLite; keep that off the event loop too
+    cached = await asyncio.to_thread(verdict_cache.lookup, image_key)
+    if cached is not None:
+        return {"gemini_output": cached, "cached": True}
+
+    if PREFILTER_ENABLED:
+        screen = await asyncio.to_thread(prefilter.prescreen, prepared.image)
+        if screen.decision == SAFE:
+            # A heuristic answer is not cached: only model verdicts are reused
+            return {"gemini_output": safe_verdict(screen), "prefiltered": True}
+
+    try:
+        gemini_output = await classify_image(prepared)
+        await asyncio.to_thread(verdict_cache.store, image_key, gemini_output)
+    except InvalidOutput as e:
+        # Every attempt came back malformed; report it without caching it
+        gemini_output = {"is_abusive": False, "abuse_type": "Uncertain", "analysis": e.raw_text}
+
+    return {"gemini_output": gemini_output}
+
+
+@app.post("/analyze-abuse/")
+async def analyze_image_for_abuse(file: UploadFile = File(...)):
+    """
+    Analyzes an uploaded image for abusive content using the Gemini Vision API.
+    Returns a structured JSON response indicating if abuse was found, the type,
+    and a brief analysis.
+    """
+    try:
+        if file.content_type not in ["image/jpeg", "image/png", "image/gif"]:
+            raise HTTPException(status_code=400, detail="Only JPEG, PNG, and GIF images are supported.")
+
+        # The upload stays in its spooled file; it is never read into memory whole.
+        if upload_size(file.file) > UPLOAD_MAX_BYTES:
+            raise too_large(f"Images may be at most {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.")
+        return await analyze_image(file.file)
 
     except HTTPException as he:
-        return ORJSONResponse(content={"error": he.detail}, status_code=he.status_code)
+        return ORJSONResponse(content={"error": he.detail}, status_code=he.status_code, headers=he.headers)
     except Exception as e:
         print(f"Error processing image: {e}")
-        return ORJSONResponse(content={"error": f"An error occurred: {e}"}, status_code=500)
\ No newline at end of file
+        return ORJSONResponse(content={"error": f"An error occurred: {e}"}, status_code=500)
+
+
+def expand_uploads(uploads):
+    """
+    Turns (filename, content_type, file) uploads into a list of (name, source)
+    images, unpacking zip archives. Zip entries become loaders that decompress
+    the entry on demand. Oversized archives or images and unsupported entries
+    are reported as per-item errors.
+    """
+    items = []
+    oversized = too_large(f"Images may be at most {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.")
+    for filename, content_type, file in uploads:
+        if content_type in ZIP_TYPES or filename.lower().endswith(".zip"):
+            try:
+                archive = zipfile.ZipFile(file)
+            except zipfile.BadZipFile:
+                items.append((filename, HTTPException(status_code=400, detail="Corrupt zip archive.")))
+                continue
+            entries = [
+                info for info in archive.infolist()
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+            # Guard against zip bombs before decompressing anything.
+            if sum(info.file_size for info in entries) > BATCH_MAX_ZIP_BYTES:
+                items.append((filename, too_large("Zip archive expands beyond the size limit.")))
+                continue
+            for info in entries:
+                name = f"{filename}/{info.filename}"
+                if info.file_size > UPLOAD_MAX_BYTES:
+                    items.append((name, oversized))
+                else:
+                    items.append((name, functools.partial(archive.read, info)))
+        elif content_type in IMAGE_TYPES:
+            items.append((filename, oversized if upload_size(file) > UPLOAD_MAX_BYTES else file))
+        else:
+            items.append((filename, HTTPException(status_code=400, detail="Only JPEG, PNG, GIF and zip files are supported.")))
+    return items
+
+
+@app.post("/analyze-abuse/batch/")
+async def analyze_batch_for_abuse(files: List[UploadFile] = File(...)):
+    """
+    Analyzes many screenshots (or zip archives of them) in one request.
+    Results stream back as NDJSON, one line per image in completion order:
+    {"index", "filename", "gemini_output"} or {"index", "filename", "error", "status"},
+    followed by a final {"done": true, ...} summary line. A failing image
+    never fails the rest of the batch.
+    """
+    uploads = [(f.filename or f"file{i}", f.content_type, f.file) for i, f in enumerate(files)]
+    items = await asyncio.to_thread(expand_uploads, uploads)
+    if len(items) > BATCH_MAX_FILES:
+        return ORJSONResponse(
+            content={"error": f"A batch may contain at most {BATCH_MAX_FILES} images."}, status_code=413
+        )
+
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_item(index, name, source):
+        line = {"index": index, "filename": name}
+        if isinstance(source, HTTPException):
+            return {**line, "error": source.detail, "status": source.status_code}
+        async with limit:
+            try:
+                return {**line, **await analyze_image(source)}
+            except HTTPException as he:
+                return {**line, "error": he.detail, "status": he.status_code}
+            except Exception as e:
+                print(f"Error processing image {name}: {e}")
+                return {**line, "error": f"An error occurred: {e}", "status": 500}
+
+    async def results():
+        tasks = [asyncio.create_task(run_item(i, name, source)) for i, (name, source) in enumerate(items)]
+        errors = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                errors += "error" in line
+                yield orjson.dumps(line) + b"\n"
+            yield orjson.dumps({"done": True, "total": len(items), "errors": errors}) + b"\n"
+        finally:
+            # Client went away: stop the images that have not started yet.
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
@@ -0,0 +1,230 @@
+"""
+Perceptual-hash cache of abuse verdicts.
+
+The same screenshot tends to be uploaded again, often re-compressed or
+resized by a messenger on the way. A 64-bit perceptual hash finds stored
+images that look alike, but it cannot see text: two chat screenshots with
+the same bubble layout and different wording hash within a few bits of each
+other. A perceptual match is therefore only a candidate. It is confirmed on
+a detail thumbnail: the image is resampled to a fixed canvas and averaged
+into small cells, where re-encoding and rescaling move a cell by a few gray
+levels but a changed word moves the cells it covers by far more. An image
+whose cells are not all within `detail_tolerance` of a candidate's is a
+miss; a copy shrunk so far that its text blurs is a miss too, which only
+costs a model call.
+
+Verdicts are persisted in SQLite. The hashes are also kept in NumPy arrays
+so finding candidates is one vectorised XOR + popcount over all entries;
+detail thumbnails are read from SQLite for the few candidates only.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+from PIL import Image
+
+# Bit counts of every byte value, for NumPy builds without np.bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT[values.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int(np.packbits(bits.astype(np.uint8)).view(">u8")[0])
+
+
+def dhash(image: Image.Image) -> int:
+    """Difference hash: compares neighbouring pixels of a 9x8 grayscale thumbnail."""
+    small = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    return _bits_to_int((pixels[:, 1:] > pixels[:, :-1]).ravel())
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * n))
+    matrix[0] *= 1 / np.sqrt(2)
+    return matrix * np.sqrt(2 / n)
+
+
+_DCT32 = _dct_matrix(32)
+
+
+def phash(image: Image.Image) -> int:
+    """DCT hash: signs of the low-frequency 8x8 DCT block of a 32x32 thumbnail."""
+    small = image.convert("L").resize((32, 32), Image.Resampling.LANCZOS)
+    pixels = np.asarray(small, dtype=np.float64)
+    low = (_DCT32 @ pixels @ _DCT32.T)[:8, :8]
+    # The DC term says nothing about structure; compare against the median
+    # of the remaining coefficients.
+    median = np.median(low.ravel()[1:])
+    return _bits_to_int((low > median).ravel())
+
+
+HASHERS = {"dhash": dhash, "phash": phash}
+
+
+# Detail thumbnails: resampled to DETAIL_CANVAS, then averaged into DETAIL_CELLS cells
+DETAIL_CANVAS = (256, 512)
+DETAIL_CELLS = (128, 256)
+# Blocks of detail cells averaged into the in-memory coarse thumbnail
+COARSE_BLOCK = 8
+
+
+def detail(image: Image.Image) -> np.ndarray:
+    """Grayscale cell means of the image on a fixed canvas, for confirming candidates."""
+    canvas = image.convert("L").resize(DETAIL_CANVAS, Image.Resampling.LANCZOS)
+    return np.asarray(canvas.resize(DETAIL_CELLS, Image.Resampling.BOX), dtype=np.uint8)
+
+
+def coarse(cells: np.ndarray) -> np.ndarray:
+    """Block means of a detail thumbnail, flattened. Cells that all agree within
+    a tolerance give block means that agree within it too (plus rounding)."""
+    rows, columns = cells.shape
+    blocks = cells.reshape(rows // COARSE_BLOCK, COARSE_BLOCK, columns // COARSE_BLOCK, COARSE_BLOCK)
+    return np.rint(blocks.mean(axis=(1, 3))).astype(np.uint8).ravel()
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class VerdictCache:
+    """
+    Persistent verdict store keyed by 64-bit perceptual hash and detail thumbnail.
+
+    `max_distance` is the largest Hamming distance for a candidate; a
+    candidate is a hit only if no detail cell differs by more than
+    `detail_tolerance` gray levels. Candidates are first narrowed down on
+    coarse thumbnails kept in memory; at most `max_candidates` of them, most
+    alike first, are then checked against the full thumbnail.
+    When more than `max_entries` verdicts are stored, the least recently used
+    10% are evicted; entries older than `ttl` seconds are ignored and purged.
+    """
+
+    def __init__(self, path="phash_cache.db", max_entries=50000, max_distance=6,
+                 ttl=30 * 24 * 3600, algorithm="dhash", detail_tolerance=16, max_candidates=8):
+        self.hasher = HASHERS[algorithm]
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.detail_tolerance = detail_tolerance
+        self.max_candidates = max_candidates
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            " id INTEGER PRIMARY KEY, hash INTEGER NOT NULL, verdict TEXT NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0,"
+            " detail BLOB)"
+        )
+        if "detail" not in {row[1] for row in self.db.execute("PRAGMA table_info(verdicts)")}:
+            # Verdicts stored without a detail thumbnail cannot be confirmed; they are not reused.
+            self.db.execute("ALTER TABLE verdicts ADD COLUMN detail BLOB")
+        self.db.execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts(last_used)")
+        self.db.commit()
+        self.stats = {"hits": 0, "misses": 0, "rejected": 0, "stored": 0, "evicted": 0}
+        self._load()
+
+    def image_key(self, image: Image.Image) -> tuple:
+        """(perceptual hash, detail thumbnail) of an image, for lookup() and store()."""
+        return self.hasher(image), detail(image)
+
+    def _load(self) -> None:
+        self.db.execute("DELETE FROM verdicts WHERE created < ?", (time.time() - self.ttl,))
+        self.db.commit()
+        self.db.execute("DELETE FROM verdicts WHERE detail IS NULL")
+        self.db.commit()
+        rows = self.db.execute("SELECT id, hash, created, detail FROM verdicts").fetchall()
+        self.ids = np.array([r[0] for r in rows], dtype=np.int64)
+        self.hashes = np.array([r[1] for r in rows], dtype=np.int64).view(np.uint64)
+        self.created = np.array([r[2] for r in rows], dtype=np.float64)
+        size = DETAIL_CELLS[0] * DETAIL_CELLS[1] // COARSE_BLOCK ** 2
+        self.coarse = np.array([self._coarse_of(r[3]) for r in rows], dtype=np.uint8).reshape(-1, size)
+
+    @staticmethod
+    def _coarse_of(blob: bytes) -> np.ndarray:
+        cells = np.frombuffer(zlib.decompress(blob), dtype=np.uint8).reshape(DETAIL_CELLS[::-1])
+        return coarse(cells)
+
+    def _confirmed(self, row_id: int, cells: np.ndarray) -> bool:
+        row = self.db.execute("SELECT detail FROM verdicts WHERE id = ?", (row_id,)).fetchone()
+        if row is None:
+            return False
+        stored = np.frombuffer(zlib.decompress(row[0]), dtype=np.uint8).reshape(cells.shape)
+        return int(np.abs(stored.astype(np.int16) - cells).max()) <= self.detail_tolerance
+
+    def lookup(self, key: tuple):
+        """Returns the verdict of the closest confirmed stored image within max_distance, else None."""
+        image_hash, cells = key
+        with self.lock:
+            if len(self.hashes):
+                distances = _popcount(self.hashes ^ np.uint64(image_hash))
+                distances[self.created < time.time() - self.ttl] = 65
+                candidates = np.flatnonzero(distances <= self.max_distance)
+                # Look-alikes with other text in the same layout are not the same image
+                offsets = np.abs(self.coarse[candidates].astype(np.int16) - coarse(cells)).max(axis=1)
+                close = offsets <= self.detail_tolerance + 1
+                self.stats["rejected"] += int(np.count_nonzero(~close))
+                candidates, offsets = candidates[close], offsets[close]
+                candidates = candidates[np.argsort(offsets, kind="stable")][:self.max_candidates]
+                for index in candidates:
+                    row_id = int(self.ids[index])
+                    if not self._confirmed(row_id, cells):
+                        self.stats["rejected"] += 1
+                        continue
+                    self.db.execute(
+                        "UPDATE verdicts SET last_used = ?, hits = hits + 1 WHERE id = ?",
+                        (time.time(), row_id),
+                    )
+                    self.db.commit()
+                    verdict = self.db.execute(
+                        "SELECT verdict FROM verdicts WHERE id = ?", (row_id,)
+                    ).fetchone()
+                    if verdict is not None:
+                        self.stats["hits"] += 1
+                        return json.loads(verdict[0])
+            self.stats["misses"] += 1
+            return None
+
+    def store(self, key: tuple, verdict: dict) -> None:
+        image_hash, cells = key
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO verdicts (hash, verdict, created, last_used, detail) VALUES (?, ?, ?, ?, ?)",
+                (_to_signed(image_hash), json.dumps(verdict), now, now, zlib.compress(cells.tobytes())),
+            )
+            self.db.commit()
+            self.ids = np.append(self.ids, cursor.lastrowid)
+            self.hashes = np.append(self.hashes, np.uint64(image_hash))
+            self.created = np.append(self.created, now)
+            self.coarse = np.vstack((self.coarse, coarse(cells)))
+            self.stats["stored"] += 1
+            if len(self.ids) > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        excess = len(self.ids) - self.max_entries + self.max_entries // 10
+        self.db.execute(
+            "DELETE FROM verdicts WHERE id IN "
+            "(SELECT id FROM verdicts ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self.db.commit()
+        self.stats["evicted"] += excess
+        self._load()
+
+    def info(self) -> dict:
+        return {**self.stats, "size": int(len(self.ids)), "max_distance": self.max_distance,
+                "detail_tolerance": self.detail_tolerance}
@@ -0,0 +1,134 @@
+"""
+Image preprocessing for the vision call.
+
+Phone screenshots arrive as multi-megabyte PNGs, far above the resolution
+Gemini actually looks at. Left alone, the SDK re-encodes them as lossless
+WebP at full size. prepare_image() normalises each upload once instead:
+  - uses the first frame of animated GIFs,
+  - applies the EXIF orientation,
+  - flattens transparency onto white,
+  - limits the longest side to max_side,
+  - re-encodes as JPEG or WebP.
+The result is a small blob that can be sent to Gemini as is. When the
+re-encoding comes out larger than the upload (a small JPEG, a PNG of flat
+text), the upload is sent as it is instead, as long as it is in a format
+Gemini accepts and needed no orientation, flattening or frame selection;
+Gemini bills an image the same whatever its size.
+
+Uploads are read from their spooled file objects, and the pixel count is
+checked from the header before anything is decoded, so a small file that
+expands to a huge bitmap (a decompression bomb) is refused up front.
+"""
+
+import io
+import threading
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+# Upload formats Gemini accepts as they are
+PASSTHROUGH_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+ORIENTATION = 0x0112  # EXIF tag
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+@dataclass
+class PreparedImage:
+    image: Image.Image  # decoded, oriented RGB image (used for hashing)
+    data: bytes  # re-encoded bytes sent to Gemini
+    mime_type: str
+    original_bytes: int
+
+    @property
+    def blob(self) -> dict:
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def prepare_image(source, max_side=1600, fmt="JPEG", quality=85, max_pixels=40_000_000) -> PreparedImage:
+    """`source` is the upload as bytes or as a seekable binary file; `fmt` is a MIME_TYPES key."""
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"Unsupported output format {fmt!r}; use one of {', '.join(MIME_TYPES)}")
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    original_bytes = source.seek(0, 2)
+    source.seek(0)
+
+    try:
+        image = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"Image is {width}x{height} pixels, above the {max_pixels} pixel limit.")
+    # JPEGs can be decoded at a reduced scale directly, which avoids holding
+    # the full-resolution bitmap at all.
+    image.draft("RGB", (max_side, max_side))
+    animated = getattr(image, "is_animated", False)
+    if animated:
+        image.seek(0)
+    # Only an upload that looks the same without our fixes may be sent as is.
+    passthrough = (image.format in PASSTHROUGH_TYPES and not animated and image.mode in ("RGB", "L")
+                   and image.getexif().get(ORIENTATION, 1) == 1)
+    mime_type = PASSTHROUGH_TYPES.get(image.format)
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode in ("RGBA", "LA", "P"):
+        rgba = image.convert("RGBA")
+        flattened = Image.new("RGB", rgba.size, (255, 255, 255))
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        image = flattened
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    if max(image.size) > max_side:
+        # reducing_gap lets Pillow shrink with a cheap box filter first, then
+        # finish with Lanczos, much faster on very large screenshots.
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    out = io.BytesIO()
+    if fmt == "WEBP":
+        image.save(out, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(out, format="JPEG", quality=quality, optimize=True)
+    if passthrough and out.tell() >= original_bytes:
+        source.seek(0)
+        return PreparedImage(image=image, data=source.read(), mime_type=mime_type, original_bytes=original_bytes)
+    return PreparedImage(image=image, data=out.getvalue(), mime_type=MIME_TYPES[fmt],
+                         original_bytes=original_bytes)
+
+
+class PreprocessStats:
+    """Running totals of how much preprocessing shrinks uploads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.images = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def record(self, prepared: PreparedImage) -> None:
+        with self.lock:
+            self.images += 1
+            self.bytes_in += prepared.original_bytes
+            self.bytes_out += len(prepared.data)
+
+    def info(self) -> dict:
+        saved = self.bytes_in - self.bytes_out
+        return {
+            "images": self.images,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": saved,
+            "avg_bytes_saved": saved // self.images if self.images else 0,
+            "saved_ratio": round(saved / self.bytes_in, 3) if self.bytes_in else 0.0,
+        }
@@ -0,0 +1,158 @@
+"""
+Retry, hedging and circuit breaking for the abuse-classification call.
+
+first_valid() runs at most `max_attempts` attempts. A second attempt starts
+only when:
+  - the first reply could not be parsed (InvalidOutput), or
+  - the first reply is still pending after `hedge_after` seconds (a hedge).
+The first valid result wins. Upstream errors are not retried; they go to the
+CircuitBreaker, which fails fast after repeated failures instead of queueing
+more doomed calls.
+"""
+
+import asyncio
+import threading
+import time
+
+
+class InvalidOutput(Exception):
+    """The model answered, but not with a valid verdict."""
+
+    def __init__(self, message, raw_text=""):
+        super().__init__(message)
+        self.raw_text = raw_text
+
+
+class CircuitOpen(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Upstream model is failing; circuit is open")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures and rejects
+    calls for `reset_timeout` seconds. After that, a single trial call is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def before_call(self) -> bool:
+        """Raises CircuitOpen while open; returns True if this call is the half-open trial."""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            raise CircuitOpen(max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    self.times_opened += 1
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+    async def call(self, fn, is_failure=lambda e: True):
+        """
+        Awaits fn() under the breaker. Exceptions for which is_failure() is
+        false (local rejections, cancellation) leave the failure count alone.
+        """
+        trial = self.before_call()
+        try:
+            result = await fn()
+        except BaseException as e:
+            if isinstance(e, Exception) and is_failure(e):
+                self.record_failure()
+            elif trial:
+                with self.lock:
+                    self.trial_in_flight = False
+            raise
+        self.record_success()
+        return result
+
+    def info(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "times_opened": self.times_opened,
+        }
+
+
+async def first_valid(make_attempt, hedge_after: float, max_attempts: int = 2, stats: dict = None,
+                      can_hedge=lambda: True):
+    """
+    Awaits make_attempt() and returns the first successful result.
+
+    make_attempt must return a new coroutine on every call. At most one hedge
+    is sent, and only if can_hedge() agrees when the deadline passes (so a
+    saturated service does not double its own load). Raises the last
+    InvalidOutput if every attempt produced unusable output, or the upstream
+    error if no attempt succeeded.
+    """
+    stats = stats if stats is not None else {}
+    hedging = bool(hedge_after)
+
+    def launch(kind):
+        stats[kind] = stats.get(kind, 0) + 1
+        return asyncio.ensure_future(make_attempt())
+
+    pending = {launch("attempts")}
+    launched = 1
+    last_error = None
+    try:
+        while pending:
+            timeout = hedge_after if hedging and launched < max_attempts else None
+            done, pending = await asyncio.wait(pending, timeout=timeout,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                # Latency deadline passed: race a second request.
+                hedging = False
+                if can_hedge():
+                    pending.add(launch("hedges"))
+                    launched += 1
+                else:
+                    stats["hedges_skipped"] = stats.get("hedges_skipped", 0) + 1
+                continue
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    return task.result()
+                last_error = error
+                if isinstance(error, InvalidOutput):
+                    stats["invalid_outputs"] = stats.get("invalid_outputs", 0) + 1
+                    if launched < max_attempts and not pending:
+                        pending.add(launch("retries"))
+                        launched += 1
+        raise last_error
+    finally:
+        # Whatever is still running lost the race.
+        for task in pending:
+            task.cancel()
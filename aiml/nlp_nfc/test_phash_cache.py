@@ -0,0 +1,78 @@
+import io
+
+from PIL import Image, ImageDraw, ImageFont
+
+from phash_cache import VerdictCache, dhash
+
+
+def chat_screenshot(lines, scale=1):
+    """Same bubble layout every time; only the words differ. scale=3 is phone-sized."""
+    image = Image.new("RGB", (360 * scale, 640 * scale), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=11 * scale)
+    for i, text in enumerate(lines):
+        top = (40 + i * 90) * scale
+        left = (20 if i % 2 else 120) * scale
+        draw.rounded_rectangle((left, top, left + 220 * scale, top + 60 * scale), radius=12 * scale,
+                               fill=(220, 248, 198))
+        draw.text((left + 12 * scale, top + 22 * scale), text, fill="black", font=font)
+    return image
+
+
+def forwarded(image, quality=70, scale=1.0):
+    """The image as a messenger passes it on: resized and re-encoded as JPEG."""
+    if scale != 1.0:
+        image = image.resize((int(image.width * scale), int(image.height * scale)), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+
+
+FRIENDLY = ["hey, are you coming?", "yes, see you at 6", "great, bring snacks", "sure thing"]
+HOSTILE = ["you better pay me now", "or you will regret it", "i know where you live", "last warning"]
+
+
+def test_same_layout_with_different_text_misses_the_cache(tmp_path):
+    cache = VerdictCache(path=str(tmp_path / "cache.db"))
+    friendly, hostile = chat_screenshot(FRIENDLY), chat_screenshot(HOSTILE)
+    # The perceptual hashes alone cannot tell the two apart
+    assert bin(dhash(friendly) ^ dhash(hostile)).count("1") <= cache.max_distance
+    cache.store(cache.image_key(friendly), {"is_abusive": False, "abuse_type": "None"})
+
+    assert cache.lookup(cache.image_key(hostile)) is None
+    assert cache.lookup(cache.image_key(friendly)) == {"is_abusive": False, "abuse_type": "None"}
+    assert cache.info()["rejected"] == 1
+
+
+def test_reencoded_and_resized_copies_hit(tmp_path):
+    cache = VerdictCache(path=str(tmp_path / "cache.db"))
+    original = chat_screenshot(FRIENDLY)
+    cache.store(cache.image_key(original), {"is_abusive": False})
+    assert cache.lookup(cache.image_key(forwarded(original, quality=60))) == {"is_abusive": False}
+
+    phone = chat_screenshot(HOSTILE, scale=3)
+    cache.store(cache.image_key(phone), {"is_abusive": True})
+    assert cache.lookup(cache.image_key(forwarded(phone, quality=80, scale=0.6))) == {"is_abusive": True}
+    # One changed digit in the same phone-sized layout is still a different screenshot
+    changed = chat_screenshot(HOSTILE[:3] + ["last warning 2"], scale=3)
+    assert cache.lookup(cache.image_key(forwarded(changed, quality=80))) is None
+
+
+def test_verdicts_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    image = chat_screenshot(FRIENDLY)
+    first = VerdictCache(path=path, algorithm="phash")
+    first.store(first.image_key(image), {"is_abusive": False})
+    second = VerdictCache(path=path, algorithm="phash")
+    assert second.lookup(second.image_key(image)) == {"is_abusive": False}
+    assert second.lookup(second.image_key(chat_screenshot(HOSTILE))) is None
+    assert second.info()["hits"] == 1
+
+
+def test_eviction_keeps_the_index_consistent(tmp_path):
+    cache = VerdictCache(path=str(tmp_path / "cache.db"), max_entries=10)
+    images = [chat_screenshot([f"message {i}"]) for i in range(15)]
+    for i, image in enumerate(images):
+        cache.store(cache.image_key(image), {"n": i})
+    assert len(cache.ids) == len(cache.hashes) == len(cache.created) <= 10
+    assert cache.lookup(cache.image_key(images[-1])) == {"n": 14}
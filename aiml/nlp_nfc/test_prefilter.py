@@ -0,0 +1,65 @@
+import asyncio
+import io
+import os
+
+from PIL import Image, ImageDraw
+
+from prefilter import ESCALATE, SAFE, Prefilter
+
+LEXICON = os.path.join(os.path.dirname(__file__), "abuse_lexicon.txt")
+CLEAN_TEXT = "see you at the team lunch on friday near the main office gate"
+
+
+def prefilter_reading(text, confidence=90.0):
+    """A Prefilter whose OCR step always reads `text`."""
+    prefilter = Prefilter(LEXICON)
+    prefilter.ocr_available = True
+    prefilter._ocr = lambda gray: (text, len(text.split()), confidence)
+    return prefilter
+
+
+def screenshot():
+    image = Image.new("RGB", (200, 100), "white")
+    ImageDraw.Draw(image).text((10, 40), "hello", fill="black")
+    return image
+
+
+def test_blank_image_is_safe_without_ocr():
+    prefilter = Prefilter(LEXICON)
+    prefilter.ocr_available = False
+    assert prefilter.prescreen(Image.new("RGB", (50, 50), "white")).decision == SAFE
+    assert prefilter.prescreen(screenshot()).reason == "ocr unavailable"
+
+
+def test_only_long_clearly_read_text_without_hits_is_safe():
+    assert prefilter_reading(CLEAN_TEXT).prescreen(screenshot()).decision == SAFE
+    assert prefilter_reading("see you friday").prescreen(screenshot()).reason == "too little text"
+    assert prefilter_reading(CLEAN_TEXT, confidence=40).prescreen(screenshot()).reason == "low ocr confidence"
+    result = prefilter_reading(CLEAN_TEXT + " or i will kill you").prescreen(screenshot())
+    assert result.decision == ESCALATE and result.hits
+
+
+def test_ocr_failure_escalates():
+    prefilter = prefilter_reading(CLEAN_TEXT)
+
+    def broken(gray):
+        raise RuntimeError("tesseract timed out")
+    prefilter._ocr = broken
+    assert prefilter.prescreen(screenshot()).decision == ESCALATE
+    assert prefilter.info()["ocr_errors"] == 1
+
+
+def test_prefilter_verdicts_are_not_cached(tmp_path, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "verdict_cache", main.VerdictCache(path=str(tmp_path / "cache.db")))
+    monkeypatch.setattr(main, "prefilter", prefilter_reading(CLEAN_TEXT))
+    monkeypatch.setattr(main, "PREFILTER_ENABLED", True)
+    buffer = io.BytesIO()
+    screenshot().save(buffer, "PNG")
+
+    first = asyncio.run(main.analyze_image(buffer.getvalue()))
+    second = asyncio.run(main.analyze_image(buffer.getvalue()))
+    assert first["prefiltered"] and second["prefiltered"]
+    assert "cached" not in second
+    assert main.verdict_cache.info()["size"] == 0
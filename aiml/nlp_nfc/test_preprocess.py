@@ -0,0 +1,56 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw
+
+from preprocess import prepare_image
+
+
+def encoded(image, fmt, **params):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **params)
+    return buffer.getvalue()
+
+
+def screenshot(size=(2400, 1200)):
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(0, size[1], 40):
+        draw.text((20, i), "message text " * 20, fill="black")
+    return image
+
+
+def test_large_upload_is_downscaled_and_reencoded():
+    data = encoded(screenshot(), "JPEG", quality=98)
+    prepared = prepare_image(data, max_side=1600)
+    assert max(prepared.image.size) == 1600
+    assert prepared.mime_type == "image/jpeg"
+    assert prepared.bytes_saved > 0
+
+
+def test_reencoding_never_grows_the_payload():
+    data = encoded(screenshot(), "PNG")
+    prepared = prepare_image(data, max_side=1600)
+    assert prepared.data == data and prepared.mime_type == "image/png"
+    assert max(prepared.image.size) == 1600  # hashing and OCR still use the downscaled image
+
+
+def test_upload_smaller_than_its_reencoding_is_sent_as_is():
+    data = encoded(Image.new("RGB", (300, 200), "white"), "PNG")
+    prepared = prepare_image(data, quality=95)
+    assert prepared.data == data and prepared.mime_type == "image/png"
+
+    # Transparency has to be flattened, so such an upload is always re-encoded
+    data = encoded(Image.new("RGBA", (300, 200), (0, 0, 0, 0)), "PNG")
+    assert prepare_image(data).mime_type == "image/jpeg"
+
+
+def test_transparency_is_flattened_onto_white():
+    image = Image.new("RGBA", (10, 10), (0, 0, 0, 0))
+    prepared = prepare_image(encoded(image, "PNG"))
+    assert prepared.image.getpixel((5, 5)) == (255, 255, 255)
+
+
+def test_unsupported_output_format_is_refused():
+    with pytest.raises(ValueError, match="PNG"):
+        prepare_image(encoded(screenshot((100, 100)), "PNG"), fmt="PNG")
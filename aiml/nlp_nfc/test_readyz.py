@@ -0,0 +1,48 @@
+import asyncio
+import json
+import time
+
+import main
+
+
+class SlowModel:
+    def __init__(self, delay):
+        self.delay = delay
+
+    def count_tokens(self, *args, **kwargs):
+        time.sleep(self.delay)
+        return {"total_tokens": 1}
+
+
+def test_readyz_answers_from_the_last_probe(monkeypatch):
+    monkeypatch.setattr(main, "get_model", lambda: SlowModel(0.5))
+    monkeypatch.setattr(main, "backend_status", {"reachable": False, "checked_at": 0.0, "error": "not checked yet"})
+    monkeypatch.setattr(main, "backend_probe", None)
+
+    async def run():
+        monkeypatch.setattr(main, "gemini_pool", main.GeminiPool(1, 1, 1, 5))
+        started = time.perf_counter()
+        first = await main.readyz()
+        assert time.perf_counter() - started < 0.1  # the slow probe runs in the background
+        assert first.status_code == 503
+        probe = main.backend_probe
+        await main.readyz()
+        assert main.backend_probe is probe  # one probe at a time
+        await probe
+        return await main.readyz()
+
+    second = asyncio.run(run())
+    assert second.status_code == 200 and json.loads(second.body)["ready"]
+
+
+def test_busy_pool_does_not_mark_the_backend_unreachable(monkeypatch):
+    monkeypatch.setattr(main, "backend_status", {"reachable": True, "checked_at": 0.0, "error": None})
+
+    async def run():
+        pool = main.GeminiPool(1, 0, 1, 5)
+        monkeypatch.setattr(main, "gemini_pool", pool)
+        await pool.acquire()  # the only slot is taken and nobody may queue
+        return await main.probe_backend()
+
+    assert asyncio.run(run()) is True
+    assert main.backend_status["checked_at"] > 0
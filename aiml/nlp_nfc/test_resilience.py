@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpen, InvalidOutput, first_valid
+
+
+def attempts(*behaviours):
+    """make_attempt() for first_valid: each call runs the next (delay, result) pair."""
+    queue = list(behaviours)
+
+    async def attempt():
+        delay, result = queue.pop(0)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return attempt
+
+
+def test_invalid_output_is_retried_once():
+    stats = {}
+    result = asyncio.run(first_valid(attempts((0, InvalidOutput("bad")), (0, "ok")), hedge_after=0, stats=stats))
+    assert result == "ok"
+    assert stats == {"attempts": 1, "invalid_outputs": 1, "retries": 1}
+
+
+def test_slow_reply_is_hedged_and_the_faster_one_wins():
+    stats = {}
+    result = asyncio.run(first_valid(attempts((1.0, "slow"), (0, "hedge")), hedge_after=0.05, stats=stats))
+    assert result == "hedge" and stats["hedges"] == 1
+
+
+def test_hedge_is_skipped_when_not_allowed():
+    stats = {}
+    result = asyncio.run(first_valid(attempts((0.1, "slow")), hedge_after=0.01, stats=stats,
+                                     can_hedge=lambda: False))
+    assert result == "slow" and stats["hedges_skipped"] == 1
+
+
+def test_upstream_errors_are_not_retried():
+    with pytest.raises(RuntimeError):
+        asyncio.run(first_valid(attempts((0, RuntimeError("503")), (0, "ok")), hedge_after=0))
+
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+
+    async def fail():
+        raise RuntimeError("upstream down")
+
+    async def succeed():
+        return "ok"
+
+    async def main():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await breaker.call(fail)
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpen):
+            await breaker.call(succeed)
+        time.sleep(0.06)
+        assert breaker.before_call() is True  # the half-open trial
+        with pytest.raises(CircuitOpen):
+            breaker.before_call()  # only one trial at a time
+        breaker.record_success()
+        assert await breaker.call(succeed) == "ok"
+
+    asyncio.run(main())
+    assert breaker.info() == {"state": "closed", "consecutive_failures": 0, "times_opened": 1}
+
+
+def test_local_rejections_do_not_count_as_failures():
+    breaker = CircuitBreaker(failure_threshold=1)
+
+    async def busy():
+        raise ValueError("queue full")
+
+    with pytest.raises(ValueError):
+        asyncio.run(breaker.call(busy, is_failure=lambda e: not isinstance(e, ValueError)))
+    assert breaker.state == "closed"
+
+
+class FailingModel:
+    def __init__(self, error):
+        self.error = error
+
+    def generate_content(self, *args, **kwargs):
+        raise self.error
+
+
+class Prepared:
+    blob = {"mime_type": "image/jpeg", "data": b""}
+
+
+def classify_failing(monkeypatch, error, calls):
+    """Runs main.classify_image `calls` times against a model that always raises `error`."""
+    import main
+
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    monkeypatch.setattr(main, "breaker", breaker)
+    monkeypatch.setattr(main, "get_model", lambda: FailingModel(error))
+    monkeypatch.setattr(main, "ABUSE_HEDGE_AFTER", 0)
+
+    async def run():
+        monkeypatch.setattr(main, "gemini_pool", main.GeminiPool(2, 2, 1, 5))
+        for _ in range(calls):
+            with pytest.raises(Exception):
+                await main.classify_image(Prepared())
+
+    asyncio.run(run())
+    return breaker
+
+
+def test_bad_requests_do_not_open_the_breaker(monkeypatch):
+    from google.api_core.exceptions import InvalidArgument
+
+    breaker = classify_failing(monkeypatch, InvalidArgument("Unable to process input image"), calls=5)
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_unavailable_upstream_opens_the_breaker(monkeypatch):
+    from google.api_core.exceptions import ServiceUnavailable
+
+    breaker = classify_failing(monkeypatch, ServiceUnavailable("overloaded"), calls=3)
+    assert breaker.state == "open"
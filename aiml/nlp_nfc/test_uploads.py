@@ -0,0 +1,43 @@
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.testclient import TestClient
+
+from uploads import BodySizeLimit
+
+ORIGIN = "http://localhost:3000"
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        return {"size": len(await request.body())}
+
+    # Same order as main.py: CORS outermost
+    app.add_middleware(BodySizeLimit, max_bytes=1000, path_limits={"/batch": 5000})
+    app.add_middleware(CORSMiddleware, allow_origins=[ORIGIN], allow_methods=["*"], allow_headers=["*"])
+    return app
+
+
+def test_small_body_passes():
+    response = TestClient(make_app()).post("/upload", content=b"x" * 500)
+    assert response.status_code == 200
+    assert response.json() == {"size": 500}
+
+
+def test_oversized_body_gets_413_with_cors_headers():
+    response = TestClient(make_app()).post("/upload", content=b"x" * 5000, headers={"Origin": ORIGIN})
+    assert response.status_code == 413
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+
+def test_chunked_body_is_cut_off():
+    def chunks():
+        for _ in range(10):
+            yield b"x" * 500
+
+    # The handler then sees a client disconnect; the 413 is what the client gets
+    client = TestClient(make_app(), raise_server_exceptions=False)
+    response = client.post("/upload", content=chunks())
+    assert response.status_code == 413
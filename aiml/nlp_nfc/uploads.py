@@ -0,0 +1,73 @@
+"""
+Upload size limits.
+
+Starlette already spools multipart file parts to a temporary file, but
+nothing limited how much a client may send. BodySizeLimit is an ASGI
+middleware that caps the request body per path:
+  - a declared Content-Length above the limit is rejected with 413 before
+    any of the body is read,
+  - chunked or mis-declared bodies are counted as they stream in and cut off
+    with 413 as soon as they cross the limit.
+Handlers then read the spooled parts through file objects rather than pulling
+whole uploads into memory.
+"""
+
+import orjson
+
+
+class BodySizeLimit:
+    def __init__(self, app, max_bytes: int, path_limits: dict = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    @staticmethod
+    async def reject(send, limit: int) -> None:
+        body = orjson.dumps({"error": f"Upload exceeds the {limit // (1024 * 1024)} MB limit."})
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = self.path_limits.get(scope["path"], self.max_bytes)
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            return await self.reject(send, limit)
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request" and not rejected:
+                received += len(message.get("body", b""))
+                if received > limit:
+                    rejected = True
+                    await self.reject(send, limit)
+                    # The app sees a disconnect and stops parsing the body.
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            # Whatever the app answers after the 413 has nowhere to go.
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+
+def upload_size(file) -> int:
+    """Size of a seekable upload without reading it."""
+    position = file.tell()
+    size = file.seek(0, 2)
+    file.seek(position)
+    return size
@@ -0,0 +1,351 @@
+# bench_report.py
+#
+# Offline micro-benchmarks for the legal report pipeline (ML/legal_report.py):
+# run_ocr, extract_sender, fake_nlp and report_to_pdf, and the whole pipeline
+# with the Gemini call stubbed out, so it shows where report latency goes
+# before the model is even asked. Inputs are synthetic: chat screenshots drawn
+# with PIL at several sizes and text densities, chat transcripts and report
+# texts of several lengths. Nothing touches the network.
+#
+#   python bench_report.py --json base.json
+#   python bench_report.py --json head.json --compare base.json --threshold 0.2
+#   python bench_report.py --only 'fake_nlp|report_to_pdf' --repeat 10
+#
+# Every case reports the min/median/mean time per call over --repeat samples
+# and the peak Python heap (tracemalloc, which includes NumPy buffers but not
+# Pillow's or ReportLab's C allocations) of one extra call. With --compare it
+# exits with status 1 when a case's median time or peak memory grew by more
+# than --threshold over the baseline file.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from PIL import Image, ImageDraw, ImageFont
+
+ML_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "ML"))
+
+CHAT_LINES = [
+    "you are useless, nobody wants you here",
+    "please stop messaging me",
+    "or what? I know where you live",
+    "meeting moved to 3pm, bring the quarterly numbers",
+    "send me a photo, no one will know",
+    "I will leak your photos if you complain to HR",
+    "ok",
+    "why are you ignoring me? I am watching you",
+    "thanks, see you tomorrow",
+    "you will regret this, I will ruin your career",
+    "stop harassing me or I will report this to the internal committee",
+    "lol",
+]
+SENDERS = ["Rahul", "Me", "Priya", "Vikram"]
+
+# name: (width, height)
+SCREEN_SIZES = {"small": (540, 960), "phone": (1080, 2340), "tablet": (1600, 2560)}
+# name: font size as a fraction of the screen width
+DENSITIES = {"sparse": 1 / 18, "dense": 1 / 40}
+# name: approximate pages of PDF output
+REPORT_LENGTHS = {"1page": 1, "5pages": 5, "25pages": 25}
+# name: chat lines
+TRANSCRIPT_LENGTHS = {"20lines": 20, "200lines": 200, "2000lines": 2000}
+
+
+def font(size: int):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has only the fixed bitmap font
+        return ImageFont.load_default()
+
+
+def screenshot(width: int, height: int, font_size: int, dark: bool = False, seed: int = 0) -> tuple:
+    """Draws a chat screen of alternating message bubbles; returns (png bytes, drawn text)."""
+    rng = random.Random(seed)
+    face = font(font_size)
+    background, bubble_in, bubble_out, ink = (
+        ("#101418", "#262d34", "#1f5c4a", "#e8e8e8") if dark else ("#ece5dd", "#ffffff", "#dcf8c6", "#111111")
+    )
+    img = Image.new("RGB", (width, height), background)
+    draw = ImageDraw.Draw(img)
+    pad, line_height = font_size // 2, int(font_size * 1.35)
+    chars_per_line = max(8, int(width * 0.7 / (font_size * 0.55)))
+    lines, y = [], pad * 2
+    while True:
+        sender = rng.choice(SENDERS)
+        message = f"{sender}: {rng.choice(CHAT_LINES)}"
+        wrapped = [message[i:i + chars_per_line] for i in range(0, len(message), chars_per_line)]
+        bubble_height = len(wrapped) * line_height + pad * 2
+        if y + bubble_height > height - pad * 2:
+            break
+        bubble_width = max(draw.textlength(part, font=face) for part in wrapped) + pad * 2
+        x = width - bubble_width - pad * 2 if sender == "Me" else pad * 2
+        draw.rounded_rectangle((x, y, x + bubble_width, y + bubble_height), radius=pad,
+                               fill=bubble_out if sender == "Me" else bubble_in)
+        for i, part in enumerate(wrapped):
+            draw.text((x + pad, y + pad + i * line_height), part, font=face, fill=ink)
+        lines.append(message)
+        y += bubble_height + pad
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue(), "\n".join(lines)
+
+
+def transcript(lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return "\n".join(f"{rng.choice(SENDERS)}: {rng.choice(CHAT_LINES)}" for _ in range(lines))
+
+
+def report_text(pages: int, seed: int = 0) -> str:
+    """A legal notice shaped like Gemini's output: headings, address block, numbered paragraphs."""
+    rng = random.Random(seed)
+    vocab = ("the respondent complainant notice section harassment message threatening evidence dated "
+             "pursuant hereby whereas accordingly unlawful conduct workplace committee repeatedly "
+             "intimidation screenshots annexed herewith client instructions").split()
+    out = ["LEGAL NOTICE", "", "To,", "Mr. Rahul Sharma,", "Flat 12, Green Park,", "New Delhi - 110016.", "",
+           "Sub: Legal notice for harassment and criminal intimidation", ""]
+    # About 12 paragraphs of ~100 words fill two pages
+    for i in range(pages * 6):
+        if i % 6 == 0:
+            out += [f"PART {i // 6 + 1}: FACTS AND GROUNDS", ""]
+        out.append(f"{i + 1}) " + " ".join(rng.choice(vocab) for _ in range(rng.randint(60, 140))) + ".")
+        if i % 4 == 3:
+            out += [f"   {letter}) " + " ".join(rng.choice(vocab) for _ in range(20)) + ";" for letter in "abc"]
+        out.append("")
+    out += ["Yours faithfully,", "", "Advocate for the Complainant"]
+    return "\n".join(out)
+
+
+class StubModel:
+    """Stands in for the Gemini model: returns a fixed report after `latency_ms`."""
+
+    def __init__(self, reply: str, latency_ms: float = 0.0):
+        self.text = reply
+        self.latency = latency_ms / 1000
+
+    def generate_content(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        return self
+
+
+def load_pipeline(workdir: str):
+    """Imports ML/legal_report.py offline, with an uncached in-process OCR engine."""
+    os.environ.pop("GEMINI_API_ENDPOINT", None)
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    os.environ["REPORT_JOB_DIR"] = workdir
+    sys.path.insert(0, ML_DIR)
+    with quiet():
+        import legal_report
+        legal_report.init_services()
+    return legal_report
+
+
+def fresh_ocr_engine(lr):
+    # Every call must really OCR (no cache), in this process so tracemalloc sees it
+    lr.ocr_engine = lr.OcrEngine(lr.ocr_engine.options, workers=0, cache_dir=None, memory_entries=0)
+    return lr.ocr_engine
+
+
+def tesseract_version():
+    import pytesseract
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return None
+
+
+@contextlib.contextmanager
+def quiet():
+    # Keeps the pipeline's occasional log lines (e.g. OCR failures) out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def measure(fn, repeat: int) -> dict:
+    """Times `fn` like timeit (batches of at least 0.2 s for fast calls) and records its peak heap."""
+    with quiet():
+        fn()  # warm-up: imports, width tables, lexicon
+        number, _ = timeit.Timer(fn).autorange()
+        samples = [t / number for t in timeit.Timer(fn).repeat(repeat=repeat, number=number)]
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "ms": {"min": ms(min(samples)), "median": ms(statistics.median(samples)), "mean": ms(statistics.mean(samples))},
+        "peak_kb": round(peak / 1024, 1),
+        "calls": number * repeat,
+    }
+
+
+def bench_pipeline(lr, png: bytes, drawn: str, report: str, args, ocr_available: bool) -> dict:
+    """One report end to end, timed per stage. Without Tesseract the drawn text stands in for OCR."""
+    path = os.path.join(args.workdir, "evidence-000")
+    with open(path, "wb") as f:
+        f.write(png)
+    template = lr.templates.get(lr.DEFAULT_TEMPLATE)
+    template = type(template)(template.name, template.title, template.path, template.mtime, template.text,
+                              model=StubModel(report, args.gemini_ms))
+    stages = {"ocr": [], "nlp": [], "gemini": [], "pdf": []}
+
+    def run():
+        started = time.perf_counter()
+        ocr_text = lr.evidence_text([path]) if ocr_available else drawn
+        stages["ocr"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        nlp = lr.fake_nlp(ocr_text)
+        stages["nlp"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        text = lr.ask_gemini(ocr_text, nlp, template)
+        stages["gemini"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        lr.report_to_pdf(text, os.path.join(args.workdir, "report.pdf"))
+        stages["pdf"].append(time.perf_counter() - started)
+
+    fresh_ocr_engine(lr)
+    result = measure(run, args.repeat)
+    result["stages_ms"] = {stage: round(statistics.median(times) * 1000, 3) for stage, times in stages.items()}
+    result["ocr_stubbed"] = not ocr_available
+    return result
+
+
+def run_benchmarks(args) -> dict:
+    lr = load_pipeline(args.workdir)
+    from ocr_engine import prepare_for_ocr
+
+    ocr_available = tesseract_version() is not None
+    only = re.compile(args.only) if args.only else None
+    cases = {}
+
+    def case(name, fn=None, result=None):
+        if only and not only.search(name):
+            return
+        print(f"  {name} ...", file=sys.stderr, flush=True)
+        cases[name] = result() if result else measure(fn, args.repeat)
+
+    shots = {}
+    for size, (width, height) in SCREEN_SIZES.items():
+        for density, fraction in DENSITIES.items():
+            shots[f"{size}-{density}"] = screenshot(width, height, max(10, int(width * fraction)))
+    shots["phone-dense-dark"] = screenshot(*SCREEN_SIZES["phone"], int(SCREEN_SIZES["phone"][0] * DENSITIES["dense"]),
+                                           dark=True)
+    transcripts = {name: transcript(lines) for name, lines in TRANSCRIPT_LENGTHS.items()}
+    reports = {name: report_text(pages) for name, pages in REPORT_LENGTHS.items()}
+
+    for name, (png, _) in shots.items():
+        # Decode and preparation only: the part of OCR that is ours, measurable without Tesseract
+        case(f"ocr_prepare/{name}",
+             lambda png=png: prepare_for_ocr(Image.open(io.BytesIO(png)), lr.ocr_engine.options))
+        if ocr_available:
+            def ocr_case(png=png):
+                engine = fresh_ocr_engine(lr)
+                result = measure(lambda: lr.run_ocr(io.BytesIO(png)), args.repeat)
+                result["stages_ms"] = engine.stats()["avg_ms"]
+                return result
+            case(f"run_ocr/{name}", result=ocr_case)
+    for name, text in transcripts.items():
+        case(f"extract_sender/{name}", lambda text=text: lr.extract_sender(text))
+        case(f"fake_nlp/{name}", lambda text=text: lr.fake_nlp(text))
+    for name, text in reports.items():
+        pdf_path = os.path.join(args.workdir, "report.pdf")
+        case(f"report_to_pdf/{name}", lambda text=text: lr.report_to_pdf(text, pdf_path))
+    for name in ("small-sparse", "phone-dense"):
+        png, drawn = shots[name]
+        case(f"pipeline/{name}",
+             result=lambda png=png, drawn=drawn: bench_pipeline(lr, png, drawn, reports["5pages"], args, ocr_available))
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "tesseract": tesseract_version(),
+            "repeat": args.repeat,
+            "gemini_stub_ms": args.gemini_ms,
+        },
+        "cases": cases,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ML_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result: dict, baseline: dict, threshold: float, min_delta_ms: float, min_delta_kb: float) -> list:
+    """Prints both runs side by side; returns the regressions beyond `threshold`."""
+    regressions = []
+    print(f"\n{'case':38s} {'base ms':>10s} {'ms':>10s} {'change':>8s} {'base KB':>9s} {'KB':>9s} {'change':>8s}")
+    for name, case in result["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            print(f"{name:38s} {'(new)':>10s} {case['ms']['median']:10.3f}")
+            continue
+        row = [f"{name:38s}"]
+        for metric, old, new, floor, unit in (
+            ("median time", base["ms"]["median"], case["ms"]["median"], min_delta_ms, "ms"),
+            ("peak memory", base["peak_kb"], case["peak_kb"], min_delta_kb, "KB"),
+        ):
+            change = (new - old) / old if old else 0.0
+            width = 10 if unit == "ms" else 9
+            row.append(f"{old:{width}.{3 if unit == 'ms' else 1}f} {new:{width}.{3 if unit == 'ms' else 1}f} {change:+8.1%}")
+            if change > threshold and new - old > floor:
+                regressions.append(f"{name}: {metric} {old}{unit} -> {new}{unit} ({change:+.1%})")
+        print(" ".join(row))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline micro-benchmarks for the legal report pipeline.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing samples per case")
+    parser.add_argument("--only", help="Regex: run only the cases whose name matches")
+    parser.add_argument("--gemini-ms", type=float, default=0, help="Latency of the stubbed Gemini call")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Baseline results (from --json) to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Fail if a median time or peak memory grew by more than this fraction")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="Ignore time regressions smaller than this, however large relatively")
+    parser.add_argument("--min-delta-kb", type=float, default=256,
+                        help="Ignore memory regressions smaller than this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_report_") as workdir:
+        args.workdir = workdir
+        result = run_benchmarks(args)
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold, args.min_delta_ms, args.min_delta_kb)
+        for regression in regressions:
+            print(f"FAIL: {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# fake_gemini.py
+#
+# Local stand-in for the Gemini REST API, used to load-test the chatbot, nlp
+# and legal report services without network access or quota. Start it, then
+# run a service with GEMINI_API_ENDPOINT pointing at it:
+#
+#   uvicorn fake_gemini:app --port 9000
+#   GEMINI_API_ENDPOINT=http://127.0.0.1:9000 uvicorn chatbot:app --port 8000
+#
+# Behaviour is configured through environment variables:
+#   FAKE_GEMINI_LATENCY     fixed:MS | uniform:LO,HI | lognormal:MEDIAN_MS,SIGMA
+#                           (default lognormal:800,0.5)
+#   FAKE_GEMINI_ERROR_RATE  fraction of calls answered with an error (default 0)
+#   FAKE_GEMINI_ERROR_CODE  HTTP status used for those errors (default 503)
+#   FAKE_GEMINI_CHUNKS      number of chunks per streamed answer (default 8)
+#   FAKE_GEMINI_INVALID_RATE  fraction of JSON-mode answers that come back
+#                           truncated, i.e. not valid JSON (default 0)
+#   FAKE_GEMINI_CANNED      optional JSON file of {"keyword": "reply text"};
+#                           the first keyword found in the prompt wins
+
+import asyncio
+import datetime
+import itertools
+import json
+import math
+import os
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CHAT_REPLY = (
+    "I'm really sorry you had to go through that, and it took courage to reach out. "
+    "What you describe may amount to sexual harassment under Section 2(n) of the POSH Act, 2013, "
+    "and could also fall under IPC 354A. You can file a written complaint with your Internal "
+    "Committee within three months of the incident (POSH Sec 9). Keep any messages, emails or "
+    "witness names as evidence. Would you like me to help you draft the complaint?"
+)
+
+ABUSE_REPLY = json.dumps({
+    "is_abusive": True,
+    "abuse_type": "Verbal Abuse",
+    "keywords": ["idiot", "useless"],
+    "analysis": "The screenshot contains insulting language directed at a colleague.",
+    "suggested_action": "Flag for review",
+})
+
+REPORT_REPLY = "\n".join(
+    ["LEGAL NOTICE", "", "To,", "The Respondent", ""]
+    + [f"{i}. That the facts of the matter are set out in the evidence annexed hereto." for i in range(1, 31)]
+    + ["", "Yours faithfully,", "Counsel for the Complainant"]
+)
+
+DEFAULT_CANNED = [
+    ("is_abusive", "```json\n" + ABUSE_REPLY + "\n```"),
+    ("legal notice", REPORT_REPLY),
+    ("summarize the conversation", "The user described an incident at work and asked about POSH remedies."),
+]
+
+
+def parse_latency(spec: str):
+    """Returns a function producing one latency sample in seconds."""
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0] / 1000
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1]) / 1000
+    if kind == "lognormal":
+        median_ms, sigma = values
+        return lambda: random.lognormvariate(math.log(median_ms), sigma) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def load_canned():
+    path = os.getenv("FAKE_GEMINI_CANNED")
+    if not path:
+        return DEFAULT_CANNED
+    with open(path, "r", encoding="utf-8") as f:
+        return list(json.load(f).items()) + DEFAULT_CANNED
+
+
+sample_latency = parse_latency(os.getenv("FAKE_GEMINI_LATENCY", "lognormal:800,0.5"))
+ERROR_RATE = float(os.getenv("FAKE_GEMINI_ERROR_RATE", "0"))
+ERROR_CODE = int(os.getenv("FAKE_GEMINI_ERROR_CODE", "503"))
+STREAM_CHUNKS = int(os.getenv("FAKE_GEMINI_CHUNKS", "8"))
+INVALID_RATE = float(os.getenv("FAKE_GEMINI_INVALID_RATE", "0"))
+CANNED = load_canned()
+
+# cachedContents/<id> -> (resource, token count)
+cached_contents = {}
+cache_ids = itertools.count(1)
+
+stats = {"calls": 0, "errors": 0, "invalid": 0, "in_flight": 0, "prompt_tokens": 0, "cached_tokens": 0, "started": time.time()}
+
+app = FastAPI()
+
+
+def prompt_text(body: dict) -> str:
+    texts = []
+    for content in body.get("contents", []):
+        for part in content.get("parts", []):
+            if "text" in part:
+                texts.append(part["text"])
+    return "\n".join(texts)
+
+
+def instruction_text(body: dict) -> str:
+    return "\n".join(part.get("text", "") for part in (body.get("systemInstruction") or {}).get("parts", []))
+
+
+def pick_reply(prompt: str) -> str:
+    lowered = prompt.lower()
+    for keyword, reply in CANNED:
+        if keyword.lower() in lowered:
+            return reply
+    return CHAT_REPLY
+
+
+def json_mode_reply(reply: str) -> str:
+    """With responseMimeType application/json, Gemini returns bare JSON."""
+    reply = reply.strip()
+    if reply.startswith("```"):
+        reply = reply.strip("`").removeprefix("json").strip()
+    if random.random() < INVALID_RATE:
+        stats["invalid"] += 1
+        return reply[: len(reply) // 2]
+    return reply
+
+
+def candidate(text: str, prompt_tokens: int, finished: bool = True, cached_tokens: int = 0) -> dict:
+    payload = {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "index": 0,
+        }],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": len(text) // 4,
+            "totalTokenCount": prompt_tokens + len(text) // 4,
+        },
+    }
+    if cached_tokens:
+        payload["usageMetadata"]["cachedContentTokenCount"] = cached_tokens
+    if finished:
+        payload["candidates"][0]["finishReason"] = "STOP"
+    return payload
+
+
+def error_response():
+    stats["errors"] += 1
+    status = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL"}.get(ERROR_CODE, "UNAVAILABLE")
+    return JSONResponse(
+        status_code=ERROR_CODE,
+        content={"error": {"code": ERROR_CODE, "message": "Injected fake error", "status": status}},
+    )
+
+
+@app.post("/{version}/models/{model_method}")
+async def models(version: str, model_method: str, request: Request):
+    _, _, method = model_method.partition(":")
+    body = await request.json()
+    prompt = prompt_text(body)
+    reply = pick_reply(prompt)
+    if (body.get("generationConfig") or {}).get("responseMimeType") == "application/json":
+        reply = json_mode_reply(reply)
+    prompt_tokens = (len(prompt) + len(instruction_text(body))) // 4 + 258 * sum(
+        1 for c in body.get("contents", []) for p in c.get("parts", []) if "inlineData" in p
+    )
+    cached_tokens = 0
+    if body.get("cachedContent"):
+        if body["cachedContent"] not in cached_contents:
+            return JSONResponse(status_code=404, content={"error": {
+                "code": 404, "message": "CachedContent not found", "status": "NOT_FOUND"}})
+        cached_tokens = cached_contents[body["cachedContent"]][1]
+        prompt_tokens += cached_tokens
+    stats["calls"] += 1
+
+    if method == "countTokens":
+        return {"totalTokens": prompt_tokens}
+
+    if random.random() < ERROR_RATE:
+        await asyncio.sleep(sample_latency() / 4)
+        return error_response()
+
+    latency = sample_latency()
+    if method == "generateContent":
+        stats["in_flight"] += 1
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            stats["in_flight"] -= 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["cached_tokens"] += cached_tokens
+        return candidate(reply, prompt_tokens, cached_tokens=cached_tokens)
+
+    if method == "streamGenerateContent":
+        size = max(1, math.ceil(len(reply) / STREAM_CHUNKS))
+        pieces = [reply[i:i + size] for i in range(0, len(reply), size)]
+
+        async def chunks():
+            # The SDK's REST transport reads a streamed JSON array.
+            stats["in_flight"] += 1
+            try:
+                # Time to first token is about a third of the full latency.
+                await asyncio.sleep(latency / 3)
+                yield "["
+                for i, piece in enumerate(pieces):
+                    if i:
+                        yield ",\n"
+                        await asyncio.sleep(latency * 2 / 3 / len(pieces))
+                    yield json.dumps(candidate(piece, prompt_tokens, finished=i == len(pieces) - 1))
+                yield "]"
+            finally:
+                stats["in_flight"] -= 1
+
+        return StreamingResponse(chunks(), media_type="application/json")
+
+    return JSONResponse(status_code=404, content={"error": {"code": 404, "message": f"Unsupported method {method}"}})
+
+
+@app.post("/{version}/cachedContents")
+async def create_cached_content(version: str, request: Request):
+    body = await request.json()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    ttl = float(body.get("ttl", "3600s").rstrip("s"))
+    name = f"cachedContents/fake{next(cache_ids)}"
+    tokens = (len(prompt_text(body)) + len(instruction_text(body))) // 4
+    resource = {
+        "name": name,
+        "model": body["model"],
+        "displayName": body.get("displayName", ""),
+        "createTime": now.isoformat(),
+        "updateTime": now.isoformat(),
+        "expireTime": (now + datetime.timedelta(seconds=ttl)).isoformat(),
+        "usageMetadata": {"totalTokenCount": tokens},
+    }
+    cached_contents[name] = (resource, tokens)
+    return resource
+
+
+@app.delete("/{version}/cachedContents/{cache_id}")
+async def delete_cached_content(version: str, cache_id: str):
+    cached_contents.pop(f"cachedContents/{cache_id}", None)
+    return {}
+
+
+@app.get("/stats")
+async def get_stats():
+    return {**stats, "uptime": round(time.time() - stats["started"], 1)}
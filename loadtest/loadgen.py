@@ -0,0 +1,189 @@
+# loadgen.py
+#
+# Open-loop load generator for the chatbot (/chat), nlp (/analyze-abuse/) and
+# legal report (/generate_report) services. Requests are fired at a fixed
+# target rate regardless of how fast responses come back, so queueing shows
+# up as latency instead of silently lowering the offered load.
+#
+#   python loadgen.py chat --url http://127.0.0.1:8000 --rps 20 --duration 30
+#   python loadgen.py analyze --url http://127.0.0.1:8001 --rps 5 --json out.json
+#   python loadgen.py report --url http://127.0.0.1:5000 --rps 2 --max-p95-ms 4000
+#
+# Exits with status 1 when --max-p95-ms / --max-error-rate are exceeded, so it
+# can guard capacity numbers in CI.
+
+import argparse
+import asyncio
+import io
+import json
+import random
+import sys
+import time
+
+import httpx
+from PIL import Image, ImageDraw
+
+CHAT_MESSAGES = [
+    "What is POSH Sec 9?",
+    "How do I file a complaint with the Internal Committee?",
+    "My manager keeps commenting on my appearance in meetings, what can I do?",
+    "A colleague sent me inappropriate messages late at night.",
+    "Can I complain anonymously under the POSH Act?",
+    "What happens after I submit a complaint?",
+]
+
+CHAT_LINES = [
+    "Rahul: you are useless, nobody wants you here",
+    "Me: please stop messaging me",
+    "Rahul: or what? I know where you live",
+    "Priya: meeting moved to 3pm",
+    "Rahul: send me a photo, no one will know",
+]
+
+
+def screenshot_png(lines: int = 12, width: int = 720) -> bytes:
+    """Draws a fake chat screenshot so the OCR / vision paths get real pixels."""
+    height = 40 + 36 * lines
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    for i in range(lines):
+        draw.text((20, 20 + 36 * i), random.choice(CHAT_LINES), fill="black")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class Scenario:
+    def __init__(self, name: str, unique: bool):
+        self.name = name
+        self.unique = unique
+        self.image = screenshot_png() if name in ("analyze", "report") else None
+
+    def request(self, client: httpx.AsyncClient, seq: int):
+        if self.name == "chat":
+            message = random.choice(CHAT_MESSAGES)
+            if self.unique:
+                # Defeat the chatbot's response cache unless asked not to.
+                message += f" (ref {seq})"
+            return client.post("/chat", json={"message": message})
+        if self.name == "analyze":
+            return client.post(
+                "/analyze-abuse/",
+                files={"file": (f"shot{seq}.png", self.image, "image/png")},
+            )
+        if self.name == "report":
+            return client.post(
+                "/generate_report",
+                files={"evidence": (f"shot{seq}.png", self.image, "image/png")},
+            )
+        raise ValueError(f"Unknown scenario: {self.name}")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def is_error(response: httpx.Response) -> bool:
+    if response.status_code >= 400:
+        return True
+    # The chatbot reports Gemini failures as {"error": ...} with status 200.
+    if response.headers.get("content-type", "").startswith("application/json"):
+        try:
+            return "error" in response.json()
+        except ValueError:
+            return True
+    return False
+
+
+async def run(args) -> dict:
+    scenario = Scenario(args.scenario, unique=not args.repeat)
+    latencies, errors, statuses = [], 0, {}
+    limits = httpx.Limits(max_connections=args.max_connections)
+    timeout = httpx.Timeout(args.timeout)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout) as client:
+        async def one(seq):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                response = await scenario.request(client, seq)
+                elapsed = time.perf_counter() - start
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                if is_error(response):
+                    errors += 1
+                else:
+                    latencies.append(elapsed)
+            except httpx.HTTPError as e:
+                errors += 1
+                statuses[type(e).__name__] = statuses.get(type(e).__name__, 0) + 1
+
+        total = int(args.rps * args.duration)
+        interval = 1 / args.rps
+        tasks = []
+        started = time.perf_counter()
+        for seq in range(total):
+            delay = started + seq * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(seq)))
+        await asyncio.gather(*tasks)
+        wall = time.perf_counter() - started
+
+    latencies.sort()
+    ms = lambda seconds: round(seconds * 1000, 1)
+    return {
+        "scenario": args.scenario,
+        "url": args.url,
+        "target_rps": args.rps,
+        "duration_s": args.duration,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "achieved_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "latency_ms": {
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(latencies[-1]) if latencies else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the NFC backend services.")
+    parser.add_argument("scenario", choices=["chat", "analyze", "report"])
+    parser.add_argument("--url", required=True, help="Base URL of the service under test")
+    parser.add_argument("--rps", type=float, default=10, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30, help="Test length in seconds")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--max-connections", type=int, default=500)
+    parser.add_argument("--repeat", action="store_true",
+                        help="Send identical chat messages (exercises the response cache)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="Fail if p95 latency is above this")
+    parser.add_argument("--max-error-rate", type=float, help="Fail if the error rate is above this")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(json.dumps(result, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    failed = False
+    if args.max_p95_ms is not None and result["latency_ms"]["p95"] > args.max_p95_ms:
+        print(f"FAIL: p95 {result['latency_ms']['p95']}ms > {args.max_p95_ms}ms", file=sys.stderr)
+        failed = True
+    if args.max_error_rate is not None and result["error_rate"] > args.max_error_rate:
+        print(f"FAIL: error rate {result['error_rate']} > {args.max_error_rate}", file=sys.stderr)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()